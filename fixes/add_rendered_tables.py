@@ -0,0 +1,73 @@
+import click
+import logging
+import os
+
+from celery import shared_task
+from flask import current_app
+from flask.cli import with_appcontext
+from invenio_db import db
+
+from hepdata.celery import dynamic_tasks
+from hepdata.cli import fix
+from hepdata.modules.records.utils.rendered_tables import find_rendered_table, generate_rendered_tables
+from hepdata.modules.records.utils.table_stats import get_table_stats_path
+from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.models import HEPSubmission, DataSubmission
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+@fix.command()
+@with_appcontext
+@click.option('--batch-size', '-b', type=int, default=20,
+              help='Number of hepsubmission entries to check at a time.')
+@click.option('--synchronous', '-s', type=bool, default=False)
+def add_rendered_tables(batch_size, synchronous=False):
+    """Write the render-ready JSON and statistics files of finished submissions which do not have them."""
+
+    all_ids = db.session.query(HEPSubmission.id).filter_by(overall_status='finished') \
+        .order_by(HEPSubmission.id).all()
+
+    count = 0
+    total = len(all_ids)
+    while count < total:
+        batch_ids = [i[0] for i in all_ids[count:min(count + batch_size, total)]]
+        if synchronous:
+            _add_rendered_tables_batch(batch_ids)
+        else:
+            log.info('Sending batch of IDs {0} to {1} to celery'.format(batch_ids[0], batch_ids[-1]))
+            dynamic_tasks.delay('_add_rendered_tables_batch', 'add_rendered_tables', batch_ids)
+        count += batch_size
+
+
+def _has_rendered_files(data_submission):
+    recid, data_file = data_submission.publication_recid, data_submission.data_file
+    return data_file is None or (find_rendered_table(recid, data_file) is not None
+                                 and os.path.isfile(get_table_stats_path(recid, data_file)))
+
+
+@shared_task
+def _add_rendered_tables_batch(ids):
+    log.info(f"Checking for rendered tables in submission ids {ids}")
+    for id in ids:
+        hepsubmission = HEPSubmission.query.get(id)
+        if not hepsubmission:
+            continue
+
+        data_submissions = DataSubmission.query.filter_by(publication_recid=hepsubmission.publication_recid,
+                                                          version=hepsubmission.version).all()
+        if all(_has_rendered_files(data_submission) for data_submission in data_submissions):
+            continue
+
+        # Reindex the latest finished submission so the index picks up the table statistics
+        latest_submission = get_latest_hepsubmission(publication_recid=hepsubmission.publication_recid,
+                                                     overall_status='finished')
+        reindex_submission_id = hepsubmission.id \
+            if latest_submission and latest_submission.version == hepsubmission.version else None
+
+        log.info(f"Writing rendered tables for record {hepsubmission.publication_recid} "
+                 f"version {hepsubmission.version}")
+        generate_rendered_tables(hepsubmission.publication_recid, hepsubmission.version,
+                                 reindex_submission_id=reindex_submission_id,
+                                 index=current_app.config['OPENSEARCH_INDEX'])
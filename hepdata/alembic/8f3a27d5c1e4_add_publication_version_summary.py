@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add publication_version_summary table."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8f3a27d5c1e4'
+down_revision = '4c1b6e2a9d05'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'publication_version_summary',
+        sa.Column('publication_recid', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('version_count', sa.Integer(), nullable=False),
+        sa.Column('finished_version_count', sa.Integer(), nullable=False),
+        sa.Column('sandbox_version_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('publication_recid', name=op.f('pk_publication_version_summary'))
+    )
+
+    # Existing publications are summarised here; later changes are kept up
+    # to date by hepdata.modules.submission.api.refresh_version_summaries
+    op.execute("""
+        INSERT INTO publication_version_summary
+            (publication_recid, version_count, finished_version_count, sandbox_version_count)
+        SELECT publication_recid,
+               count(*),
+               count(*) FILTER (WHERE overall_status = 'finished'),
+               count(*) FILTER (WHERE overall_status IN ('sandbox', 'sandbox_processing'))
+        FROM hepsubmission
+        WHERE publication_recid IS NOT NULL
+        GROUP BY publication_recid
+    """)
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('publication_version_summary')
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add access_statistic_total table."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7d91e4f2a63'
+down_revision = '8f3a27d5c1e4'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'access_statistic_total',
+        sa.Column('publication_recid', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('publication_recid', name=op.f('pk_access_statistic_total'))
+    )
+
+    # The totals of records accessed later are kept up to date by
+    # hepdata.modules.stats.views.write_access_counts
+    op.execute("""
+        INSERT INTO access_statistic_total (publication_recid, count)
+        SELECT publication_recid, coalesce(sum(count), 0)
+        FROM daily_access_statistic
+        WHERE publication_recid IS NOT NULL
+        GROUP BY publication_recid
+    """)
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('access_statistic_total')
@@ -32,8 +32,9 @@ from invenio_base.app import create_cli
 from hepdata.ext.opensearch.admin_view.api import AdminIndexer
 from hepdata.modules.converter.tasks import convert_and_store
 from hepdata.modules.records.utils.common import record_exists, get_record_by_id
+from hepdata.modules.stats.views import rebuild_access_totals
 from hepdata.modules.submission.models import HEPSubmission
-from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.api import get_latest_hepsubmission, rebuild_version_summaries
 from .factory import create_app
 from hepdata.config import CFG_PUB_TYPE, ANALYSES_ENDPOINTS
 from hepdata.ext.opensearch.api import reindex_all, get_records_matching_field
@@ -308,6 +309,14 @@ def execute(query):
         db.session.commit()
 
 
+@utils.command(name="rebuild-access-totals")
+@with_appcontext
+def rebuild_access_totals_cmd():
+    """Creates the missing access totals of records from their daily access statistics."""
+    count = rebuild_access_totals()
+    click.echo('Created access totals of {0} records'.format(count))
+
+
 @utils.command()
 def cleanup_old_files():
     """Deletes db entries and files that are no longer used"""
@@ -519,6 +528,14 @@ def write_stats_to_files():
     write_submissions_to_files()
 
 
+@submissions.command(name="rebuild-version-summaries")
+@with_appcontext
+def rebuild_version_summaries_cmd():
+    """Recalculates the version summary of every publication."""
+    count = rebuild_version_summaries()
+    click.echo('Rebuilt version summaries of {0} publications'.format(count))
+
+
 @cli.group()
 def inspire():
     """INSPIRE utils to update publication information."""
@@ -88,6 +88,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'invenio_accounts.tasks.delete_ips',
         'schedule': timedelta(days=7),
     },
+    'flush_access_statistics': {
+        'task': 'hepdata.modules.stats.views.flush_access_statistics',
+        'schedule': timedelta(minutes=5),
+    },
+    'rollup_access_statistics': {
+        'task': 'hepdata.modules.stats.views.rollup_access_statistics',
+        'schedule': crontab(minute=30, hour=2, day_of_month=1),  # monthly, if ACCESS_STATS_ROLLUP_MONTHS is set
+    },
 }
 
 # Number of workers running the datacite queue
@@ -117,6 +125,41 @@ CACHE_KEY_PREFIX = "cache::"
 CACHE_REDIS_URL = "redis://localhost:6379/0"
 CACHE_TYPE = "redis"
 
+# Parsed data table cache
+TABLE_CACHE_ENABLED = True
+TABLE_CACHE_REDIS_URL = CACHE_REDIS_URL  # Shared tier (set to None to use only the in-process tier)
+TABLE_CACHE_LOCAL_MAX_BYTES = 64 * (1024 * 1024)  # Size (bytes) budget of the in-process LRU tier per worker
+TABLE_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # Expiry (seconds) of entries in the shared tier
+TABLE_DECIMATION_MAX_POINTS = 5000  # Largest max_points accepted when decimating tables for plotting
+
+# Page context cache of finished records
+RECORD_PAGE_CACHE_ENABLED = True
+RECORD_PAGE_CACHE_REDIS_URL = CACHE_REDIS_URL  # Set to None to disable
+RECORD_PAGE_CACHE_TIMEOUT = 24 * 60 * 60  # Expiry (seconds) of cached record page contexts
+
+# Render-ready table JSON
+RENDERED_TABLE_ENCODINGS = ['br', 'gzip']  # Compressed copies to store ('br' needs the optional brotli package)
+
+# Search
+SEARCH_TABLES_INNER_HITS = False  # Fetch matching tables as inner hits of the publication search (one request)
+SEARCH_TABLES_INNER_HITS_SIZE = 100  # Maximum tables per publication (at most index.max_inner_result_window)
+SEARCH_CURSOR_KEEP_ALIVE = '5m'  # How long the point-in-time context of a search cursor is kept between pages
+AUTHOR_SUGGEST_DEBOUNCE_MS = 150  # Debounce delay suggested to clients of the author suggestions endpoint (None to omit)
+
+# Search result cache
+SEARCH_CACHE_ENABLED = True
+SEARCH_CACHE_REDIS_URL = CACHE_REDIS_URL  # Set to None to disable
+SEARCH_CACHE_TIMEOUT = 10 * 60  # Expiry (seconds) of cached search results
+SEARCH_GLOBAL_FACETS_ENABLED = True  # Store the facets of the whole index for searches with no query or filters
+
+# Record access statistics
+ACCESS_STATS_REDIS_URL = CACHE_REDIS_URL  # Buffer for accesses (set to None to write each access to the database)
+ACCESS_STATS_FLUSH_TIMEOUT = 10 * 60  # Expiry (seconds) of the lock held while flushing buffered accesses
+ACCESS_STATS_ROLLUP_MONTHS = None  # Whole months of daily statistics to keep before compacting to monthly rows
+
+# HTTP caching of record and table JSON
+HTTP_CACHE_FINISHED_MAX_AGE = 24 * 60 * 60  # Cache-Control max-age (seconds) for JSON of finished versions
+
 # Session
 ACCOUNTS_RETENTION_PERIOD = timedelta(days=7)
 ACCOUNTS_SESSION_REDIS_URL = CACHE_REDIS_URL
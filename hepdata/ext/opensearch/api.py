@@ -34,23 +34,28 @@ from .config.os_config import sort_fields_mapping, add_default_aggregations
 from .utils import calculate_sort_order, prepare_author_for_indexing
 from hepdata.config import CFG_PUB_TYPE, CFG_DATA_TYPE
 from .query_builder import QueryBuilder, HEPDataQueryParser
-from .process_results import map_result, merge_results
+from .process_results import map_result, merge_results, pop_inner_hits
+from .search_cache import bump_index_generation, cache_search, get_cached_search, get_global_facets, \
+    get_index_generation, make_search_cache_key, store_global_facets
 from invenio_db import db
 import logging
 
 from invenio_search import current_search_client as os, RecordsSearch
-from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.api import get_latest_hepsubmission, get_latest_hepsubmissions
 from hepdata.modules.submission.models import HEPSubmission, DataSubmission
-from hepdata.modules.search.config import OPENSEARCH_MAX_RESULT_WINDOW, LIMIT_MAX_RESULTS_PER_PAGE
+from hepdata.modules.search.config import OPENSEARCH_MAX_RESULT_WINDOW, LIMIT_MAX_RESULTS_PER_PAGE, \
+    ALL_IDS_BATCH_SIZE
 
 
 __all__ = ['search', 'index_record_ids', 'index_record_dict', 'fetch_record',
-           'recreate_index', 'get_record', 'reindex_all',
+           'recreate_index', 'get_record', 'get_publication_records', 'reindex_all',
            'get_n_latest_records']
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+TABLES_INNER_HITS = 'tables'
+
 
 def default_index(f):
     """ Loads the default index if none is given """
@@ -86,7 +91,9 @@ def search(query,
            offset=0,
            sort_field=None,
            sort_order='',
-           post_filter=None):
+           post_filter=None,
+           cursor=None,
+           facets=True):
     """ Perform a search query.
 
     :param query: [string] query string e.g. 'higgs boson'
@@ -102,15 +109,46 @@ def search(query,
     :param sort_order: [string] order of the sorting either original
                     (for a particular field) or reversed. Supported:
                     '' or 'rev'
-
-    :return: [dict] dictionary with processed results and facets
+    :param cursor: [dict] to page through the results with a point-in-time
+                    context instead of an offset: an empty dict for the
+                    first page, then the 'cursor' of the previous result
+    :param facets: [bool] whether to compute the facets (if False,
+                    'facets' is an empty list)
+
+    :return: [dict] dictionary with processed results and facets, plus the
+                    'cursor' of the next page (None on the last page) if
+                    a cursor was given
     """
     # If empty query then sort by date
     if query == '' and not sort_field:
         sort_field = 'date'
 
+    # Fetch the matching tables as inner hits of the publication search, rather than with a second search
+    tables_inner_hits = current_app.config.get('SEARCH_TABLES_INNER_HITS', False)
+
+    # Results are cached until the index next changes
+    cache_key = None
+    generation = get_index_generation(index) if cursor is None else None
+    if generation is not None:
+        cache_key = make_search_cache_key(index, generation, query, filters, sort_field, sort_order,
+                                          offset, size, include, exclude, post_filter,
+                                          tables_inner_hits=tables_inner_hits, facets=facets)
+        cached_result = get_cached_search(cache_key)
+        if cached_result is not None:
+            return cached_result
+
+    # The facets of searches with no query or filters are those of the whole index,
+    # which are stored after reindexing rather than aggregated for every search
+    global_facets = None
+    facets_generation = None
+    if facets and not query.strip() and not filters and not post_filter:
+        facets_generation, global_facets = get_global_facets(index)
+
     # Create search with preference param to ensure consistency of results across shards
-    search = RecordsSearch(using=os, index=index).with_preference_param()
+    # (unnecessary with a point-in-time context, which is consistent by definition)
+    search = RecordsSearch(using=os, index=index)
+    if cursor is None:
+        search = search.with_preference_param()
 
     # Determine if the query is range-based, and get it, or the default search order
     range_terms, exclude_tables, parsed_query = HEPDataQueryParser.parse_range_query(query)
@@ -119,13 +157,27 @@ def search(query,
     query = HEPDataQueryParser.parse_query(parsed_query)
     fuzzy_query = QueryString(query=query, fuzziness='AUTO')
 
+    main_query = Q('match_all')
     if query:
         if exclude_tables:
-            search.query = fuzzy_query
+            main_query = fuzzy_query
+            search.query = main_query
 
     if query and not exclude_tables:
-        search.query = fuzzy_query | \
-                       Q('has_child', type="child_datatable", query=fuzzy_query)
+        main_query = fuzzy_query | \
+                     Q('has_child', type="child_datatable", query=fuzzy_query)
+        search.query = main_query
+
+    tables_inner_hits = tables_inner_hits and not exclude_tables
+    if tables_inner_hits:
+        # An optional clause which does not affect the matching publications or their scores,
+        # but returns the tables of each publication which match the query
+        table_query = QueryString(query=query) if query else Q('match_all')
+        inner_tables = Q('has_child', type="child_datatable", query=table_query,
+                         score_mode='none', boost=0,
+                         inner_hits={'name': TABLES_INNER_HITS,
+                                     'size': current_app.config.get('SEARCH_TABLES_INNER_HITS_SIZE', 100)})
+        search.query = Q('bool', must=[main_query], should=[inner_tables])
 
     # Add filter to search for only "publication" objects
     search = search.filter("term", doc_type=CFG_PUB_TYPE)
@@ -142,20 +194,44 @@ def search(query,
     except ValueError as ve:
         return {'error': str(ve)}
 
-    search = search.sort({mapped_sort_field : {"order" : calculate_sort_order(sort_order, sort_field)}})
+    sort = [{mapped_sort_field : {"order" : calculate_sort_order(sort_order, sort_field)}}]
+    if cursor is not None and mapped_sort_field != 'recid':
+        # search_after needs a unique sort key
+        sort.append({'recid': {'order': 'asc'}})
+    search = search.sort(*sort)
 
-    search = add_default_aggregations(search, filters)
+    if facets and global_facets is None:
+        search = add_default_aggregations(search, filters)
 
     if post_filter:
         search = search.post_filter(post_filter)
 
     search = search.source(includes=include, excludes=exclude)
-    search = search[offset:offset+size]
+    if cursor is None:
+        search = search[offset:offset+size]
+    else:
+        search = search[0:size]
 
     try:
+        if cursor is not None:
+            # The point-in-time context replaces the index, and the next page
+            # starts after the sort values of the last hit of the previous page
+            pit_id = cursor.get('pit') or create_point_in_time(index)
+            search = search.index().extra(
+                pit={'id': pit_id, 'keep_alive': current_app.config.get('SEARCH_CURSOR_KEEP_ALIVE', '5m')})
+            if cursor.get('after'):
+                search = search.extra(search_after=cursor['after'])
+
         pub_result = search.execute().to_dict()
+        if global_facets is not None:
+            pub_result['aggregations'] = global_facets
+        elif facets and facets_generation is not None:
+            # The stored facets were missing or out of date, so store these ones
+            store_global_facets(index, facets_generation, pub_result['aggregations'])
         data_result = {}
-        if not exclude_tables:
+        if tables_inner_hits:
+            data_result = {'hits': {'hits': pop_inner_hits(pub_result, TABLES_INNER_HITS)}}
+        elif not exclude_tables:
             parent_filter = {
                 "terms": {
                             "_id": [hit["_id"] for hit in pub_result['hits']['hits']]
@@ -174,8 +250,25 @@ def search(query,
             data_search = data_search[0:data_search_size]
             data_result = data_search.execute().to_dict()
 
+        next_cursor = None
+        if cursor is not None:
+            pub_hits = pub_result['hits']['hits']
+            # The point-in-time id may change between requests
+            pit_id = pub_result.get('pit_id', pit_id)
+            if len(pub_hits) == size:
+                next_cursor = {'pit': pit_id, 'after': pub_hits[-1]['sort']}
+            else:
+                delete_point_in_time(pit_id)
+
         merged_results = merge_results(pub_result, data_result)
-        return map_result(merged_results, filters)
+        result = map_result(merged_results, filters)
+        if not facets:
+            result['facets'] = []
+        if cache_key:
+            cache_search(cache_key, result)
+        if cursor is not None:
+            result['cursor'] = next_cursor
+        return result
     except TransportError as e:
         # For search phase execution exceptions we pass the reason as it's
         # likely to be user error (e.g. invalid search query)
@@ -189,25 +282,81 @@ def search(query,
         return {'error': reason}
 
 
+def create_point_in_time(index):
+    """ Create a point-in-time context for paging through search results.
+
+    :param index: [string] name of the index
+    :return: [string] the point-in-time id
+    """
+    result = os.transport.perform_request(
+        'POST', '/{0}/_search/point_in_time'.format(index),
+        params={'keep_alive': current_app.config.get('SEARCH_CURSOR_KEEP_ALIVE', '5m')})
+    return result['pit_id']
+
+
+def delete_point_in_time(pit_id):
+    """ Delete a point-in-time context once it is no longer needed.
+
+    :param pit_id: [string] the point-in-time id
+    """
+    try:
+        os.transport.perform_request('DELETE', '/_search/point_in_time', body={'pit_id': [pit_id]})
+    except TransportError as e:
+        # It will expire anyway
+        log.warning('Unable to delete point in time: {0}'.format(e))
+
+
 @author_index
 def search_authors(name, size=20, author_index=None):
     """ Search for authors in the author index. """
     search = Search(using=os, index=author_index) \
-        .query("match", full_name={"query": name, "fuzziness":"AUTO"})
+        .query("match", full_name={"query": name, "fuzziness":"AUTO"}) \
+        .source(excludes=['name_suggest'])
     search = search[0:size]
     results = search.execute().to_dict()
     return [x['_source'] for x in results['hits']['hits']]
 
 
+@author_index
+def suggest_authors(prefix, size=10, author_index=None):
+    """ Suggest authors whose names start with a prefix, using the
+    completion suggester of the author index.
+
+    Falls back to search_authors if the author index was created
+    before the completion field was added to its mapping.
+
+    :param prefix: [string] start of the last or first name, e.g. 'bal'
+    :param size: [int] maximum number of authors to return
+    :param author_index: [string] name of the author index. If None a default is used
+    :return: [list] author dicts with 'full_name' and 'affiliation'
+    """
+    if not prefix.strip():
+        return []
+
+    search = Search(using=os, index=author_index) \
+        .suggest('authors', prefix, completion={'field': 'name_suggest', 'size': size,
+                                                'skip_duplicates': True}) \
+        .source(excludes=['name_suggest'])
+    search = search[0:0]
+    try:
+        results = search.execute().to_dict()
+    except TransportError as e:
+        log.warning('Unable to suggest authors, falling back to search: {0}'.format(e))
+        return search_authors(prefix, size=size, author_index=author_index)
+
+    return [option['_source'] for option in results['suggest']['authors'][0]['options']]
+
+
 @default_index
 @author_index
 def reindex_all(index=None, author_index=None, recreate=False, update_mapping=False, batch=5, start=-1, end=-1, synchronous=False):
     """ Recreate the index and add all the records from the db to OS. """
     if recreate:
         recreate_index(index=index)
-        recreate_index(index=author_index)
+        recreate_author_index(author_index=author_index)
     elif update_mapping:
         update_record_mapping(index=index)
+        update_author_mapping(author_index=author_index)
 
     # Get all finished HEPSubmission ids with max version numbers
     # by doing a left outer join of hepsubmission with itself
@@ -288,6 +437,28 @@ def reindex_batch(hepsubmission_record_ids, index):
     log.info('Finished indexing, now pushing data keywords\n######')
     push_data_keywords(pub_ids=indexed_publications)
 
+    update_global_facets.delay(index=index)
+
+
+@shared_task
+@default_index
+def update_global_facets(index=None):
+    """ Compute and store the facets of the whole index, as used for searches with no query or filters. """
+    facets_generation, global_facets = get_global_facets(index)
+    if facets_generation is None or global_facets is not None:
+        # Disabled, or already up to date
+        return
+
+    search = Search(using=os, index=index).filter("term", doc_type=CFG_PUB_TYPE)
+    search = add_default_aggregations(search)[0:0]
+    try:
+        aggregations = search.execute().to_dict()['aggregations']
+    except TransportError as e:
+        log.error('Unable to compute facets of index {0}: {1}'.format(index, e))
+        return
+
+    store_global_facets(index, facets_generation, aggregations)
+
 
 @default_index
 def get_record(record_id, index=None):
@@ -310,6 +481,28 @@ def get_record(record_id, index=None):
         return None
 
 
+@default_index
+def get_publication_records(record_ids, index=None):
+    """ Fetch several publication records from OS with a single multi-get request.
+
+    :param record_ids: [list of ints] publication record ids
+    :param index: [string] name of the index. If None a default is used
+
+    :return: [dict] Fetched records keyed by record id (missing records are omitted)
+    """
+    if not record_ids:
+        return {}
+
+    # Publications are routed by their own recid
+    docs = [{'_id': str(record_id), 'routing': str(record_id)} for record_id in set(record_ids)]
+    try:
+        result = os.mget(index=index, body={'docs': docs})
+    except TransportError:
+        return {}
+
+    return {int(doc['_id']): doc['_source'] for doc in result['docs'] if doc.get('found')}
+
+
 @default_index
 def get_records_matching_field(field, id, index=None, doc_type=None, source=None):
     """ Checks if a record with a given ID exists in the index """
@@ -356,6 +549,7 @@ def delete_item_from_index(id, index, doc_type, parent=None):
         os.delete(index=index, id=id, routing=parent)
     else:
         os.delete(index=index, id=id, routing=id)
+    bump_index_generation(index)
 
 
 @default_index
@@ -412,6 +606,9 @@ def push_data_keywords(pub_ids=None, index=None):
         except Exception as e:
             log.error(e)
 
+    # This also covers reindex_batch, which pushes the keywords after indexing
+    bump_index_generation(index)
+
 
 @default_index
 def index_record_ids(record_ids, index=None):
@@ -428,6 +625,11 @@ def index_record_ids(record_ids, index=None):
     existing_record_ids = [doc['recid'] for doc in docs]
     log.info('Indexing existing record IDs: {}'.format(existing_record_ids))
 
+    # Load the finished submissions used by the publication enhancers in one query
+    submissions = get_latest_hepsubmissions(
+        publication_recids=[doc['recid'] for doc in docs if 'related_publication' not in doc],
+        overall_status='finished')
+
     to_index = []
     indexed_result = {CFG_DATA_TYPE: [], CFG_PUB_TYPE: []}
 
@@ -460,7 +662,7 @@ def index_record_ids(record_ids, index=None):
             author_docs = prepare_author_for_indexing(doc)
             to_index += author_docs
 
-            enhance_publication_document(doc)
+            enhance_publication_document(doc, submissions.get(doc['recid']))
 
             op_dict = {
                 "index": {
@@ -481,6 +683,8 @@ def index_record_ids(record_ids, index=None):
         result = os.bulk(index=index, body=to_index, refresh=True)
         if result['errors']:
             log.error('Bulk insert failed: %s' % result)
+        # Some documents may have been written even if others failed
+        bump_index_generation(index)
 
     return indexed_result
 
@@ -498,16 +702,18 @@ def index_record_dict(record_dict, doc_type, recid, index=None, parent=None):
     :return: [dict] Response dictionary
     """
     if parent:
-        return os.index(index=index,
-                        doc_type=doc_type,
-                        id=recid,
-                        body=record_dict,
-                        parent=parent)
+        result = os.index(index=index,
+                          doc_type=doc_type,
+                          id=recid,
+                          body=record_dict,
+                          parent=parent)
     else:
-        return os.index(index=index,
-                        doc_type=doc_type,
-                        id=recid,
-                        body=record_dict)
+        result = os.index(index=index,
+                          doc_type=doc_type,
+                          id=recid,
+                          body=record_dict)
+    bump_index_generation(index)
+    return result
 
 
 @default_index
@@ -526,6 +732,25 @@ def recreate_index(index=None):
 
     os.indices.delete(index=index, ignore=404)
     os.indices.create(index=index, body=body)
+    bump_index_generation(index)
+
+
+@author_index
+def recreate_author_index(author_index=None):
+    """ Delete and then create the author index with the author mapping.
+
+    :param author_index: [string] name of the author index. If None a default is used
+    """
+    from .config.author_mapping import mapping
+
+    body = {
+        "mappings": {
+            "properties": mapping
+        }
+    }
+
+    os.indices.delete(index=author_index, ignore=404)
+    os.indices.create(index=author_index, body=body)
 
 
 @default_index
@@ -544,6 +769,24 @@ def update_record_mapping(index=None):
         raise ValueError(f"Unable to update record mapping: {msg}\nYou may need to recreate the index to update the mapping.")
 
 
+@author_index
+def update_author_mapping(author_index=None):
+    """ Updates the author mapping for the given author index. The authors
+    must then be reindexed (by reindexing their publications) to fill in
+    any new fields.
+
+    :param author_index: [string] name of the author index. If None a default is used
+    """
+    from .config.author_mapping import mapping
+
+    body = { "properties": mapping }
+    try:
+        os.indices.put_mapping(index=author_index, body=body)
+    except TransportError as e:
+        msg = e.info.get('error',{}).get('root_cause',[{}])[0].get('reason')
+        raise ValueError(f"Unable to update author mapping: {msg}\nYou may need to recreate the index to update the mapping.")
+
+
 @default_index
 def fetch_record(record_id, doc_type, index=None):
     """ Fetch a record from OS with a given id.
@@ -591,6 +834,24 @@ def get_all_ids(index=None, id_field='recid', last_updated=None, latest_first=Fa
     :param id_field: opensearch field to return. Should be 'recid' or 'inspire_id'
     :return: list of integer ids
     """
+    return list(iter_all_ids(index=index, id_field=id_field, last_updated=last_updated,
+                             latest_first=latest_first))
+
+
+def iter_all_ids(index=None, id_field='recid', last_updated=None, latest_first=False,
+                 batch_size=ALL_IDS_BATCH_SIZE):
+    """Iterate over all record or inspire ids of publications in the search
+    index, fetching them in batches with a scroll.
+
+    The id_field is checked straight away, before iteration starts.
+
+    :param index: name of index to use.
+    :param id_field: opensearch field to return. Should be 'recid' or 'inspire_id'
+    :param last_updated: only return ids of publications updated since this datetime
+    :param latest_first: order by last_updated (most recent first) rather than by recid
+    :param batch_size: number of hits to fetch per scroll request
+    :return: iterator of integer ids
+    """
     if id_field not in ('recid', 'inspire_id'):
         raise ValueError('Invalid ID field %s' % id_field)
 
@@ -606,6 +867,6 @@ def get_all_ids(index=None, id_field='recid', last_updated=None, latest_first=Fa
     else:
         search = search.sort('recid')
 
-    search = search.params(preserve_order=True)
+    search = search.params(preserve_order=True, size=batch_size)
 
-    return [int(h[id_field]) for h in search.scan()]
+    return (int(h[id_field]) for h in search.scan())
@@ -214,6 +214,63 @@ mapping = {
     "data_abstract": {
       "type": "text"
     },
+    "table_stats": {
+      "properties": {
+        "row_count": {
+          "type": "integer"
+        },
+        "independent_variables": {
+          "properties": {
+            "name": {
+              "type": "text"
+            },
+            "units": {
+              "type": "keyword"
+            },
+            "min": {
+              "type": "double"
+            },
+            "max": {
+              "type": "double"
+            },
+            "nan_count": {
+              "type": "integer"
+            },
+            "inf_count": {
+              "type": "integer"
+            },
+            "binned": {
+              "type": "boolean"
+            },
+            "contiguous": {
+              "type": "boolean"
+            }
+          }
+        },
+        "dependent_variables": {
+          "properties": {
+            "name": {
+              "type": "text"
+            },
+            "units": {
+              "type": "keyword"
+            },
+            "min": {
+              "type": "double"
+            },
+            "max": {
+              "type": "double"
+            },
+            "nan_count": {
+              "type": "integer"
+            },
+            "inf_count": {
+              "type": "integer"
+            }
+          }
+        }
+      }
+    },
     "parent_child_join": {
         "type": "join",
         "relations": {
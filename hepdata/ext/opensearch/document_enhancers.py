@@ -93,14 +93,16 @@ def add_shortened_authors(doc):
         doc["first_author"] = doc["authors"][0]
 
 
-def add_analyses(doc):
+def add_analyses(doc, submission=None):
     """
     Add analyses links to tools such as Rivet, MadAnalysis 5, etc. to the index.
 
     :param doc:
+    :param submission: the latest finished HEPSubmission, if already loaded
     :return:
     """
-    latest_submission = get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
+    latest_submission = submission or get_latest_hepsubmission(publication_recid=doc['recid'],
+                                                                overall_status='finished')
 
     if latest_submission:
         doc["analyses"] = []
@@ -134,15 +136,16 @@ def add_data_keywords(doc):
     doc['data_keywords'] = dict(agg_keywords)
 
 
-def add_data_abstract(doc):
+def add_data_abstract(doc, submission=None):
     """
     Adds the data abstract from its associated HEPSubmission to the document object
 
     :param doc: The document object
+    :param submission: the latest finished HEPSubmission, if already loaded
     :return:
     """
 
-    submission = get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
+    submission = submission or get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
     doc['data_abstract'] = submission.data_abstract
 
 
@@ -159,16 +162,40 @@ def add_data_resources(doc):
     doc['resources'] = get_resource_data(submission)
 
 
-def add_submission_resources(doc):
+def add_data_stats(doc):
+    """
+    Adds the summary statistics of the table (numbers of rows, value ranges,
+    etc.) to the document object, if they have been written to disk. They are
+    not computed here, so that indexing never has to parse the data files.
+
+    :param doc: The document object
+    :return:
+    """
+    from hepdata.modules.records.utils.table_stats import read_table_stats
+
+    submission = DataSubmission.query.filter_by(associated_recid=doc['recid']) \
+        .order_by(DataSubmission.id.desc()).first()
+    if submission:
+        try:
+            stats = read_table_stats(submission)
+        except Exception as e:
+            log.error('Unable to read statistics for data record {0}: {1}'.format(doc['recid'], e))
+            return
+        if stats:
+            doc['table_stats'] = stats
+
+
+def add_submission_resources(doc, submission=None):
     """
     Triggers resource data generation of a HEPSubmission object.
     Gets the HEPSubmission object, then passes it off for data retrival.
 
     :param doc: The document object
+    :param submission: the latest finished HEPSubmission, if already loaded
     :return:
     """
 
-    submission = get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
+    submission = submission or get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
     doc['resources'] = get_resource_data(submission)
 
 
@@ -228,15 +255,26 @@ def enhance_data_document(doc):
     add_parent_publication(doc)
     add_data_keywords(doc)
     add_data_resources(doc)
+    add_data_stats(doc)
+
+
+def enhance_publication_document(doc, submission=None):
+    """
+    Adds the derived fields of a publication document.
 
+    :param doc: The document object
+    :param submission: the latest finished HEPSubmission of the publication,
+        if already loaded (e.g. by get_latest_hepsubmissions for a batch)
+    """
+    if submission is None:
+        submission = get_latest_hepsubmission(publication_recid=doc['recid'], overall_status='finished')
 
-def enhance_publication_document(doc):
     add_id(doc)
     add_doc_type(doc, CFG_PUB_TYPE)
     add_data_submission_urls(doc)
-    add_data_abstract(doc)
+    add_data_abstract(doc, submission)
     add_shortened_authors(doc)
     process_last_updates(doc)
-    add_analyses(doc)
+    add_analyses(doc, submission)
     add_parent_child_info(doc)
-    add_submission_resources(doc)
+    add_submission_resources(doc, submission)
@@ -21,9 +21,10 @@
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
+from collections import defaultdict
 
 from .aggregations import parse_aggregations
-from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
+from hepdata.config import CFG_DATA_TYPE
 from hepdata.utils.miscellaneous import splitter
 
 
@@ -52,6 +53,22 @@ def merge_results(pub_result, data_result=None):
     return merge_dict
 
 
+def pop_inner_hits(result, name):
+    """
+    Removes the inner hits of a given name from each hit of a search result.
+
+    :param result: search result dictionary
+    :param name: name of the inner hits
+    :return: list of all the inner hits
+    """
+    inner_hits = []
+    for hit in result['hits']['hits']:
+        named_hits = hit.pop('inner_hits', {}).get(name)
+        if named_hits:
+            inner_hits += named_hits['hits']['hits']
+    return inner_hits
+
+
 def map_result(es_result, query_filters=None):
     hits = es_result['hits']
     total_hits = es_result['total']
@@ -78,24 +95,27 @@ def map_result(es_result, query_filters=None):
             'total': total_hits}
 
 
+def get_table_number(table):
+    """ Get the table number from the DOI of a table hit. """
+    try:
+        table_num = int(table['_source']['doi'].split('/')[-1].lstrip('t'))
+    except (ValueError, AttributeError):  # this shouldn't happen
+        table_num = 0
+    return table_num
+
+
 def match_tables_to_papers(tables, papers):
+    # Group the tables by publication in a single pass
+    tables_by_paper = defaultdict(list)
+    for table in tables:
+        tables_by_paper[table['_source']['related_publication']].append(table)
+
     aggregated = []
     for paper in papers:
-        paper_id = int(paper['_id'])
-        relevant_tables = [t for t in tables
-                           if t['_source']['related_publication'] == paper_id]
-
-        # Create a function to extract table numbers from their DOIs.
-        def sort_key(elem):
-            """ Get the table number from the DOI. """
-            try:
-                table_num = int(elem['_source']['doi'].split('/')[-1].lstrip('t'))
-            except (ValueError, AttributeError):  # this shouldn't happen
-                table_num = 0
-            return table_num
+        relevant_tables = tables_by_paper.get(int(paper['_id']), [])
 
         # Sort the tables into the order they appear in the record.
-        relevant_tables.sort(key=sort_key)
+        relevant_tables.sort(key=get_table_number)
 
         aggregated.append((paper, relevant_tables))
 
@@ -127,15 +147,30 @@ def get_basic_record_information(record):
 
 
 def fetch_remaining_papers(tables, papers):
-    from hepdata.ext.opensearch.api import fetch_record
-    hit_papers = list(map(lambda x: int(x['_id']), papers))
+    """
+    Adds the parent publications of table hits which are not already in
+    the publication hits, fetched with a single multi-get request.
+    Publications which cannot be found are skipped.
+
+    :param tables: list of data table hits
+    :param papers: list of publication hits, which is extended in place
+    """
+    from hepdata.ext.opensearch.api import get_publication_records
+    hit_papers = set(int(paper['_id']) for paper in papers)
+
+    # Keep the order in which the tables refer to the missing papers
+    missing_papers = []
     for table in tables:
         paper_id = table['_source'].get('related_publication')
         if paper_id and paper_id not in hit_papers:
-            paper_source = fetch_record(paper_id, CFG_PUB_TYPE)
-            paper = {'_id': str(paper_id), '_source': paper_source}
-            papers.append(paper)
-            hit_papers.append(paper_id)
+            missing_papers.append(paper_id)
+            hit_papers.add(paper_id)
+
+    if missing_papers:
+        paper_sources = get_publication_records(missing_papers)
+        for paper_id in missing_papers:
+            if paper_id in paper_sources:
+                papers.append({'_id': str(paper_id), '_source': paper_sources[paper_id]})
 
 
 def is_datatable(es_hit):
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Cache of search results, invalidated by an index generation counter.
+
+Results of :func:`~hepdata.ext.opensearch.api.search` are stored in Redis
+(using ``SEARCH_CACHE_REDIS_URL``) under a hash of the normalised search
+parameters and the current generation of the index. The generation is a
+counter per index which is incremented whenever documents are written to or
+deleted from the index, so entries for older generations are never read again
+and simply expire after ``SEARCH_CACHE_TIMEOUT`` seconds.
+
+The facet aggregations of the whole index, used for searches with no query or
+filters, are also stored (if ``SEARCH_GLOBAL_FACETS_ENABLED``) along with the
+generation they were computed for, and are only used while it is current.
+"""
+
+import hashlib
+import json
+import logging
+
+import redis
+from flask import current_app
+
+from hepdata.utils.redis_client import get_redis_client
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+def search_cache_enabled():
+    return current_app.config.get('SEARCH_CACHE_ENABLED', False)
+
+
+def _get_client():
+    if not search_cache_enabled():
+        return None
+    return get_redis_client('SEARCH_CACHE_REDIS_URL')
+
+
+def _generation_key(index):
+    return '{0}search_generation::{1}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''), index)
+
+
+def get_index_generation(index):
+    """
+    Returns the current generation of an index.
+
+    :param index: name of the index
+    :return: generation number, or None if it cannot be read
+    """
+    client = _get_client()
+    if client is None:
+        return None
+
+    return _read_generation(client, index)
+
+
+def _read_generation(client, index):
+    try:
+        generation = client.get(_generation_key(index))
+    except redis.RedisError as e:
+        log.warning('Unable to read generation of index {0}: {1}'.format(index, e))
+        return None
+
+    return int(generation) if generation is not None else 0
+
+
+def bump_index_generation(index):
+    """
+    Increments the generation of an index, so that cached search results
+    from before a change to the index are no longer used.
+
+    :param index: name of the index
+    """
+    client = get_redis_client('SEARCH_CACHE_REDIS_URL')
+    if client is None:
+        return
+
+    try:
+        client.incr(_generation_key(index))
+    except redis.RedisError as e:
+        log.error('Unable to increment generation of index {0}: {1}'.format(index, e))
+
+
+def make_search_cache_key(index, generation, query, filters, sort_field, sort_order, offset, size,
+                          include, exclude, post_filter=None, tables_inner_hits=False, facets=True):
+    """
+    Generates the cache key of a search from its normalised parameters.
+
+    :param tables_inner_hits: whether the tables are fetched as inner hits
+        (which may give slightly different results)
+    :param facets: whether the facets are computed
+    :return: key string
+    """
+    params = {
+        # Extra whitespace does not change the results of a query string query
+        'query': ' '.join(query.split()),
+        'filters': [list(f) for f in filters],
+        'sort_field': sort_field or '',
+        'sort_order': sort_order or '',
+        'offset': offset,
+        'size': size,
+        'include': include,
+        'exclude': exclude,
+        'post_filter': post_filter,
+        'tables_inner_hits': tables_inner_hits,
+        'facets': facets
+    }
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return '{0}search::{1}::{2}::{3}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''),
+                                             index, generation, digest)
+
+
+def get_cached_search(key):
+    """
+    Looks up a cached search result.
+
+    :param key: key from make_search_cache_key
+    :return: the search result dict, or None on a miss
+    """
+    client = _get_client()
+    if client is None:
+        return None
+
+    try:
+        value = client.get(key)
+    except redis.RedisError as e:
+        log.warning('Unable to read search results from cache: {0}'.format(e))
+        return None
+
+    return json.loads(value) if value is not None else None
+
+
+def cache_search(key, result):
+    """
+    Stores a search result.
+
+    :param key: key from make_search_cache_key
+    :param result: the search result dict
+    """
+    client = _get_client()
+    if client is None:
+        return
+
+    try:
+        value = json.dumps(result, separators=(',', ':'))
+    except (TypeError, ValueError) as e:
+        log.warning('Unable to serialise search results: {0}'.format(e))
+        return
+
+    try:
+        client.set(key, value, ex=current_app.config.get('SEARCH_CACHE_TIMEOUT'))
+    except redis.RedisError as e:
+        log.warning('Unable to write search results to cache: {0}'.format(e))
+
+
+def global_facets_enabled():
+    return current_app.config.get('SEARCH_GLOBAL_FACETS_ENABLED', False)
+
+
+def _global_facets_key(index):
+    return '{0}search_facets::{1}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''), index)
+
+
+def get_global_facets(index):
+    """
+    Looks up the stored facet aggregations of the whole index.
+
+    :param index: name of the index
+    :return: tuple of the current generation of the index (None if it cannot
+        be read) and the aggregations (None if they are missing or were
+        computed for an older generation)
+    """
+    client = get_redis_client('SEARCH_CACHE_REDIS_URL') if global_facets_enabled() else None
+    if client is None:
+        return None, None
+
+    generation = _read_generation(client, index)
+    if generation is None:
+        return None, None
+
+    try:
+        value = client.get(_global_facets_key(index))
+    except redis.RedisError as e:
+        log.warning('Unable to read facets of index {0}: {1}'.format(index, e))
+        return generation, None
+
+    if value is not None:
+        stored = json.loads(value)
+        if stored['generation'] == generation:
+            return generation, stored['aggregations']
+
+    return generation, None
+
+
+def store_global_facets(index, generation, aggregations):
+    """
+    Stores the facet aggregations of the whole index.
+
+    :param index: name of the index
+    :param generation: generation of the index the aggregations were computed for
+    :param aggregations: aggregations dict from the search response
+    """
+    client = get_redis_client('SEARCH_CACHE_REDIS_URL') if global_facets_enabled() else None
+    if client is None:
+        return
+
+    value = json.dumps({'generation': generation, 'aggregations': aggregations}, separators=(',', ':'))
+    try:
+        client.set(_global_facets_key(index), value)
+    except redis.RedisError as e:
+        log.warning('Unable to write facets of index {0}: {1}'.format(index, e))
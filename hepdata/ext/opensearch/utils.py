@@ -54,7 +54,8 @@ def prepare_author_for_indexing(document):
 
     if authors is not None:
         for author in authors:
-            data_dict = author
+            data_dict = dict(author)
+            data_dict['name_suggest'] = {'input': get_author_suggest_inputs(author['full_name'])}
 
             op_dict = {
                 "index": {
@@ -68,6 +69,17 @@ def prepare_author_for_indexing(document):
     return author_data
 
 
+def get_author_suggest_inputs(full_name):
+    """ Get the completion suggester inputs for an author name, so that
+    e.g. 'Balz, Johannes' is suggested for both 'bal' and 'joh'. """
+    inputs = [full_name]
+    if ',' in full_name:
+        last_name, first_name = [part.strip() for part in full_name.split(',', 1)]
+        if first_name and last_name:
+            inputs.append(first_name + ' ' + last_name)
+    return inputs
+
+
 def calculate_sort_order(is_reversed, sorting_field):
     """ Take the default sort order for a given field and an information
      whether to flip it and compute the final sorting order. """
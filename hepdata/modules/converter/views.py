@@ -33,7 +33,7 @@ from hepdata.config import CFG_CONVERTER_URL, CFG_SUPPORTED_FORMATS, CFG_CONVERT
 from hepdata_converter_ws_client import convert, Error
 from hepdata.modules.permissions.api import user_allowed_to_perform_action, verify_observer_key
 from hepdata.modules.converter import convert_zip_archive
-from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.api import get_latest_hepsubmission, get_version_counts
 from hepdata.modules.submission.models import HEPSubmission, DataResource, DataSubmission
 from hepdata.utils.file_extractor import extract, get_file_in_directory
 from hepdata.modules.records.utils.common import get_record_contents, \
@@ -43,7 +43,7 @@ from hepdata.modules.records.utils.data_files import get_converted_directory_pat
 
 
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy import func, or_
+from sqlalchemy import func
 
 from dateutil.parser import parse
 
@@ -593,12 +593,7 @@ def get_version_count(recid, key_verified=False):
     :return: version_count, version_count_all
     """
     # Count number of all versions and number of finished versions of a publication record.
-    version_count_all = HEPSubmission.query.filter_by(publication_recid=recid).count()
-    version_count_finished = HEPSubmission.query.filter_by(publication_recid=recid, overall_status='finished').count()
-    version_count_sandbox = HEPSubmission.query.filter(
-        HEPSubmission.publication_recid == recid,
-        or_(HEPSubmission.overall_status == 'sandbox', HEPSubmission.overall_status == 'sandbox_processing')
-    ).count()
+    version_count_all, version_count_finished, version_count_sandbox = get_version_counts(recid)
 
     if version_count_sandbox:
         # For a Sandbox record, there is only one version, which is accessible by everyone.
@@ -23,6 +23,7 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 """API for HEPData-Records."""
+import json
 import os
 from collections import OrderedDict
 from functools import wraps
@@ -34,7 +35,8 @@ from flask import redirect, request, render_template, jsonify, current_app, Resp
 from flask_login import current_user
 from invenio_accounts.models import User
 from invenio_db import db
-from sqlalchemy import and_, func, select
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.utils import secure_filename
 from tarfile import TarError
@@ -46,25 +48,34 @@ from hepdata.modules.permissions.api import user_allowed_to_perform_action, veri
 from hepdata.modules.permissions.models import SubmissionParticipant
 from hepdata.modules.records.subscribers.api import is_current_user_subscribed_to_record
 from hepdata.modules.records.utils.common import decode_string, find_file_in_directory, allowed_file, \
-    remove_file_extension, truncate_string, get_record_contents, get_record_by_id, IMAGE_TYPES
+    remove_file_extension, truncate_string, get_record_contents, get_record_by_id, get_publication_records_contents, \
+    IMAGE_TYPES
 from hepdata.modules.records.utils.data_processing_utils import process_ctx
 from hepdata.modules.records.utils.data_files import get_data_path_for_record, cleanup_old_files
+from hepdata.modules.records.utils.http_cache import get_finished_max_age, is_not_modified, make_etag, \
+    not_modified_response, set_cache_headers
 from hepdata.modules.records.utils.json_ld import get_json_ld
+from hepdata.modules.records.utils.page_cache import cache_record_context, get_cached_record_context, \
+    get_submission_stamp
 from hepdata.modules.records.utils.submission import process_submission_directory, \
-    create_data_review, cleanup_submission, clean_error_message_for_display
-from hepdata.modules.submission.api import get_latest_hepsubmission, get_submission_participants_for_record, \
-    get_or_create_submission_observer
+    cleanup_submission, clean_error_message_for_display
+from hepdata.modules.submission.api import get_latest_hepsubmission, get_latest_hepsubmissions, \
+    get_submission_participants_for_record, get_or_create_submission_observer, get_version_counts
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_action_for_submission_participant
 from hepdata.modules.records.utils.yaml_utils import split_files
+from hepdata.modules.search.config import ALL_IDS_BATCH_SIZE
 from hepdata.modules.stats.views import increment, get_count
 from hepdata.modules.submission.models import (
+    DataResource,
     DataReview,
     DataSubmission,
     HEPSubmission,
+    License,
     RecordVersionCommitMessage,
     RelatedRecid,
-    RelatedTable
+    RelatedTable,
+    datareview_messages
 )
 from hepdata.utils.file_extractor import extract
 from hepdata.utils.miscellaneous import sanitize_html, get_resource_data
@@ -219,6 +230,15 @@ def format_tables(ctx, data_record_query, data_table, recid):
         ctx['data_tables']))
     if matching_tables:
         ctx['table_name_to_show'] = matching_tables[0]['name']
+    select_table_from_args(ctx)
+
+
+def select_table_from_args(ctx):
+    """
+    Selects the table to show from the ``table`` request argument, if given.
+
+    :param ctx: context containing the formatted ``data_tables``
+    """
     if 'table' in request.args:
         if request.args['table']:
             table_from_args = request.args['table']
@@ -237,6 +257,26 @@ def format_tables(ctx, data_record_query, data_table, recid):
                 ctx['table_name_to_show'] = matching_tables[0]['name']
 
 
+def add_user_context(ctx, recid, version_count):
+    """
+    Overlays the parts of a cached record context which depend on the
+    current user or request.
+
+    :param ctx: context as built by format_submission for another user
+    :param recid: publication recid
+    :param version_count: number of versions the current user can access
+    """
+    ctx["version_count"] = version_count
+    determine_user_privileges(recid, ctx)
+    ctx['show_upload_area'] = ctx['show_upload_widget'] and not ctx['data_tables']
+    ctx['watched'] = is_current_user_subscribed_to_record(recid)
+    ctx['access_count'] = get_count(recid)
+
+    ctx['table_id_to_show'] = ctx['data_tables'][0]['id'] if ctx['data_tables'] else -1
+    ctx['table_name_to_show'] = ctx['data_tables'][0]['name'] if ctx['data_tables'] else ''
+    select_table_from_args(ctx)
+
+
 def format_resource(resource, contents, content_url):
     """
     Gets info about a resource ready to be displayed on the resource's
@@ -377,11 +417,11 @@ def extract_journal_info(record):
 
 def render_record(recid, record, version, output_format, light_mode=False, observer_key=None):
 
-    # Count number of all versions and number of finished versions of a publication record.
-    version_count_all = HEPSubmission.query.filter(HEPSubmission.publication_recid == recid,
-                                                   and_(HEPSubmission.overall_status != 'sandbox',
-                                                        HEPSubmission.overall_status != 'sandbox_processing')).count()
-    version_count_finished = HEPSubmission.query.filter_by(publication_recid=recid, overall_status='finished').count()
+    explicit_version = version != -1
+
+    # Count number of all (non-sandbox) versions and number of finished versions of a publication record.
+    version_count_all, version_count_finished, version_count_sandbox = get_version_counts(recid)
+    version_count_all -= version_count_sandbox
 
     # Number of versions that a user is allowed to access based on their permissions.
     key_verified = verify_observer_key(recid, observer_key)
@@ -415,11 +455,41 @@ def render_record(recid, record, version, output_format, light_mode=False, obser
             return render_template('hepdata_records/publication_processing.html', ctx=ctx)
 
         elif not hepdata_submission.overall_status.startswith('sandbox'):
-            ctx = format_submission(recid, record, version, version_count, hepdata_submission, observer_view=key_verified)
-            ctx['record_type'] = 'publication'
-            ctx['related_recids'] = get_record_data_list(hepdata_submission, "related")
-            ctx['related_to_this_recids'] = get_record_data_list(hepdata_submission, "related_to_this")
-            ctx['overall_status'] = hepdata_submission.overall_status
+            # JSON of finished versions can be revalidated without formatting the record
+            etag = None
+            if output_format == 'json' and 'table' not in request.args \
+                    and hepdata_submission.overall_status == 'finished':
+                # The context includes the user's privileges, so depends on the user
+                etag = make_etag('record', recid, version, version_count, hepdata_submission.last_updated,
+                                 light_mode, key_verified, current_user.get_id(),
+                                 json.dumps(record, sort_keys=True, default=str))
+                cache_headers = {
+                    'last_modified': hepdata_submission.last_updated,
+                    'max_age': get_finished_max_age() if explicit_version else None,
+                    'private': current_user.is_authenticated
+                }
+                if is_not_modified(etag, hepdata_submission.last_updated):
+                    increment(recid)
+                    return not_modified_response(etag, **cache_headers)
+
+            # The context of finished versions is cached, apart from the user's parts
+            ctx = None
+            cacheable = hepdata_submission.overall_status == 'finished' and record is not None
+            if cacheable:
+                stamp = get_submission_stamp(hepdata_submission)
+                ctx = get_cached_record_context(recid, version, stamp)
+
+            if ctx is not None:
+                add_user_context(ctx, recid, version_count)
+            else:
+                ctx = format_submission(recid, record, version, version_count, hepdata_submission,
+                                        observer_view=key_verified)
+                ctx['record_type'] = 'publication'
+                ctx['related_recids'] = get_record_data_list(hepdata_submission, "related")
+                ctx['related_to_this_recids'] = get_record_data_list(hepdata_submission, "related_to_this")
+                ctx['overall_status'] = hepdata_submission.overall_status
+                if cacheable:
+                    cache_record_context(recid, version, stamp, ctx)
 
             if key_verified:
                 ctx['observer_key'] = observer_key
@@ -442,6 +512,8 @@ def render_record(recid, record, version, output_format, light_mode=False, obser
             elif 'table' not in request.args:
                 if output_format == 'json':
                     ctx = process_ctx(ctx, light_mode)
+                    if etag:
+                        return set_cache_headers(jsonify(ctx), etag, **cache_headers)
                     return jsonify(ctx)
                 else:
                     return redirect(
@@ -970,34 +1042,40 @@ def assign_or_create_review_status(data_table_metadata, publication_recid,
     :param publication_recid: publication record id
     :param version:
     """
-    data_review_query = DataReview.query.filter_by(
-        publication_recid=publication_recid, version=version)
+    if not data_table_metadata:
+        return
+
+    # Fetch the status of all existing reviews, and whether they have messages, in one query
+    has_messages = exists().where(datareview_messages.c.datareview_id == DataReview.id).label('has_messages')
+    data_reviews = db.session.query(DataReview.data_recid, DataReview.status, has_messages).filter(
+        DataReview.publication_recid == publication_recid,
+        DataReview.version == version,
+        DataReview.data_recid.in_(list(data_table_metadata.keys()))).all()
+
+    assigned_tables = set()
+    for data_recid, status, messages in data_reviews:
+        data_table_metadata[data_recid]["review_flag"] = status
+        data_table_metadata[data_recid]["review_status"] = RECORD_PLAIN_TEXT[status]
+        data_table_metadata[data_recid]["messages"] = messages
+        assigned_tables.add(data_recid)
+
     # this method should also create all the DataReviews for data_tables that
     # are not currently present to avoid
     # only creating data reviews when the review is clicked explicitly.
-    assigned_tables = []
-    if data_review_query.count() > 0:
-        data_review_records = data_review_query.all()
-
-        for data_review in data_review_records:
-            if data_review.data_recid in data_table_metadata:
-                data_table_metadata[data_review.data_recid][
-                    "review_flag"] = data_review.status
-                data_table_metadata[data_review.data_recid]["review_status"] = \
-                    RECORD_PLAIN_TEXT[data_review.status]
-                data_table_metadata[data_review.data_recid]["messages"] = len(
-                    data_review.messages) > 0
-                assigned_tables.append(data_review.data_recid)
-
-    # now create the missing data reviews
-    for data_table_id in data_table_metadata:
-        if data_table_id not in assigned_tables:
-            data_record = create_data_review(
-                data_table_id, publication_recid, version=version)
-            data_table_metadata[data_table_id][
-                "review_flag"] = data_record.status
-            data_table_metadata[data_table_id]["review_status"] = \
-                RECORD_PLAIN_TEXT[data_record.status]
+    # The data tables all belong to this submission version, so are created together.
+    missing_tables = [data_table_id for data_table_id in data_table_metadata
+                      if data_table_id not in assigned_tables]
+    if missing_tables:
+        db.session.add_all([
+            DataReview(publication_recid=publication_recid, data_recid=data_table_id,
+                       version=version, status='todo')
+            for data_table_id in missing_tables
+        ])
+        db.session.commit()
+
+        for data_table_id in missing_tables:
+            data_table_metadata[data_table_id]["review_flag"] = 'todo'
+            data_table_metadata[data_table_id]["review_status"] = RECORD_PLAIN_TEXT['todo']
 
 
 def determine_user_privileges(recid, ctx):
@@ -1041,10 +1119,12 @@ def process_data_tables(ctx, data_record_query, first_data_id,
     data_table_metadata = OrderedDict()
     ctx['show_upload_area'] = False
 
-    if ctx['show_upload_widget'] and data_record_query.count() == 0:
+    # Load the resources of all tables with one further query, rather than one per table
+    record_submissions = data_record_query.options(selectinload(DataSubmission.resources)).all()
+
+    if ctx['show_upload_widget'] and not record_submissions:
         ctx['show_upload_area'] = True
-    elif data_record_query.count() > 0:
-        record_submissions = data_record_query.all()
+    else:
         for submission_record in record_submissions:
             processed_name = "".join(submission_record.name.split())
             data_table_metadata[submission_record.id] = {
@@ -1082,39 +1162,51 @@ def get_all_ids(index=None, id_field='recid', last_updated=None, latest_first=Fa
     :param id_field: id type to return. Should be 'recid' or 'inspire_id'
     :return: list of integer ids
     """
+    return list(iter_all_ids(id_field=id_field, last_updated=last_updated, latest_first=latest_first))
+
+
+def iter_all_ids(id_field='recid', last_updated=None, latest_first=False, batch_size=ALL_IDS_BATCH_SIZE):
+    """Iterate over all record or inspire ids of finished publications,
+    fetching them in batches from a server-side cursor.
+
+    The id_field is checked straight away, before iteration starts.
+
+    :param id_field: id type to return. Should be 'recid' or 'inspire_id'
+    :param last_updated: only return ids of publications updated since this datetime
+    :param latest_first: order by last_updated (most recent first) rather than by recid
+    :param batch_size: number of rows to fetch at a time
+    :return: iterator of integer ids
+    """
     if id_field not in ('recid', 'inspire_id'):
         raise ValueError('Invalid ID field %s' % id_field)
 
     db_col = HEPSubmission.publication_recid if id_field == 'recid' \
         else HEPSubmission.inspire_id
 
+    # Use a subquery to enforce uniqueness on db_col, ordering either by the
+    # latest update of any version or deterministically by the minimum
+    # associated publication_recid.
+    subq = db.session.query(
+        db_col.label('id'),
+        func.min(HEPSubmission.publication_recid).label('min_recid'),
+        func.max(HEPSubmission.last_updated).label('max_last_updated')
+    ).filter(HEPSubmission.overall_status == 'finished')
+    if last_updated:
+        subq = subq.filter(HEPSubmission.last_updated >= last_updated)
+    subq = subq.group_by(db_col).subquery()
+
     if latest_first:
-        # Use a set to check for duplicates, as sorting by last_updated
-        # means distinct doesn't work (as it looks for distinct across both
-        # cols)
-        query = db.session.query(db_col).filter(HEPSubmission.overall_status == 'finished')
-        if last_updated:
-            query = query.filter(HEPSubmission.last_updated >= last_updated)
-        query = query.order_by(HEPSubmission.last_updated.desc())
-        seen = set()
-        seen_add = seen.add
-        return [
-            int(x[0]) for x in query.all() if not (x[0] in seen or seen_add(x[0]))
-        ]
+        order_by = (subq.c.max_last_updated.desc(), subq.c.min_recid)
     else:
-        # Use a subquery to enforce uniqueness on db_col while ordering
-        # deterministically by the minimum associated publication_recid.
-        subq = db.session.query(
-            db_col.label('id'),
-            func.min(HEPSubmission.publication_recid).label('min_recid')
-        ).filter(HEPSubmission.overall_status == 'finished')
-        if last_updated:
-            subq = subq.filter(HEPSubmission.last_updated >= last_updated)
-        subq = subq.group_by(db_col).subquery()
-        result = db.session.execute(
-            select(subq.c.id).order_by(subq.c.min_recid)
-        )
-        return [int(row[0]) for row in result]
+        order_by = (subq.c.min_recid,)
+
+    return _iter_ids(select(subq.c.id).order_by(*order_by), batch_size)
+
+
+def _iter_ids(statement, batch_size):
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for row in result:
+        yield int(row[0])
 
 
 def get_related_hepsubmissions(submission):
@@ -1125,14 +1217,14 @@ def get_related_hepsubmissions(submission):
 
     :return: [list] A list of HEPSubmission objects
     """
-    related_submissions = []
-    for related in submission.related_recids:
-        data_submission = get_latest_hepsubmission(
-            publication_recid=related.related_recid
-        )
-        if data_submission:
-            related_submissions.append(data_submission)
-    return related_submissions
+    related_recids = [related.related_recid for related in submission.related_recids]
+    if not related_recids:
+        return []
+
+    # Get the latest version of all the related records in a single query
+    submissions_by_recid = get_latest_hepsubmissions(publication_recids=related_recids)
+
+    return [submissions_by_recid[recid] for recid in related_recids if recid in submissions_by_recid]
 
 
 def get_related_to_this_hepsubmissions(submission):
@@ -1166,10 +1258,12 @@ def get_related_to_this_hepsubmissions(submission):
         .all()
     )
 
-    # Set comprehension to determine unique IDs where the max version object is 'finished'
-    unique_recids = {sub.publication_recid for sub in related_submissions if sub.overall_status == 'finished'}
+    # Unique submissions where the max version object is 'finished', which is
+    # then also the latest finished version
+    unique_submissions = {sub.publication_recid: sub for sub in related_submissions
+                          if sub.overall_status == 'finished'}
 
-    return [get_latest_hepsubmission(publication_recid=recid, overall_status='finished') for recid in unique_recids]
+    return [unique_submissions[recid] for recid in sorted(unique_submissions)]
 
 
 def get_related_datasubmissions(data_submission):
@@ -1181,17 +1275,22 @@ def get_related_datasubmissions(data_submission):
     :param data_submission: The datasubmission object to find related data for.
     :return: [list] A list of DataSubmission objects
     """
-    related_submissions = []
-    for related in data_submission.related_tables:
-        submission = (
-            DataSubmission.query
-            .filter(DataSubmission.doi == related.related_doi)
-            .join(HEPSubmission, HEPSubmission.publication_recid == DataSubmission.publication_recid)
-            .first()
-        )
-        if submission:
-            related_submissions.append(submission)
-    return related_submissions
+    related_dois = [related.related_doi for related in data_submission.related_tables]
+    if not related_dois:
+        return []
+
+    # Look up all the related DOIs in a single query
+    submissions_by_doi = {}
+    submissions = (
+        DataSubmission.query
+        .filter(DataSubmission.doi.in_(related_dois))
+        .join(HEPSubmission, HEPSubmission.publication_recid == DataSubmission.publication_recid)
+        .all()
+    )
+    for submission in submissions:
+        submissions_by_doi.setdefault(submission.doi, submission)
+
+    return [submissions_by_doi[doi] for doi in related_dois if doi in submissions_by_doi]
 
 
 def get_related_to_this_datasubmissions(data_submission):
@@ -1220,6 +1319,37 @@ def get_related_to_this_datasubmissions(data_submission):
     return related_submissions
 
 
+def load_table_details(recid, data_recid, version):
+    """
+    Loads a DataSubmission for display, together with its data file, license
+    and review, in a single query. The keywords are joined into the same query,
+    and the resources and related tables are each loaded with one further query.
+
+    :param recid: publication recid of the DataSubmission
+    :param data_recid: id of the DataSubmission
+    :param version: version of the DataSubmission
+    :return: tuple of (DataSubmission, DataResource, License, DataReview, has_messages),
+        where any of the last four may be None/False, or None if there is no such DataSubmission
+    """
+    has_messages = exists().where(datareview_messages.c.datareview_id == DataReview.id).label('has_messages')
+
+    return (
+        db.session.query(DataSubmission, DataResource, License, DataReview, has_messages)
+        .outerjoin(DataResource, DataResource.id == DataSubmission.data_file)
+        .outerjoin(License, License.id == DataResource.file_license)
+        .outerjoin(DataReview, and_(DataReview.data_recid == DataSubmission.id,
+                                    DataReview.publication_recid == DataSubmission.publication_recid,
+                                    DataReview.version == DataSubmission.version))
+        .options(joinedload(DataSubmission.keywords),
+                 selectinload(DataSubmission.resources),
+                 selectinload(DataSubmission.related_tables))
+        .filter(DataSubmission.id == data_recid,
+                DataSubmission.publication_recid == recid,
+                DataSubmission.version == version)
+        .first()
+    )
+
+
 def get_record_data_list(record, data_type):
     """
     Generates a dictionary (title/recid) from a list of record IDs.
@@ -1236,12 +1366,21 @@ def get_record_data_list(record, data_type):
     elif data_type == "related_to_this":
         data = get_related_to_this_hepsubmissions(record)
 
+    # Fetch the titles of all the records at once
+    records = get_publication_records_contents([datum.publication_recid for datum in data])
+
     record_data = []
     for datum in data:
+        contents = records.get(datum.publication_recid)
+        if not contents:
+            # Neither indexed nor in the database, so there is nothing to link to
+            log.warning('Unable to find record {0} related to {1}'.format(
+                datum.publication_recid, record.publication_recid))
+            continue
         record_data.append(
         {
             "recid": datum.publication_recid,
-            "title": get_record_contents(datum.publication_recid)["title"],
+            "title": contents.get("title"),
             "version": datum.version
         })
     return record_data
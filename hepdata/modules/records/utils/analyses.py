@@ -40,6 +40,7 @@ from hepdata.utils.users import get_user_from_id
 from hepdata.modules.records.subscribers.rest import subscribe
 from hepdata.modules.records.subscribers.api import is_current_user_subscribed_to_record
 from hepdata.modules.records.utils.common import get_license
+from hepdata.modules.records.utils.page_cache import invalidate_record_contexts
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
@@ -132,6 +133,7 @@ def update_analyses_single_tool(analysis_endpoint):
                                 latest_submission = get_latest_hepsubmission(inspire_id=record)
                                 if submission.version == latest_submission.version:
                                     index_record_ids([submission.publication_recid])
+                                invalidate_record_contexts([submission.publication_recid])
                             except Exception as e:
                                 db.session.rollback()
                                 log.error(e)
@@ -186,6 +188,7 @@ def update_analyses_single_tool(analysis_endpoint):
                                 latest_submission = get_latest_hepsubmission(inspire_id=inspire_id)
                                 if submission.version == latest_submission.version:
                                     index_record_ids([submission.publication_recid])
+                                invalidate_record_contexts([submission.publication_recid])
                             except Exception as e:
                                 db.session.rollback()
                                 log.error(e)
@@ -226,6 +229,7 @@ def update_analyses_single_tool(analysis_endpoint):
                         for i in range(0, len(unique_recids), batch_size):
                             batch_recids = unique_recids[i:i+batch_size]
                             index_record_ids(batch_recids)
+                        invalidate_record_contexts(unique_recids)
                 except Exception as e:
                     db.session.rollback()
                     log.error(e)
@@ -32,7 +32,8 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from hepdata.config import (HISTFACTORY_FILE_TYPE, HS3_FILE_TYPE, SIMPLEANALYSIS_FILE_TYPE,
                             NUISANCE_FILE_TYPE, SIZE_LOAD_CHECK_THRESHOLD)
-from hepdata.ext.opensearch.api import get_record
+from hepdata.ext.opensearch.api import get_record, get_publication_records
+from hepdata.modules.records.utils.table_cache import get_parsed_table
 from hepdata.modules.submission.models import HEPSubmission, License, DataSubmission, DataResource
 
 FILE_TYPES = {
@@ -236,6 +237,24 @@ def get_record_contents(recid, status=None):
     return record
 
 
+def get_publication_records_contents(recids):
+    """
+    Gets several publication records, from OpenSearch with a single request,
+    falling back to the database for any records which are not indexed.
+
+    :param recids: list of publication record IDs
+    :return: dict of record contents keyed by record ID, for the records which exist
+    """
+    records = get_publication_records(recids)
+
+    for recid in set(recids) - set(records):
+        record = get_record_by_id(recid)
+        if record is not None:
+            records[recid] = record
+
+    return records
+
+
 def get_record_by_id(recid):
     try:
         resolver = Resolver(pid_type='recid', object_type='rec', getter=Record.get_record)
@@ -272,18 +291,30 @@ def load_table_data(recid, version):
 
         if data_query.count() > 0:
             data_record = data_query.one()
-            file_location = data_record.file_location
-
-            attempts = 0
-            while True:
-                try:
-                    with open(file_location, 'r') as table_file:
-                        table_contents = yaml.load(table_file, Loader=Loader)
-                except (FileNotFoundError, PermissionError) as e:
-                    attempts += 1
-                # allow multiple attempts to read file in case of temporary disk problems
-                if (table_contents and table_contents is not None) or attempts > 5:
-                    break
+            table_contents = get_parsed_table(data_record.id, data_record.file_location,
+                                              read_table_file)
+
+    return table_contents
+
+
+def read_table_file(file_location):
+    """
+    Parses a data file's yaml file data from disk.
+
+    :param file_location: Location of the data file on disk
+    :return table_contents: A dict containing the table data
+    """
+    table_contents = {}
+    attempts = 0
+    while True:
+        try:
+            with open(file_location, 'r') as table_file:
+                table_contents = yaml.load(table_file, Loader=Loader)
+        except (FileNotFoundError, PermissionError) as e:
+            attempts += 1
+        # allow multiple attempts to read file in case of temporary disk problems
+        if (table_contents and table_contents is not None) or attempts > 5:
+            break
 
     return table_contents
 
@@ -311,6 +342,17 @@ def generate_license_data_by_id(license_id):
     :return dict: Returns the license_data dictionary
     """
     license_data = License.query.filter_by(id=license_id).first()
+    return generate_license_data(license_data)
+
+
+def generate_license_data(license_data):
+    """
+    Generates a dictionary from a License object, or returns
+    the default CC0 license information.
+
+    :param license_data: License object, or None
+    :return dict: Returns the license_data dictionary
+    """
     if license_data and license_data.name is not None:
         # Generate and return the dictionary
         return {
@@ -66,6 +66,14 @@ def get_converted_directory_path(record_id):
                         _get_subdir_name(record_id))
 
 
+def get_rendered_directory_path(record_id):
+    """Return the path for render-ready table files for the given record id"""
+    return os.path.join(current_app.config['CFG_DATADIR'],
+                        'rendered',
+                        _get_subdir_name(record_id),
+                        str(record_id))
+
+
 def get_data_path_for_record(record_id, *subpaths):
     """Return the path for data files for the given record id."""
     path = os.path.join(current_app.config['CFG_DATADIR'],
@@ -103,7 +111,7 @@ def delete_all_files(rec_id, check_old_data_paths=True):
     """
     Deletes all data files across ALL versions of a record.
     """
-    record_data_paths = [get_data_path_for_record(rec_id)]
+    record_data_paths = [get_data_path_for_record(rec_id), get_rendered_directory_path(rec_id)]
 
     if check_old_data_paths:
         record_data_paths.append(get_old_data_path_for_record(rec_id))
@@ -53,19 +53,59 @@ def fix_nan_inf(value):
     :param value:
     :return:
     """
-    keys = ['value', 'high', 'low']
-    for key in keys:
-        if key in value and str(value[key]) in current_app.config['SPECIAL_VALUES']:
-            value[key] = str(value['value'])
+    fix_special_values([value], get_special_values())
     return value
 
 
-def process_independent_variables(table_contents, x_axes, independent_variable_headers):
+def get_special_values():
+    """
+    Returns the set of special (NaN and infinite) values as strings.
+
+    :return: frozenset of strings
+    """
+    return frozenset(current_app.config['SPECIAL_VALUES'])
+
+
+def fix_special_values(cells, special_values):
+    """
+    Converts NaN, +inf, and -inf values to strings in a column of value
+    dicts, in a single pass over the column.
+
+    :param cells: list of value dicts from a table column
+    :param special_values: set of special values as returned by get_special_values
+    :return: the same list of value dicts
+    """
+    for cell in cells:
+        for key in ('value', 'high', 'low'):
+            if key in cell:
+                value = cell[key]
+                if value.__class__ is not str:
+                    value = str(value)
+                if value in special_values:
+                    cell[key] = str(cell['value'])
+    return cells
+
+
+def get_row_window(offset=0, limit=None):
+    """
+    Converts an offset and limit into start and stop indices for slicing.
+
+    :param offset: index of the first row
+    :param limit: maximum number of rows, or None for all remaining rows
+    :return: tuple of (start, stop), where stop may be None
+    """
+    return offset, (offset + limit if limit is not None else None)
+
+
+def process_independent_variables(table_contents, x_axes, independent_variable_headers,
+                                  offset=0, limit=None):
 
     if len(table_contents["independent_variables"]) == 0 and table_contents["dependent_variables"]:
         pad_independent_variables(table_contents)
 
     if table_contents["independent_variables"]:
+        special_values = get_special_values()
+        start, stop = get_row_window(offset, limit)
         count = 0
         for x_axis in table_contents["independent_variables"]:
             units = x_axis['header']['units'] if 'units' in x_axis['header'] else ''
@@ -84,17 +124,27 @@ def process_independent_variables(table_contents, x_axes, independent_variable_h
                 {"name": x_header, "colspan": 1})
 
             if x_axis["values"]:
-                # if x_header not in x_headers:
-
-                for value in x_axis["values"]:
-                    x_axes[x_header].append(fix_nan_inf(value))
+                x_axes[x_header] = fix_special_values(x_axis["values"][start:stop], special_values)
 
             count += 1
 
 
 def process_dependent_variables(group_count, record, table_contents,
                                 tmp_values, independent_variables,
-                                dependent_variable_headers):
+                                dependent_variable_headers, offset=0, limit=None):
+    special_values = get_special_values()
+    start, stop = get_row_window(offset, limit)
+    label_plans = {}
+
+    # Rows of x values, built once from the independent variable columns.
+    x_columns = list(independent_variables.values())
+    if x_columns:
+        x_rows = list(zip(*x_columns))
+        row_count = len(x_rows)
+    else:
+        x_rows = None
+        row_count = None
+
     for y_axis in table_contents["dependent_variables"]:
 
         qualifiers = {}
@@ -120,90 +170,133 @@ def process_dependent_variables(group_count, record, table_contents,
                          ' ' + qualifier['units'] if 'units' in qualifier else ''),
                      "colspan": 1, "group": group_count})
 
-            # attempt column merge
-            for qualifier in record["qualifiers"]:
-                values = record["qualifiers"][qualifier]
-                merged_values = []
-                last_value = None
-                for counter, value in enumerate(values):
-                    if not last_value:
-                        last_value = value
-                    else:
-                        if last_value["type"] == value["type"] and last_value["value"] == value["value"]:
-                            last_value["colspan"] += 1
-                        else:
-                            merged_values.append(last_value)
-                            last_value = value
-
-                    if counter == len(values) - 1:
-                        merged_values.append(last_value)
-
-                record["qualifiers"][qualifier] = merged_values
-
         units = y_axis['header']['units'] if 'units' in y_axis['header'] else ''
         y_header = y_axis['header']['name']
         if units:
             y_header += ' [' + units + ']'
         dependent_variable_headers.append({"name": y_header, "colspan": 1})
 
-        count = 0
-        too_many_y_values = False
-        for value in y_axis["values"]:
-
-            if count not in tmp_values.keys():
-
-                # Check that number of y values does not exceed number of x values.
-                for x_header in independent_variables:
-                    if count > len(independent_variables[x_header]) - 1:
-                        too_many_y_values = True
-                if too_many_y_values: break
+        # The number of y values used cannot exceed the number of x values.
+        y_cells = y_axis["values"][start:stop]
+        if row_count is not None and len(y_cells) > row_count:
+            y_cells = y_cells[:row_count]
 
-                x = []
-                for x_header in independent_variables:
-                    x.append(independent_variables[x_header][count])
-                tmp_values[count] = {"x": x, "y": []}
+        fix_special_values(y_cells, special_values)
 
-            y_record = value
+        for count, y_record in enumerate(y_cells):
 
-            fix_nan_inf(y_record)
+            if count not in tmp_values:
+                tmp_values[count] = {"x": list(x_rows[count]) if x_rows is not None else [], "y": []}
 
             y_record["group"] = group_count
 
             if "errors" not in y_record:
                 y_record["errors"] = [{"symerror": 0, "hide": True}]
             else:
-                # process the labels to ensure uniqueness
-                observed_error_labels = {}
-                for error in y_record["errors"]:
-                    error_label = error.get("label", "error")
-
-                    if error_label not in observed_error_labels:
-                        observed_error_labels[error_label] = 0
-                    observed_error_labels[error_label] += 1
-
-                    if observed_error_labels[error_label] > 1:
-                        error["label"] = error_label + "_" + str(
-                            observed_error_labels[error_label])
-
-                    # append "_1" to first error label that has a duplicate
-                    if observed_error_labels[error_label] == 2:
-                        for error1 in y_record["errors"]:
-                            error1_label = error1.get("label", "error")
-                            if error1_label == error_label:
-                                error1["label"] = error1_label + "_1"
-                                break
+                # process the labels to ensure uniqueness, reusing the plan
+                # worked out for the first value with the same labels
+                errors = y_record["errors"]
+                error_labels = tuple([error.get("label") for error in errors])
+                label_plan = label_plans.get(error_labels)
+                if label_plan is None:
+                    label_plan = label_plans[error_labels] = get_error_label_plan(error_labels)
+
+                for index, error_label in label_plan:
+                    errors[index]["label"] = error_label
 
             tmp_values[count]["y"].append(y_record)
-            count += 1
 
         group_count += 1
 
+    merge_qualifier_columns(record["qualifiers"])
+
+
+def get_error_label_plan(error_labels):
+    """
+    Works out how the error labels of a value are renamed to make them unique:
+    duplicated labels are numbered, e.g. ``sys_1``, ``sys_2``, and errors
+    without a label are treated as having the label ``error``.
+
+    :param error_labels: tuple of the error labels of a value (None for an error without a label)
+    :return: list of (index, new label) tuples for the errors to be renamed
+    """
+    errors = [{} if label is None else {"label": label} for label in error_labels]
+
+    observed_error_labels = {}
+    for error in errors:
+        error_label = error.get("label", "error")
+
+        if error_label not in observed_error_labels:
+            observed_error_labels[error_label] = 0
+        observed_error_labels[error_label] += 1
+
+        if observed_error_labels[error_label] > 1:
+            error["label"] = error_label + "_" + str(
+                observed_error_labels[error_label])
+
+        # append "_1" to first error label that has a duplicate
+        if observed_error_labels[error_label] == 2:
+            for error1 in errors:
+                error1_label = error1.get("label", "error")
+                if error1_label == error_label:
+                    error1["label"] = error1_label + "_1"
+                    break
+
+    return [(index, error["label"]) for index, error in enumerate(errors)
+            if error.get("label") != error_labels[index]]
+
+
+def merge_qualifier_columns(qualifiers):
+    """
+    Merges adjacent qualifier values with the same type and value into a
+    single entry spanning several columns, in one pass per qualifier.
+
+    :param qualifiers: dict of qualifier name to list of qualifier values
+    """
+    for qualifier, values in qualifiers.items():
+        merged_values = []
+        for value in values:
+            if merged_values and merged_values[-1]["type"] == value["type"] \
+                    and merged_values[-1]["value"] == value["value"]:
+                merged_values[-1]["colspan"] += value["colspan"]
+            else:
+                merged_values.append(value)
+
+        qualifiers[qualifier] = merged_values
+
+
+def get_table_row_count(table_contents):
+    """
+    Counts the rows of a data table, i.e. the number of entries in the
+    ``values`` list generated by generate_table_data.
+
+    :param table_contents: parsed data table
+    :return: number of rows
+    """
+    dependent_variables = table_contents.get("dependent_variables") or []
+    x_lengths = [len(x_axis["values"] or []) for x_axis in table_contents.get("independent_variables") or []]
+    if not x_lengths and dependent_variables:
+        # as for pad_independent_variables
+        x_lengths = [len(dependent_variables[0]["values"])]
+    max_rows = min(x_lengths) if x_lengths else None
+
+    row_count = 0
+    for y_axis in dependent_variables:
+        y_length = len(y_axis["values"])
+        if max_rows is not None:
+            y_length = min(y_length, max_rows)
+        row_count = max(row_count, y_length)
+
+    return row_count
+
 
-def generate_table_data(table_contents):
+def generate_table_data(table_contents, offset=0, limit=None):
     """
     Creates a renderable data table structure.
 
     :param table_contents:
+    :param offset: index of the first row to include
+    :param limit: maximum number of rows to include, or None for all remaining rows
     :return: A dictionary containing the table headers/values
     """
     record = {
@@ -216,7 +309,7 @@ def generate_table_data(table_contents):
     tmp_values = {}
     x_axes = OrderedDict()
     x_headers = []
-    process_independent_variables(table_contents, x_axes, x_headers)
+    process_independent_variables(table_contents, x_axes, x_headers, offset=offset, limit=limit)
     record["x_count"] = len(x_headers)
     record["headers"] += x_headers
 
@@ -224,7 +317,7 @@ def generate_table_data(table_contents):
     yheaders = []
 
     process_dependent_variables(group_count, record, table_contents,
-                                tmp_values, x_axes, yheaders)
+                                tmp_values, x_axes, yheaders, offset=offset, limit=limit)
 
     # attempt column merge
     last_yheader = None
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Decimation of data tables for plotting.
+
+Tables with a single independent variable are reduced to at most
+``max_points`` rows using the Largest-Triangle-Three-Buckets (LTTB)
+algorithm. The points are shared out between the dependent variables, each
+keeping its first and last points and its minimum and maximum, and the rows
+kept for any dependent variable are returned, so every plotted series is a
+subset of the real data. If there are too many dependent variables to give
+each of them ``MIN_MAX_POINTS`` points, a single series combining all of
+them (each scaled to its range) is decimated instead.
+
+Requested values of ``max_points`` are rounded down to one of
+``MAX_POINTS_BUCKETS`` (and limited to ``TABLE_DECIMATION_MAX_POINTS``), so
+that only a few decimated copies of each table are cached.
+"""
+
+import json
+import logging
+
+from flask import current_app
+
+from hepdata.modules.records.utils.common import read_table_file
+from hepdata.modules.records.utils.data_processing_utils import generate_table_data
+from hepdata.modules.records.utils.table_cache import file_fingerprint, get_cached_field, \
+    get_parsed_table, set_cached_field
+from hepdata.modules.submission.models import DataSubmission, DataResource
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+MIN_POINTS = 3
+# Smallest max_points allowed: the LTTB points plus the minimum and maximum
+MIN_MAX_POINTS = MIN_POINTS + 2
+# Values of max_points that decimated tables are generated (and cached) for
+MAX_POINTS_BUCKETS = (MIN_MAX_POINTS, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def round_max_points(max_points):
+    """
+    Rounds a requested max_points down to one of ``MAX_POINTS_BUCKETS``, no
+    larger than ``TABLE_DECIMATION_MAX_POINTS``.
+
+    :param max_points: requested maximum number of rows (at least MIN_MAX_POINTS)
+    :return: int
+    """
+    max_points = min(max_points, current_app.config.get('TABLE_DECIMATION_MAX_POINTS', MAX_POINTS_BUCKETS[-1]))
+    return max([bucket for bucket in MAX_POINTS_BUCKETS if bucket <= max_points] or [MIN_MAX_POINTS])
+
+
+def to_number(value):
+    """
+    Converts a table value to a float.
+
+    :param value: value from a parsed table (usually a string)
+    :return: float, or None if the value is not numeric
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # exclude NaN and infinite values
+    if number != number or number in (float('inf'), float('-inf')):
+        return None
+    return number
+
+
+def get_x_position(x_value):
+    """
+    Returns the numeric position of an independent variable value: its
+    value, or the centre of its bin if it only has low and high edges.
+
+    :param x_value: value dict of an independent variable
+    :return: float, or None if the value is not numeric
+    """
+    position = to_number(x_value.get('value'))
+    if position is None:
+        low = to_number(x_value.get('low'))
+        high = to_number(x_value.get('high'))
+        if low is not None and high is not None:
+            position = (low + high) / 2
+        else:
+            position = low if low is not None else high
+    return position
+
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Selects points using the Largest-Triangle-Three-Buckets algorithm.
+
+    :param xs: list of x positions, in plotting order
+    :param ys: list of y values
+    :param threshold: number of points to select
+    :return: sorted list of the selected indices
+    """
+    n = len(xs)
+    if threshold >= n or threshold < MIN_POINTS:
+        return list(range(n))
+
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = [0]
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # average point of the next bucket (just the last point for the final bucket)
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        max_area = -1
+        selected = start
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > max_area:
+                max_area = area
+                selected = j
+
+        indices.append(selected)
+        a = selected
+
+    indices.append(n - 1)
+    return indices
+
+
+def decimate_series(points, max_points):
+    """
+    Decimates a series, keeping its minimum and maximum values.
+
+    :param points: list of (row index, x, y) tuples
+    :param max_points: maximum number of points to keep
+    :return: set of the row indices kept
+    """
+    if len(points) <= max_points:
+        return set(point[0] for point in points)
+
+    # LTTB buckets the points in plotting order
+    points = sorted(points, key=lambda point: (point[1], point[0]))
+
+    xs = [point[1] for point in points]
+    ys = [point[2] for point in points]
+    selected = lttb_indices(xs, ys, max_points - 2)
+    selected.append(ys.index(min(ys)))
+    selected.append(ys.index(max(ys)))
+
+    return set(points[index][0] for index in selected)
+
+
+def combine_series(series):
+    """
+    Combines several series into one, whose value at each row is the mean of
+    the values of the series in the row, each scaled to the range of its series.
+
+    :param series: list of lists of (row index, x, y) tuples
+    :return: list of (row index, x, y) tuples
+    """
+    rows = {}
+    for points in series:
+        low = min(point[2] for point in points)
+        high = max(point[2] for point in points)
+        for index, x, y in points:
+            scaled = (y - low) / (high - low) if high > low else 0
+            rows.setdefault(index, [x, []])[1].append(scaled)
+
+    return [(index, x, sum(values) / len(values)) for index, (x, values) in rows.items()]
+
+
+def decimate_table_data(table_data, max_points):
+    """
+    Reduces the rows of a table generated by generate_table_data for plotting.
+
+    Only tables with a single independent variable are decimated; other
+    tables are returned in full.
+
+    :param table_data: dict returned by generate_table_data (modified in place)
+    :param max_points: maximum number of rows to keep
+    :return: table_data, with ``values`` limited to the selected rows, plus
+        ``total_rows``, ``row_indices`` (the indices of the selected rows in the
+        full table), ``max_points`` and ``decimated``
+    """
+    rows = table_data['values']
+    total_rows = len(rows)
+    decimated = table_data['x_count'] == 1 and total_rows > max_points
+
+    if decimated:
+        series = {}
+        for index, row in enumerate(rows):
+            x = get_x_position(row['x'][0])
+            if x is None:
+                continue
+            for y_value in row['y']:
+                y = to_number(y_value.get('value'))
+                if y is not None:
+                    series.setdefault(y_value['group'], []).append((index, x, y))
+
+        row_indices = set()
+        if series:
+            points_per_series = max_points // len(series)
+            if points_per_series >= MIN_MAX_POINTS:
+                for points in series.values():
+                    row_indices.update(decimate_series(points, points_per_series))
+            else:
+                row_indices.update(decimate_series(combine_series(list(series.values())), max_points))
+        row_indices = sorted(row_indices)
+        table_data['values'] = [rows[index] for index in row_indices]
+    else:
+        row_indices = list(range(total_rows))
+
+    table_data['total_rows'] = total_rows
+    table_data['row_indices'] = row_indices
+    table_data['max_points'] = max_points
+    table_data['decimated'] = decimated
+    return table_data
+
+
+def get_decimated_table_data(data_recid, version, max_points):
+    """
+    Returns the decimated table data for a DataSubmission, cached alongside
+    the parsed table. Tables which are small enough to be returned in full
+    are not cached again, as the parsed table already is.
+
+    :param data_recid: id of the DataSubmission
+    :param version: version of the DataSubmission
+    :param max_points: maximum number of rows to keep (see :func:`round_max_points`)
+    :return: dict as returned by decimate_table_data, or an empty dict
+        if the table does not exist
+    """
+    data_submission = DataSubmission.query.filter_by(id=data_recid, version=version).first()
+    if data_submission is None:
+        return {}
+
+    data_resource = DataResource.query.filter_by(id=data_submission.data_file).first()
+    if data_resource is None:
+        return {}
+
+    fingerprint = file_fingerprint(data_resource.file_location)
+    field = 'decimated:{0}'.format(max_points)
+    cached = get_cached_field(data_resource.id, fingerprint, field)
+    if cached is not None:
+        return json.loads(cached)
+
+    table_contents = get_parsed_table(data_resource.id, data_resource.file_location, read_table_file)
+    if 'independent_variables' not in table_contents:
+        return table_contents
+
+    table_data = decimate_table_data(generate_table_data(table_contents), max_points)
+    if not table_data['decimated']:
+        return table_data
+
+    try:
+        value = json.dumps(table_data, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError) as e:
+        log.warning('Unable to serialise decimated table {0} for cache: {1}'.format(data_resource.id, e))
+    else:
+        set_cached_field(data_resource.id, fingerprint, field, value)
+
+    return table_data
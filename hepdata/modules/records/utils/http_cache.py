@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""HTTP validators and caching headers for record and table JSON.
+
+Responses are given a strong ETag built from the database state they were
+generated from (e.g. ``HEPSubmission.last_updated`` and ``DataResource.id``),
+so a request with a matching ``If-None-Match`` header can be answered with
+``304 Not Modified`` before any table is loaded. Responses for finished
+versions are also given a ``Cache-Control`` lifetime of
+``HTTP_CACHE_FINISHED_MAX_AGE``; everything else must be revalidated.
+"""
+
+import hashlib
+from datetime import timezone
+
+from flask import current_app, make_response, request
+from invenio_db import db
+from sqlalchemy import and_
+
+from hepdata.modules.records.utils.table_cache import file_fingerprint
+from hepdata.modules.submission.models import DataSubmission, DataResource, HEPSubmission
+
+
+def make_etag(*parts):
+    """
+    Generates an ETag from the values a response was generated from.
+
+    :param parts: values which together identify the response content
+    :return: ETag string (without quotes)
+    """
+    return hashlib.sha1('/'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def get_finished_max_age():
+    return current_app.config.get('HTTP_CACHE_FINISHED_MAX_AGE', 0)
+
+
+def _to_http_date(last_modified):
+    # Database timestamps are naive UTC, HTTP dates are whole seconds
+    if last_modified is None:
+        return None
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0)
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Checks the conditional headers of the current request.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``, as in
+    RFC 9110.
+
+    :param etag: ETag of the current representation
+    :param last_modified: datetime of the last modification, if known
+    :return: True if the client's copy is still valid
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    last_modified = _to_http_date(last_modified)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def set_cache_headers(response, etag, last_modified=None, max_age=None, private=False):
+    """
+    Adds validators and Cache-Control directives to a response.
+
+    :param response: flask Response
+    :param etag: ETag of the response
+    :param last_modified: datetime of the last modification, if known
+    :param max_age: lifetime in seconds, or None if the response must always be revalidated
+    :param private: whether the response depends on the current user
+    :return: the response
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _to_http_date(last_modified)
+
+    if private:
+        response.cache_control.private = True
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.public = True
+
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+
+    return response
+
+
+def not_modified_response(etag, last_modified=None, max_age=None, private=False):
+    """
+    Returns a ``304 Not Modified`` response with the caching headers of the
+    full response.
+
+    :param etag: ETag of the current representation
+    :param last_modified: datetime of the last modification, if known
+    :param max_age: lifetime in seconds, or None if the response must always be revalidated
+    :param private: whether the response depends on the current user
+    :return: flask Response
+    """
+    return set_cache_headers(make_response('', 304), etag, last_modified, max_age, private)
+
+
+def conditional_response(etag, generate, last_modified=None, max_age=None, private=False):
+    """
+    Returns ``304 Not Modified`` if the client's copy is still valid, otherwise
+    generates the response and adds the caching headers to it.
+
+    :param etag: ETag of the current representation
+    :param generate: function returning the response (only called if needed)
+    :param last_modified: datetime of the last modification, if known
+    :param max_age: lifetime in seconds, or None if the response must always be revalidated
+    :param private: whether the response depends on the current user
+    :return: flask Response
+    """
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified, max_age, private)
+
+    response = make_response(generate())
+    if response.status_code != 200:
+        return response
+
+    return set_cache_headers(response, etag, last_modified, max_age, private)
+
+
+def get_table_validators(data_recid, version):
+    """
+    Gets the values identifying the data of a table, with a single query.
+
+    :param data_recid: id of the DataSubmission
+    :param version: version of the DataSubmission
+    :return: tuple of (etag, last_modified, finished), or None if the table does not exist
+    """
+    result = db.session.query(DataResource.id, DataResource.file_location,
+                              HEPSubmission.overall_status, HEPSubmission.last_updated) \
+        .select_from(DataSubmission) \
+        .join(DataResource, DataResource.id == DataSubmission.data_file) \
+        .join(HEPSubmission, and_(HEPSubmission.publication_recid == DataSubmission.publication_recid,
+                                  HEPSubmission.version == DataSubmission.version)) \
+        .filter(DataSubmission.id == data_recid, DataSubmission.version == version) \
+        .first()
+
+    if result is None:
+        return None
+
+    resource_id, file_location, overall_status, last_updated = result
+    etag = make_etag('table', data_recid, version, resource_id, file_fingerprint(file_location))
+    return etag, last_updated, overall_status == 'finished'
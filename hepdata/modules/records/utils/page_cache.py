@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Cache of the page context of finished record versions.
+
+The context built by ``format_submission`` and ``render_record`` for a finished
+version hardly changes, so it is stored in Redis per (recid, version), using
+``RECORD_PAGE_CACHE_REDIS_URL``. The parts which depend on the current user
+(privileges, watched state, etc.) are overlaid on each request.
+
+Contexts are stored as JSON. Dates and times are tagged so that templates get
+them back as ``datetime`` objects; any other values which JSON cannot hold
+are stored as strings.
+
+Entries are tagged with a stamp of the HEPSubmission they were built from, so
+are never served for a different or updated submission, and are invalidated
+when a record is finalised, its INSPIRE information is updated or resources
+are added to it.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+
+import redis
+from flask import current_app
+
+from hepdata.utils.redis_client import get_redis_client
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+DATETIME_TAG = '__datetime__'
+DATE_TAG = '__date__'
+
+
+def page_cache_enabled():
+    return current_app.config.get('RECORD_PAGE_CACHE_ENABLED', False)
+
+
+def _redis_key(recid):
+    return '{0}record_page::{1}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''), recid)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    if isinstance(value, date):
+        return {DATE_TAG: value.isoformat()}
+    return str(value)
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        if DATETIME_TAG in obj:
+            return datetime.fromisoformat(obj[DATETIME_TAG])
+        if DATE_TAG in obj:
+            return date.fromisoformat(obj[DATE_TAG])
+    return obj
+
+
+def get_submission_stamp(hepsubmission):
+    """
+    Generates a stamp identifying the state of a HEPSubmission.
+
+    :param hepsubmission: HEPSubmission object
+    :return: stamp string
+    """
+    return '{0}-{1}'.format(hepsubmission.id, hepsubmission.last_updated)
+
+
+def get_cached_record_context(recid, version, stamp):
+    """
+    Looks up the cached page context of a record version.
+
+    :param recid: publication recid
+    :param version: version of the record
+    :param stamp: stamp of the current HEPSubmission (see get_submission_stamp)
+    :return: the context dict, or None on a miss
+    """
+    if not page_cache_enabled():
+        return None
+
+    client = get_redis_client('RECORD_PAGE_CACHE_REDIS_URL')
+    if client is None:
+        return None
+
+    try:
+        value = client.hget(_redis_key(recid), str(version))
+    except redis.RedisError as e:
+        log.warning('Unable to read page context of record {0} from cache: {1}'.format(recid, e))
+        return None
+
+    if value is None:
+        return None
+
+    try:
+        stored = json.loads(value, object_hook=_decode_object)
+        stored_stamp, ctx = stored['stamp'], stored['ctx']
+    except (TypeError, ValueError, KeyError) as e:
+        # e.g. an entry written in another format: treat it as a miss
+        log.warning('Unable to load cached page context of record {0}: {1}'.format(recid, e))
+        return None
+
+    return ctx if stored_stamp == stamp else None
+
+
+def cache_record_context(recid, version, stamp, ctx):
+    """
+    Stores the page context of a record version.
+
+    :param recid: publication recid
+    :param version: version of the record
+    :param stamp: stamp of the HEPSubmission the context was built from
+    :param ctx: the context dict
+    """
+    if not page_cache_enabled():
+        return
+
+    client = get_redis_client('RECORD_PAGE_CACHE_REDIS_URL')
+    if client is None:
+        return
+
+    stored = dict(ctx)
+    if stored.get('record') is not None:
+        # Store the record contents rather than e.g. an invenio Record object
+        stored['record'] = dict(stored['record'])
+
+    try:
+        value = json.dumps({'stamp': stamp, 'ctx': stored}, separators=(',', ':'), default=_encode_value)
+    except (TypeError, ValueError) as e:
+        log.warning('Unable to serialise page context of record {0}: {1}'.format(recid, e))
+        return
+
+    key = _redis_key(recid)
+    try:
+        pipe = client.pipeline()
+        pipe.hset(key, str(version), value)
+        pipe.expire(key, current_app.config.get('RECORD_PAGE_CACHE_TIMEOUT'))
+        pipe.execute()
+    except redis.RedisError as e:
+        log.warning('Unable to write page context of record {0} to cache: {1}'.format(recid, e))
+
+
+def invalidate_record_contexts(recids):
+    """
+    Removes the cached page contexts of all versions of the given records.
+
+    :param recids: list of publication recids
+    """
+    recids = [recid for recid in recids if recid is not None]
+    if not recids or not page_cache_enabled():
+        return
+
+    client = get_redis_client('RECORD_PAGE_CACHE_REDIS_URL')
+    if client is not None:
+        try:
+            client.delete(*[_redis_key(recid) for recid in recids])
+        except redis.RedisError as e:
+            log.warning('Unable to invalidate cached page contexts {0}: {1}'.format(recids, e))
@@ -7,6 +7,7 @@ from hepdata.modules.records.utils.doi_minter import generate_dois_for_submissio
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.submission.models import DataSubmission
 from hepdata.modules.records.utils.common import get_record_by_id
+from hepdata.modules.records.utils.page_cache import invalidate_record_contexts
 from hepdata.modules.records.utils.workflow import update_record
 from hepdata.modules.inspire_api.views import get_inspire_record_information
 from hepdata.ext.opensearch.api import index_record_ids, push_data_keywords
@@ -101,6 +102,9 @@ def update_record_info(inspire_id, send_email=False):
             record_information = get_record_by_id(publication_recid)
             notify_publication_update(hep_submission, record_information)   # send email to all participants
 
+    # Drop the cached record pages, now that the record has been reindexed
+    invalidate_record_contexts([publication_recid])
+
     return 'Success'
 
 
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Render-ready table JSON files, written when a submission is finalised.
+
+Each file holds the output of
+:func:`~hepdata.modules.records.utils.data_processing_utils.generate_table_data`
+for one data table, so that table views of finished records can be served
+straight from disk. Files are named after the ``DataResource.id`` of the table's
+data file, which never changes once a version is finished, and carry a format
+version which should be bumped whenever the output of ``generate_table_data``
+or the file layout changes.
+
+The ``values`` list is written last, with one row per line, so that a window
+of rows can be read without parsing the whole file.
+
+Compressed copies of each file are written alongside it for the encodings in
+``RENDERED_TABLE_ENCODINGS`` (gzip, plus brotli if the optional ``brotli``
+package is installed), and whole tables are served from these according to
+the request's ``Accept-Encoding`` header. Responses which merge further keys
+into a table are compressed as they are streamed instead.
+"""
+
+import gzip
+import json
+import logging
+import os
+import zlib
+
+from celery import shared_task
+from flask import Response, current_app, request, json as flask_json
+
+from hepdata.modules.records.utils.common import read_table_file
+from hepdata.modules.records.utils.data_files import get_rendered_directory_path
+from hepdata.modules.records.utils.data_processing_utils import generate_table_data
+from hepdata.modules.records.utils.table_cache import get_parsed_table
+from hepdata.modules.records.utils.table_stats import write_table_stats
+from hepdata.modules.submission.models import DataSubmission, DataResource
+
+try:
+    import brotli
+except ImportError:  # brotli is optional
+    brotli = None
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+RENDERED_TABLE_FORMAT_VERSION = 2
+CHUNK_SIZE = 64 * 1024
+VALUES_START = ',"values":[\n'
+VALUES_END = '\n]}'
+
+# Compression level for responses compressed as they are streamed
+STREAM_COMPRESSION_LEVEL = 6
+
+# File suffix of each supported content encoding, in order of preference
+ENCODING_SUFFIXES = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+
+def get_rendered_table_path(publication_recid, data_resource_id):
+    """
+    Returns the path of the render-ready JSON file for a table.
+
+    :param publication_recid: publication recid of the parent HEPSubmission
+    :param data_resource_id: id of the table's data file DataResource
+    :return: path of the file (which may not exist)
+    """
+    return os.path.join(get_rendered_directory_path(publication_recid),
+                        'table-{0}.v{1}.json'.format(data_resource_id, RENDERED_TABLE_FORMAT_VERSION))
+
+
+def find_rendered_table(publication_recid, data_resource_id):
+    """
+    Returns the path of the render-ready JSON file for a table if it exists.
+
+    :param publication_recid: publication recid of the parent HEPSubmission
+    :param data_resource_id: id of the table's data file DataResource
+    :return: path of the file, or None
+    """
+    path = get_rendered_table_path(publication_recid, data_resource_id)
+    return path if os.path.isfile(path) else None
+
+
+def get_rendered_encodings():
+    """
+    Returns the content encodings to write compressed copies of rendered tables for.
+
+    :return: list of encodings, in order of preference
+    """
+    encodings = current_app.config.get('RENDERED_TABLE_ENCODINGS', [])
+    return [encoding for encoding in ENCODING_SUFFIXES
+            if encoding in encodings and (encoding != 'br' or brotli is not None)]
+
+
+def compress(data, encoding):
+    """
+    Compresses data for a content encoding, as tightly as possible since
+    this is only done once per table.
+
+    :param data: bytes to compress
+    :param encoding: 'gzip' or 'br'
+    :return: compressed bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # A fixed mtime gives the same output for the same input
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses a stream of text for a content encoding as it is generated,
+    at a moderate level as this is done for every response.
+
+    :param chunks: iterable of strings
+    :param encoding: 'gzip' or 'br'
+    :return: generator of compressed bytes
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=STREAM_COMPRESSION_LEVEL)
+        compress_chunk, flush = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(STREAM_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress_chunk, flush = compressor.compress, compressor.flush
+
+    for chunk in chunks:
+        data = compress_chunk(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield flush()
+
+
+def write_compressed_tables(path):
+    """
+    Writes compressed copies of a render-ready JSON file.
+
+    :param path: path of the render-ready JSON file
+    """
+    with open(path, 'rb') as rendered_file:
+        data = rendered_file.read()
+
+    for encoding in get_rendered_encodings():
+        compressed_path = path + ENCODING_SUFFIXES[encoding]
+        tmp_path = compressed_path + '.tmp'
+        with open(tmp_path, 'wb') as compressed_file:
+            compressed_file.write(compress(data, encoding))
+        os.replace(tmp_path, compressed_path)
+
+
+def negotiate_encoding(path, streamed=False):
+    """
+    Chooses the content encoding to serve a render-ready JSON file with,
+    from the compressed copies on disk and the request's ``Accept-Encoding``.
+
+    :param path: path of the render-ready JSON file
+    :param streamed: whether the response is compressed as it is streamed,
+        so that any configured encoding can be used
+    :return: encoding, or None to send the file uncompressed
+    """
+    if streamed:
+        available = get_rendered_encodings()
+    else:
+        available = [encoding for encoding in ENCODING_SUFFIXES
+                     if os.path.isfile(path + ENCODING_SUFFIXES[encoding])]
+    if not available:
+        return None
+    return request.accept_encodings.best_match(available)
+
+
+def find_rendered_table_for_submission(data_recid, version):
+    """
+    Returns the path of the render-ready JSON file for a DataSubmission if it exists.
+
+    :param data_recid: id of the DataSubmission
+    :param version: version of the DataSubmission
+    :return: path of the file, or None
+    """
+    data_submission = DataSubmission.query.filter_by(id=data_recid, version=version).first()
+    if data_submission is None or data_submission.data_file is None:
+        return None
+    return find_rendered_table(data_submission.publication_recid, data_submission.data_file)
+
+
+def write_rendered_table(data_submission):
+    """
+    Generates the render-ready JSON for a DataSubmission and writes it to disk.
+
+    :param data_submission: DataSubmission object
+    :return: path of the written file, or None if the table has no data
+    """
+    data_resource = DataResource.query.filter_by(id=data_submission.data_file).first()
+    if data_resource is None:
+        return None
+
+    table_contents = get_parsed_table(data_resource.id, data_resource.file_location, read_table_file)
+    if not table_contents or 'independent_variables' not in table_contents:
+        return None
+
+    table_data = generate_table_data(table_contents)
+    values = table_data.pop('values')
+
+    path = get_rendered_table_path(data_submission.publication_recid, data_resource.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first so a partial file is never served
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as rendered_file:
+        rendered_file.write(json.dumps(table_data, separators=(',', ':'))[:-1] + VALUES_START)
+        rendered_file.write(',\n'.join(json.dumps(row, separators=(',', ':')) for row in values))
+        rendered_file.write(VALUES_END)
+    os.replace(tmp_path, path)
+
+    write_compressed_tables(path)
+
+    return path
+
+
+def delete_rendered_table(publication_recid, data_resource_id):
+    """Removes the render-ready JSON file for a table and its compressed copies, if present."""
+    path = get_rendered_table_path(publication_recid, data_resource_id)
+    for file_path in [path] + [path + suffix for suffix in ENCODING_SUFFIXES.values()]:
+        if os.path.isfile(file_path):
+            log.debug('Removing %s' % file_path)
+            os.remove(file_path)
+
+
+@shared_task
+def generate_rendered_tables(publication_recid, version, reindex_submission_id=None, index=None):
+    """
+    Writes render-ready JSON and statistics files for all tables of a submission version.
+
+    :param publication_recid: publication recid of the HEPSubmission
+    :param version: version of the HEPSubmission
+    :param reindex_submission_id: id of a HEPSubmission to reindex afterwards,
+        so that the index picks up the statistics files
+    :param index: name of the index to reindex into
+    """
+    try:
+        data_submissions = DataSubmission.query.filter_by(
+            publication_recid=publication_recid, version=version).all()
+
+        for data_submission in data_submissions:
+            try:
+                write_rendered_table(data_submission)
+            except Exception as e:
+                # Table views fall back to live generation, so just log the problem
+                log.error('Unable to write render-ready JSON for data submission {0}: {1}'.format(
+                    data_submission.id, e))
+
+            try:
+                write_table_stats(data_submission)
+            except Exception as e:
+                log.error('Unable to write statistics for data submission {0}: {1}'.format(
+                    data_submission.id, e))
+    finally:
+        if reindex_submission_id is not None:
+            from hepdata.ext.opensearch.api import reindex_batch
+            reindex_batch.delay([reindex_submission_id], index)
+
+
+def read_rendered_table_rows(path, offset=0, limit=None):
+    """
+    Reads a window of rows from a render-ready JSON file, parsing only the
+    table headers and the requested rows.
+
+    :param path: path of the render-ready JSON file
+    :param offset: index of the first row to return
+    :param limit: maximum number of rows to return, or None for all remaining rows
+    :return: dict as returned by generate_table_data, with ``values`` limited to
+        the requested rows, plus ``total_rows``, ``offset`` and ``limit``
+    """
+    with open(path, 'r') as rendered_file:
+        header = rendered_file.readline()
+        table_data = json.loads(header[:-len(VALUES_START)] + '}')
+
+        values = []
+        total_rows = 0
+        for line in rendered_file:
+            line = line.rstrip()
+            if line.startswith(']'):
+                break
+            if not line:
+                continue
+            if total_rows >= offset and (limit is None or len(values) < limit):
+                values.append(json.loads(line.rstrip(',')))
+            total_rows += 1
+
+    table_data['values'] = values
+    table_data['total_rows'] = total_rows
+    table_data['offset'] = offset
+    table_data['limit'] = limit
+    return table_data
+
+
+def rendered_table_response(path, extra=None, encoding=None):
+    """
+    Streams a render-ready JSON file as a response, optionally merging in
+    further top-level keys without parsing the file.
+
+    :param path: path of the render-ready JSON file
+    :param extra: dict of additional keys to include in the JSON object, unless
+        the file already has them
+    :param encoding: content encoding to send the response with (see
+        :func:`negotiate_encoding`). The compressed copy is sent if there are no
+        ``extra`` keys, otherwise the response is compressed as it is streamed.
+    :return: flask Response
+    """
+    if encoding and not extra:
+        compressed_path = path + ENCODING_SUFFIXES[encoding]
+
+        def generate_compressed():
+            with open(compressed_path, 'rb') as compressed_file:
+                chunk = compressed_file.read(CHUNK_SIZE)
+                while chunk:
+                    yield chunk
+                    chunk = compressed_file.read(CHUNK_SIZE)
+
+        response = Response(generate_compressed(), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.content_length = os.path.getsize(compressed_path)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def generate():
+        with open(path, 'r') as rendered_file:
+            # The first line holds every key of the stored object except the values
+            header = rendered_file.readline()
+            if extra:
+                # Splice the extra keys into the start of the stored object,
+                # leaving out those already in it (the stored values win)
+                table_keys = json.loads(header[:-len(VALUES_START)] + '}').keys()
+                prefix = {key: value for key, value in extra.items() if key not in table_keys}
+                if prefix:
+                    yield flask_json.dumps(prefix).rstrip()[:-1] + ','
+                    header = header[1:]
+            yield header
+
+            chunk = rendered_file.read(CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = rendered_file.read(CHUNK_SIZE)
+
+    if encoding:
+        response = Response(compress_stream(generate(), encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = Response(generate(), mimetype='application/json')
+    # Other clients may be sent a compressed version of the same file
+    response.vary.add('Accept-Encoding')
+    return response
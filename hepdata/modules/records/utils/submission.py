@@ -37,7 +37,7 @@ from hepdata_converter_ws_client import get_data_size
 from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE, CFG_SUPPORTED_FORMATS, HEPDATA_DOI_PREFIX
 from hepdata.ext.opensearch.admin_view.api import AdminIndexer
 from hepdata.ext.opensearch.api import get_records_matching_field, \
-    delete_item_from_index, index_record_ids, push_data_keywords, reindex_batch
+    delete_item_from_index, index_record_ids, push_data_keywords
 from hepdata.modules.converter import prepare_data_folder
 from hepdata.modules.converter.tasks import convert_and_store
 from hepdata.modules.email.api import send_finalised_email
@@ -53,6 +53,10 @@ from hepdata.modules.records.utils.common import get_or_create
 from hepdata.modules.records.utils.data_files import get_data_path_for_record, \
     cleanup_old_files, delete_all_files, delete_packaged_file, \
     find_submission_data_file_path
+from hepdata.modules.records.utils.rendered_tables import generate_rendered_tables, delete_rendered_table
+from hepdata.modules.records.utils.page_cache import invalidate_record_contexts
+from hepdata.modules.records.utils.table_cache import invalidate_tables
+from hepdata.modules.records.utils.table_stats import delete_table_stats
 from hepdata.modules.records.utils.doi_minter import reserve_dois_for_data_submissions, reserve_doi_for_hepsubmission, \
     generate_dois_for_submission, reserve_dois_for_resources
 from hepdata.modules.records.utils.validators import get_full_submission_validator
@@ -97,6 +101,7 @@ def remove_submission(record_id, version=1):
 
         admin_idx = AdminIndexer()
         admin_idx.delete_by_id(*[s.id for s in hepdata_submissions])
+        invalidate_record_contexts([record_id])
 
         submissions = DataSubmission.query.filter_by(
             publication_recid=record_id, version=version).all()
@@ -115,6 +120,8 @@ def remove_submission(record_id, version=1):
             db.session.delete(submission)
 
             if resource:
+                delete_rendered_table(record_id, resource.id)
+                delete_table_stats(record_id, resource.id)
                 db.session.delete(resource)
 
         if version == 1:
@@ -175,12 +182,15 @@ def cleanup_submission(recid, version, to_keep):
         publication_recid=recid, version=version).all()
 
     try:
+        removed_data_files = []
         for data_submission in data_submissions:
 
             if not (data_submission.name in to_keep):
+                removed_data_files.append(data_submission.data_file)
                 db.session.delete(data_submission)
 
         db.session.commit()
+        invalidate_tables(removed_data_files)
     except Exception as e:
         logging.error(e)
         db.session.rollback()
@@ -752,6 +762,9 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
                     delete_item_from_index(record["_id"],
                                            doc_type=CFG_DATA_TYPE, parent=record["_source"]["related_publication"])
 
+        # Drop any tables cached while the submission was being reviewed
+        invalidate_tables([submission.data_file for submission in submissions])
+
         current_time = "{:%Y-%m-%d %H:%M:%S}".format(datetime.utcnow())
 
         for submission in submissions:
@@ -795,6 +808,10 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
 
             db.session.commit()
 
+            # Drop cached pages of this record and of those listing it as related to them
+            invalidate_record_contexts([hep_submission.publication_recid] +
+                                       [related.related_recid for related in hep_submission.related_recids])
+
             create_celery_app(current_app)
 
             # only mint DOIs if not testing.
@@ -802,8 +819,12 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
                 generate_dois_for_submission.delay(inspire_id=hep_submission.inspire_id, version=version)
                 log.info("Generated DOIs for ins{0}".format(hep_submission.inspire_id))
 
-            # Reindex everything asynchronously to avoid blocking UI for large submissions.
-            reindex_batch.delay([hep_submission.id], current_app.config['OPENSEARCH_INDEX'])
+            # Write render-ready JSON and statistics for the tables of the finished version,
+            # then reindex everything (including the statistics). Both are asynchronous
+            # to avoid blocking UI for large submissions.
+            generate_rendered_tables.delay(hep_submission.publication_recid, version,
+                                           reindex_submission_id=hep_submission.id,
+                                           index=current_app.config['OPENSEARCH_INDEX'])
 
             try:
                 admin_indexer = AdminIndexer()
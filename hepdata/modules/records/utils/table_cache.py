@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Two-tier cache of parsed data table files.
+
+Entries are keyed by ``DataResource.id`` and tagged with a fingerprint of the
+data file (modification time and size), so an entry is never served for a file
+which has changed on disk. Each entry can hold several named fields (e.g. the
+parsed table), which are all dropped together when the fingerprint changes or
+the entry is invalidated.
+
+The first tier is an in-process LRU bounded by ``TABLE_CACHE_LOCAL_MAX_BYTES``;
+the second is a Redis hash per resource shared between web nodes, using
+``TABLE_CACHE_REDIS_URL`` (by default the same server as ``CACHE_REDIS_URL``).
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import redis
+from flask import current_app
+
+from hepdata.utils.redis_client import get_redis_client
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+TABLE_FIELD = 'table'
+
+
+class LocalTableCache(object):
+    """
+    In-process LRU cache of serialised table fields, bounded by the
+    total number of bytes stored rather than the number of entries.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, resource_id, fingerprint, field):
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            if entry is None or entry['fingerprint'] != fingerprint:
+                return None
+            self._entries.move_to_end(resource_id)
+            return entry['fields'].get(field)
+
+    def set(self, resource_id, fingerprint, field, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            if entry is None or entry['fingerprint'] != fingerprint:
+                self._remove(resource_id)
+                entry = {'fingerprint': fingerprint, 'fields': {}, 'size': 0}
+                self._entries[resource_id] = entry
+
+            previous = entry['fields'].get(field)
+            if previous is not None:
+                entry['size'] -= len(previous)
+                self.current_bytes -= len(previous)
+
+            entry['fields'][field] = value
+            entry['size'] += len(value)
+            self.current_bytes += len(value)
+            self._entries.move_to_end(resource_id)
+
+            # Evict least recently used entries until we are back within budget
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def delete(self, resource_id):
+        with self._lock:
+            self._remove(resource_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, resource_id):
+        entry = self._entries.pop(resource_id, None)
+        if entry is not None:
+            self.current_bytes -= entry['size']
+
+
+_local_cache = None
+
+
+def get_local_cache():
+    """Returns the in-process cache, creating it on first use."""
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = LocalTableCache(current_app.config.get('TABLE_CACHE_LOCAL_MAX_BYTES', 0))
+    return _local_cache
+
+
+def cache_enabled():
+    return current_app.config.get('TABLE_CACHE_ENABLED', False)
+
+
+def _redis_key(resource_id):
+    return '{0}table::{1}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''), resource_id)
+
+
+def file_fingerprint(file_location):
+    """
+    Generates a fingerprint for a data file from its modification time and size.
+
+    :param file_location: location of the data file on disk
+    :return: fingerprint string, or None if the file cannot be read
+    """
+    try:
+        stat = os.stat(file_location)
+    except OSError:
+        return None
+    return '{0}-{1}'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def get_cached_field(resource_id, fingerprint, field):
+    """
+    Looks up a field for a data resource, first in the local tier and
+    then in Redis (populating the local tier on a Redis hit).
+
+    :param resource_id: DataResource.id of the data file
+    :param fingerprint: current fingerprint of the data file
+    :param field: name of the cached field
+    :return: the cached bytes, or None on a miss
+    """
+    if not cache_enabled() or fingerprint is None:
+        return None
+
+    local_cache = get_local_cache()
+    value = local_cache.get(resource_id, fingerprint, field)
+    if value is not None:
+        return value
+
+    client = get_redis_client('TABLE_CACHE_REDIS_URL')
+    if client is not None:
+        try:
+            stored_fingerprint, value = client.hmget(_redis_key(resource_id), 'fingerprint', field)
+        except redis.RedisError as e:
+            log.warning('Unable to read table {0} from cache: {1}'.format(resource_id, e))
+            return None
+
+        if value is not None and stored_fingerprint is not None \
+                and stored_fingerprint.decode() == fingerprint:
+            local_cache.set(resource_id, fingerprint, field, value)
+            return value
+
+    return None
+
+
+def set_cached_field(resource_id, fingerprint, field, value):
+    """
+    Stores a field for a data resource in both tiers. Any fields stored
+    under a different fingerprint are discarded.
+
+    :param resource_id: DataResource.id of the data file
+    :param fingerprint: current fingerprint of the data file
+    :param field: name of the cached field
+    :param value: bytes to store
+    """
+    if not cache_enabled() or fingerprint is None:
+        return
+
+    get_local_cache().set(resource_id, fingerprint, field, value)
+
+    client = get_redis_client('TABLE_CACHE_REDIS_URL')
+    if client is not None:
+        key = _redis_key(resource_id)
+        try:
+            stored_fingerprint = client.hget(key, 'fingerprint')
+            pipe = client.pipeline()
+            if stored_fingerprint is not None and stored_fingerprint.decode() != fingerprint:
+                pipe.delete(key)
+            pipe.hset(key, mapping={'fingerprint': fingerprint, field: value})
+            pipe.expire(key, current_app.config.get('TABLE_CACHE_TIMEOUT'))
+            pipe.execute()
+        except redis.RedisError as e:
+            log.warning('Unable to write table {0} to cache: {1}'.format(resource_id, e))
+
+
+def invalidate_tables(resource_ids):
+    """
+    Removes all cached fields for the given data resources.
+
+    Only the local tier of the calling process can be cleared, but entries
+    in other processes are fingerprinted so can never be served for a
+    changed file, and are evicted as the LRU turns over.
+
+    :param resource_ids: list of DataResource.id values
+    """
+    resource_ids = [r for r in resource_ids if r is not None]
+    if not resource_ids or not cache_enabled():
+        return
+
+    local_cache = get_local_cache()
+    for resource_id in resource_ids:
+        local_cache.delete(resource_id)
+
+    client = get_redis_client('TABLE_CACHE_REDIS_URL')
+    if client is not None:
+        try:
+            client.delete(*[_redis_key(r) for r in resource_ids])
+        except redis.RedisError as e:
+            log.warning('Unable to invalidate cached tables {0}: {1}'.format(resource_ids, e))
+
+
+def get_parsed_table(resource_id, file_location, parse):
+    """
+    Returns the parsed contents of a data file, using the cache if possible.
+
+    A fresh copy is returned on every call, as callers are free to modify
+    the table contents.
+
+    :param resource_id: DataResource.id of the data file
+    :param file_location: location of the data file on disk
+    :param parse: function taking the file location and returning the parsed table
+    :return: the parsed table contents
+    """
+    fingerprint = file_fingerprint(file_location)
+    cached = get_cached_field(resource_id, fingerprint, TABLE_FIELD)
+    if cached is not None:
+        return json.loads(cached)
+
+    table_contents = parse(file_location)
+
+    if table_contents:
+        try:
+            value = json.dumps(table_contents, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            # e.g. dates parsed from the YAML: the table is returned uncached
+            log.warning('Unable to serialise table {0} for cache: {1}'.format(resource_id, e))
+        else:
+            set_cached_field(resource_id, fingerprint, TABLE_FIELD, value)
+
+    return table_contents
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Per-column summary statistics of data tables.
+
+The statistics of a table (its number of rows and, for each variable, the
+range of its values, the number of NaN and infinite values, and for
+independent variables whether the bins are contiguous) let clients decide
+what to fetch without downloading the whole table. They are written to a
+small JSON file next to the render-ready table JSON when a submission is
+finalised, and computed on demand for other tables. Only the written files
+are used when indexing tables.
+"""
+
+import json
+import logging
+import math
+import os
+
+from hepdata.modules.records.utils.common import read_table_file
+from hepdata.modules.records.utils.data_files import get_rendered_directory_path
+from hepdata.modules.records.utils.data_processing_utils import get_table_row_count
+from hepdata.modules.records.utils.table_cache import get_parsed_table
+from hepdata.modules.submission.models import DataResource
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+TABLE_STATS_FORMAT_VERSION = 1
+
+
+def classify_value(value):
+    """
+    Converts a table value to a float, classifying special values.
+
+    :param value: value from a parsed table (usually a string)
+    :return: tuple of (float or None, one of 'number', 'nan', 'inf' or None if not numeric)
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None, None
+    if math.isnan(number):
+        return None, 'nan'
+    if math.isinf(number):
+        return None, 'inf'
+    return number, 'number'
+
+
+def get_column_stats(values, keys):
+    """
+    Summarises a column of value dicts.
+
+    :param values: list of value dicts from a table variable
+    :param keys: keys of each value dict to include, e.g. ('value', 'low', 'high')
+    :return: dict with ``min``, ``max`` (None if there are no numeric values),
+        ``nan_count`` and ``inf_count`` (numbers of values with a NaN or infinite entry)
+    """
+    minimum = maximum = None
+    nan_count = inf_count = 0
+
+    for cell in values:
+        kinds = set()
+        for key in keys:
+            if key in cell:
+                number, kind = classify_value(cell[key])
+                kinds.add(kind)
+                if number is not None:
+                    if minimum is None or number < minimum:
+                        minimum = number
+                    if maximum is None or number > maximum:
+                        maximum = number
+        nan_count += 'nan' in kinds
+        inf_count += 'inf' in kinds
+
+    return {'min': minimum, 'max': maximum, 'nan_count': nan_count, 'inf_count': inf_count}
+
+
+def bins_are_contiguous(values):
+    """
+    Checks whether the bins of an independent variable cover a range without
+    gaps or overlaps. Repeated bins (as in tables with several independent
+    variables) are only counted once.
+
+    :param values: list of value dicts of an independent variable
+    :return: True or False, or None if the variable is not binned
+    """
+    bins = set()
+    for cell in values:
+        if 'low' not in cell or 'high' not in cell:
+            return None
+        low = classify_value(cell['low'])[0]
+        high = classify_value(cell['high'])[0]
+        if low is None or high is None:
+            return False
+        bins.add((min(low, high), max(low, high)))
+
+    bins = sorted(bins)
+    for (_, high), (next_low, _) in zip(bins, bins[1:]):
+        if not math.isclose(high, next_low, rel_tol=1e-9, abs_tol=1e-12):
+            return False
+    return bool(bins)
+
+
+def compute_table_stats(table_contents):
+    """
+    Computes the statistics of a parsed data table.
+
+    :param table_contents: parsed data table (not modified)
+    :return: dict with ``row_count`` and a list of column statistics for
+        each of ``independent_variables`` and ``dependent_variables``
+    """
+    stats = {
+        'row_count': get_table_row_count(table_contents),
+        'independent_variables': [],
+        'dependent_variables': []
+    }
+
+    for x_axis in table_contents.get('independent_variables') or []:
+        values = x_axis.get('values') or []
+        header = x_axis.get('header') or {}
+        column = {'name': header.get('name'), 'units': header.get('units')}
+        column.update(get_column_stats(values, ('value', 'low', 'high')))
+        column['contiguous'] = bins_are_contiguous(values)
+        column['binned'] = column['contiguous'] is not None
+        stats['independent_variables'].append(column)
+
+    for y_axis in table_contents.get('dependent_variables') or []:
+        header = y_axis.get('header') or {}
+        column = {'name': header.get('name'), 'units': header.get('units')}
+        column.update(get_column_stats(y_axis.get('values') or [], ('value',)))
+        stats['dependent_variables'].append(column)
+
+    return stats
+
+
+def get_table_stats_path(publication_recid, data_resource_id):
+    """
+    Returns the path of the statistics file for a table.
+
+    :param publication_recid: publication recid of the parent HEPSubmission
+    :param data_resource_id: id of the table's data file DataResource
+    :return: path of the file (which may not exist)
+    """
+    return os.path.join(get_rendered_directory_path(publication_recid),
+                        'stats-{0}.v{1}.json'.format(data_resource_id, TABLE_STATS_FORMAT_VERSION))
+
+
+def _load_table_stats(data_resource, use_cache=True):
+    if use_cache:
+        table_contents = get_parsed_table(data_resource.id, data_resource.file_location, read_table_file)
+    else:
+        table_contents = read_table_file(data_resource.file_location)
+    if not table_contents or 'dependent_variables' not in table_contents:
+        return None
+    return compute_table_stats(table_contents)
+
+
+def write_table_stats(data_submission):
+    """
+    Computes the statistics of a DataSubmission and writes them to disk.
+
+    The data file is parsed directly rather than through the table cache,
+    as this is done for every table of a submission (or of all submissions,
+    when backfilling), most of which will not be viewed soon.
+
+    :param data_submission: DataSubmission object
+    :return: path of the written file, or None if the table has no data
+    """
+    data_resource = DataResource.query.filter_by(id=data_submission.data_file).first()
+    if data_resource is None:
+        return None
+
+    stats = _load_table_stats(data_resource, use_cache=False)
+    if stats is None:
+        return None
+
+    path = get_table_stats_path(data_submission.publication_recid, data_resource.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as stats_file:
+        json.dump(stats, stats_file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def read_table_stats(data_submission):
+    """
+    Returns the statistics of a DataSubmission from the file written at
+    finalisation, without computing them if there is no file.
+
+    :param data_submission: DataSubmission object
+    :return: dict as returned by compute_table_stats, or None if there is no file
+    """
+    if data_submission.data_file is None:
+        return None
+
+    path = get_table_stats_path(data_submission.publication_recid, data_submission.data_file)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'r') as stats_file:
+        return json.load(stats_file)
+
+
+def get_table_stats(data_submission):
+    """
+    Returns the statistics of a DataSubmission, from the file written at
+    finalisation if there is one, otherwise computed from the data file.
+
+    :param data_submission: DataSubmission object
+    :return: dict as returned by compute_table_stats, or an empty dict if the table has no data
+    """
+    if data_submission.data_file is None:
+        return {}
+
+    stats = read_table_stats(data_submission)
+    if stats is not None:
+        return stats
+
+    data_resource = DataResource.query.filter_by(id=data_submission.data_file).first()
+    if data_resource is None:
+        return {}
+
+    return _load_table_stats(data_resource) or {}
+
+
+def delete_table_stats(publication_recid, data_resource_id):
+    """Removes the statistics file for a table, if present."""
+    path = get_table_stats_path(publication_recid, data_resource_id)
+    if os.path.isfile(path):
+        log.debug('Removing %s' % path)
+        os.remove(path)
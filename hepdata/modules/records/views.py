@@ -36,7 +36,6 @@ from flask_login import login_required, login_user
 from flask import Blueprint, send_file, abort, redirect, current_app, url_for
 from flask_security.utils import verify_password
 from sqlalchemy import or_, func
-from sqlalchemy.orm import joinedload
 import yaml
 from yaml import CBaseLoader as Loader
 
@@ -52,16 +51,25 @@ from hepdata.modules.records.api import request, determine_user_privileges, rend
     render_record, current_user, db, jsonify, get_user_from_id, get_record_contents, extract_journal_info, \
     user_allowed_to_perform_action, NoResultFound, OrderedDict, query_messages_for_data_review, returns_json, \
     process_payload, has_upload_permissions, has_coordinator_permissions, create_new_version, format_resource, \
-    should_send_json_ld, JSON_LD_MIMETYPES, get_resource_mimetype, get_table_data_list
+    should_send_json_ld, JSON_LD_MIMETYPES, get_resource_mimetype, get_table_data_list, load_table_details
 from hepdata.modules.submission.api import get_submission_participants_for_record, get_or_create_submission_observer
 from hepdata.modules.submission.models import HEPSubmission, DataSubmission, \
     DataResource, DataReview, Message, Question, SubmissionObserver
 from hepdata.modules.records.utils.common import get_record_by_id, \
-    default_time, IMAGE_TYPES, decode_string, file_size_check, generate_license_data_by_id, load_table_data
+    default_time, IMAGE_TYPES, decode_string, file_size_check, generate_license_data_by_id, generate_license_data, \
+    load_table_data, read_table_file
 from hepdata.modules.records.utils.data_processing_utils import \
-    generate_table_headers, process_ctx, generate_table_data
+    generate_table_headers, process_ctx, generate_table_data, get_table_row_count
+from hepdata.modules.records.utils.decimation import get_decimated_table_data, round_max_points, MIN_MAX_POINTS
+from hepdata.modules.records.utils.http_cache import conditional_response, get_finished_max_age, \
+    get_table_validators, make_etag
+from hepdata.modules.records.utils.page_cache import invalidate_record_contexts
+from hepdata.modules.records.utils.rendered_tables import find_rendered_table, \
+    find_rendered_table_for_submission, negotiate_encoding, read_rendered_table_rows, rendered_table_response
 from hepdata.modules.records.utils.submission import create_data_review, \
     get_or_create_hepsubmission
+from hepdata.modules.records.utils.table_cache import file_fingerprint, get_parsed_table
+from hepdata.modules.records.utils.table_stats import get_table_stats
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.records.utils.workflow import \
     update_action_for_submission_participant
@@ -293,13 +301,105 @@ def get_table_data(data_recid, version):
     """
     Gets the table data only for a specific recid/version.
 
+    The optional ``offset`` and ``limit`` query parameters select a window of
+    rows, in which case only those rows are returned, along with the headers
+    and the total number of rows in ``total_rows``. Alternatively, the optional
+    ``max_points`` query parameter returns the table decimated for plotting to
+    at most that many rows (rounded down to one of a few fixed values).
+
+    Whole tables served from the render-ready JSON are sent precompressed if
+    the client accepts one of the stored encodings.
+
+    Responses have an ETag derived from the table's data file, so repeated
+    requests with ``If-None-Match`` get ``304 Not Modified``, and tables of
+    finished versions can be cached for ``HTTP_CACHE_FINISHED_MAX_AGE`` seconds.
+
     :param data_recid: The data recid used for retrieval
     :param version: The data version to retrieve
     :return:
     """
-    # Run the function to load table data and return
-    table_contents = load_table_data(data_recid, version)
-    return jsonify(generate_table_data(table_contents) if 'independent_variables' in table_contents else table_contents)
+    offset = request.args.get('offset', type=int)
+    limit = request.args.get('limit', type=int)
+    paginate = offset is not None or limit is not None
+    if paginate:
+        offset = offset or 0
+        if offset < 0 or (limit is not None and limit < 0):
+            return jsonify({"error": "offset and limit must not be negative."}), 400
+
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None:
+        if paginate:
+            return jsonify({"error": "max_points cannot be combined with offset and limit."}), 400
+        if max_points < MIN_MAX_POINTS:
+            return jsonify({"error": "max_points must be at least {0}.".format(MIN_MAX_POINTS)}), 400
+        max_points = round_max_points(max_points)
+
+    # Serve the render-ready JSON written at finalisation if there is one,
+    # compressed according to Accept-Encoding when the whole table is requested
+    rendered_path = find_rendered_table_for_submission(data_recid, version) if max_points is None else None
+    encoding = negotiate_encoding(rendered_path) if rendered_path and not paginate else None
+
+    def generate():
+        if max_points is not None:
+            return jsonify(get_decimated_table_data(data_recid, version, max_points))
+
+        if rendered_path:
+            if paginate:
+                return jsonify(read_rendered_table_rows(rendered_path, offset, limit))
+            return rendered_table_response(rendered_path, encoding=encoding)
+
+        # Run the function to load table data and return
+        table_contents = load_table_data(data_recid, version)
+        if 'independent_variables' not in table_contents:
+            return jsonify(table_contents)
+
+        if paginate:
+            table_data = generate_table_data(table_contents, offset=offset, limit=limit)
+            table_data['total_rows'] = get_table_row_count(table_contents)
+            table_data['offset'] = offset
+            table_data['limit'] = limit
+            return jsonify(table_data)
+
+        return jsonify(generate_table_data(table_contents))
+
+    validators = get_table_validators(data_recid, version)
+    if validators is None:
+        return generate()
+
+    # The ETag is per URL, so the row window and max_points are not part of it,
+    # but each content encoding is a different representation
+    etag, last_modified, finished = validators
+    if encoding:
+        etag = make_etag(etag, encoding)
+    return conditional_response(etag, generate, last_modified=last_modified,
+                                max_age=get_finished_max_age() if finished else None)
+
+
+@blueprint.route('/data/<int:data_recid>/<int:version>/stats', methods=['GET'])
+def get_table_stats_json(data_recid, version):
+    """
+    Gets summary statistics of a table without its data: the number of rows
+    and, for each variable, the range of its values, the number of NaN and
+    infinite values, and for independent variables whether the bins are
+    contiguous.
+
+    :param data_recid: The data recid used for retrieval
+    :param version: The data version to retrieve
+    :return:
+    """
+    def generate():
+        data_submission = DataSubmission.query.filter_by(id=data_recid, version=version).first()
+        if data_submission is None:
+            return jsonify({})
+        return jsonify(get_table_stats(data_submission))
+
+    validators = get_table_validators(data_recid, version)
+    if validators is None:
+        return generate()
+
+    etag, last_modified, finished = validators
+    return conditional_response(make_etag(etag, 'stats'), generate, last_modified=last_modified,
+                                max_age=get_finished_max_age() if finished else None)
 
 
 @blueprint.route('/data/<int:recid>/<int:data_recid>/<int:version>/')
@@ -320,6 +420,7 @@ def get_table_details(recid, data_recid, version, load_all=1):
 
     version_count, version_count_all = get_version_count(recid, key_verified)
 
+    explicit_version = bool(version)
     if not version:
         # If version not given explicitly, take to be latest allowed version (or 1 if there are no allowed versions).
         version = version_count if version_count else 1
@@ -328,17 +429,15 @@ def get_table_details(recid, data_recid, version, load_all=1):
     if version_count < version_count_all and version == version_count_all:
         abort(403)
 
-    # joinedload allows query of data in another table without a second database access.
-    datasub_query = DataSubmission.query.options(joinedload(DataSubmission.related_tables)).filter_by(id=data_recid, publication_recid=recid, version=version)
+    # Load the table with its data file, license, keywords, resources, related tables and review up front.
+    table_details = load_table_details(recid, data_recid, version)
     table_contents = {}
 
-    if datasub_query.count() > 0:
-        datasub_record = datasub_query.one()
-        data_query = db.session.query(DataResource).filter(
-            DataResource.id == datasub_record.data_file)
+    if table_details:
+        datasub_record, data_record, license_record, data_review_record, has_review_messages = table_details
 
-        if data_query.count() > 0:
-            data_record = data_query.one()
+        if data_record:
+            data_resource_id = data_record.id
             file_location = data_record.file_location
 
             size_check = file_size_check(file_location, load_all)
@@ -346,7 +445,7 @@ def get_table_details(recid, data_recid, version, load_all=1):
             table_contents["name"] = datasub_record.name
             table_contents["title"] = datasub_record.description
             table_contents["keywords"] = datasub_record.keywords
-            table_contents["table_license"] = generate_license_data_by_id(data_record.file_license)
+            table_contents["table_license"] = generate_license_data(license_record)
             table_contents["related_tables"] = get_table_data_list(datasub_record, "related")
             table_contents["related_to_this"] = get_table_data_list(datasub_record, "related_to_this")
             table_contents["resources"] = get_resource_data(datasub_record)
@@ -402,24 +501,53 @@ def get_table_details(recid, data_recid, version, load_all=1):
         return jsonify(table_contents)
 
     table_contents["review"] = {}
-
-    data_review_record = create_data_review(data_recid, recid, version)
     table_contents["review"]["review_flag"] = data_review_record.status if data_review_record else "todo"
-    table_contents["review"]["messages"] = len(data_review_record.messages) > 0 if data_review_record else False
-
-    # translate the table_contents to an easy to render format of the qualifiers (with colspan),
-    # x and y headers (should not require a colspan)
-    # values, that also encompass the errors
+    table_contents["review"]["messages"] = bool(has_review_messages) if data_review_record else False
 
-    fixed_table = generate_table_headers(table_contents)
+    # Create the review if there isn't one yet, also when the client's cached copy is still
+    # valid. Committing the new review expires the loaded objects, which are reloaded if used.
+    if not data_review_record:
+        db.session.add(DataReview(publication_recid=recid, data_recid=data_recid, version=version))
+        db.session.commit()
 
-    # If the size is below the threshold, we just pass the table contents now
+    # Serve the render-ready JSON written at finalisation if the whole table is wanted,
+    # compressed according to Accept-Encoding
+    rendered_path = None
     if size_check["status"] or load_all == 1:
-        table_data = generate_table_data(load_table_data(data_recid, version))
-        # Combine the dictionaries if required
-        fixed_table = {**fixed_table, **table_data}
+        rendered_path = find_rendered_table(recid, data_resource_id)
+    encoding = negotiate_encoding(rendered_path, streamed=True) if rendered_path else None
+
+    def generate():
+        # translate the table_contents to an easy to render format of the qualifiers (with colspan),
+        # x and y headers (should not require a colspan)
+        # values, that also encompass the errors
+
+        fixed_table = generate_table_headers(table_contents)
 
-    return jsonify(fixed_table)
+        # If the size is below the threshold, we just pass the table contents now
+        if size_check["status"] or load_all == 1:
+            if rendered_path:
+                return rendered_table_response(rendered_path, extra=fixed_table, encoding=encoding)
+
+            table_data = generate_table_data(get_parsed_table(data_resource_id, file_location, read_table_file))
+            # Combine the dictionaries if required
+            fixed_table = {**fixed_table, **table_data}
+
+        return jsonify(fixed_table)
+
+    # Only finished versions are cached, as the review status of other versions can change at any time
+    hepsubmission = get_latest_hepsubmission(publication_recid=recid, version=version)
+    if hepsubmission is None or hepsubmission.overall_status != 'finished':
+        return generate()
+
+    etag = make_etag('details', recid, data_recid, version, load_all, data_resource_id,
+                     file_fingerprint(file_location), hepsubmission.last_updated,
+                     table_contents["review"]["review_flag"], table_contents["review"]["messages"])
+    if encoding:
+        etag = make_etag(etag, encoding)
+    # Without an explicit version, the version served depends on the user's permissions
+    return conditional_response(etag, generate, last_modified=hepsubmission.last_updated,
+                                max_age=get_finished_max_age() if explicit_version else None)
 
 
 @blueprint.route('/coordinator/view/<int:recid>', methods=['GET', ])
@@ -1188,6 +1316,8 @@ def add_resource(type, identifier, version):
                 except:
                     log.error('Failed to reindex {0}'.format(recid))
 
+                invalidate_record_contexts([recid])
+
                 if inspire_id and type == 'submission' and submission.overall_status == 'finished':
                     return redirect('/record/ins{0}'.format(inspire_id))
                 else:
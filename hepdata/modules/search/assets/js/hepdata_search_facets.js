@@ -222,7 +222,7 @@ HEPDATA.hepdata_search_facets = (function () {
         datumTokenizer: Bloodhound.tokenizers.whitespace,
         queryTokenizer: Bloodhound.tokenizers.whitespace,
         remote: {
-            url: '/search/authors?q=%QUERY',
+            url: '/search/authors/suggest?q=%QUERY',
             wildcard: '%QUERY',
             transform: function (json) {
                 return $.map(json.results, function (author) {
@@ -19,6 +19,9 @@
 
 OPENSEARCH_MAX_RESULT_WINDOW = 10000  # default OpenSearch value
 LIMIT_MAX_RESULTS_PER_PAGE = 100  # maximum value of 'size' parameter
+ALL_IDS_BATCH_SIZE = 1000  # rows/hits fetched at a time when streaming all ids
+AUTHOR_SUGGEST_DEFAULT_SIZE = 10  # default number of author suggestions
+AUTHOR_SUGGEST_MAX_SIZE = 20  # maximum value of 'size' parameter for author suggestions
 
 HEPDATA_CFG_DEFAULT_RESULTS_PER_PAGE = 10
 HEPDATA_CFG_FACETS = ['author',
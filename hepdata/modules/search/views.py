@@ -17,20 +17,23 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 #
 """HEPData Search Views."""
+import base64
+import binascii
 import datetime
 import json
 import sys
 
-from flask import Blueprint, request, render_template, jsonify
+from flask import Blueprint, Response, current_app, request, render_template, jsonify, stream_with_context
 from hepdata.config import CFG_DATA_KEYWORDS
 from hepdata.ext.opensearch.api import search as os_search, \
-    search_authors as os_search_authors, get_all_ids as os_get_all_ids
+    search_authors as os_search_authors, suggest_authors as os_suggest_authors, \
+    iter_all_ids as os_iter_all_ids
 from hepdata.modules.records.utils.common import decode_string
-from hepdata.modules.records.api import get_all_ids as db_get_all_ids
+from hepdata.modules.records.api import iter_all_ids as db_iter_all_ids
 from hepdata.utils.session import get_session_item, set_session_item
 from hepdata.utils.url import modify_query
 from .config import HEPDATA_CFG_DEFAULT_RESULTS_PER_PAGE, HEPDATA_CFG_FACETS
-from .config import LIMIT_MAX_RESULTS_PER_PAGE
+from .config import LIMIT_MAX_RESULTS_PER_PAGE, AUTHOR_SUGGEST_DEFAULT_SIZE, AUTHOR_SUGGEST_MAX_SIZE
 
 blueprint = Blueprint('os_search',
                       __name__,
@@ -198,6 +201,40 @@ def parse_query_parameters(request_args):
     }
 
 
+def encode_cursor(cursor):
+    """
+    Encode the cursor of the next page of search results as an opaque token.
+
+    :param cursor: [dict] cursor returned by the search, or None
+    :return: [string] URL-safe token, or None on the last page
+    """
+    if cursor is None:
+        return None
+    token = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token from the request. An empty token starts from
+    the first page.
+
+    :param token: [string] token returned as ``next_cursor``
+    :return: [dict] cursor to pass to the search
+    :raises ValueError: if the token is not valid
+    """
+    if not token:
+        return {}
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(cursor, dict) or not isinstance(cursor.get('pit'), str) \
+            or not isinstance(cursor.get('after'), list):
+        raise ValueError('Invalid cursor')
+    return cursor
+
+
 @blueprint.route('/authors', methods=['GET', 'POST'])
 def search_authors():
     author_name = request.args.get('q', '')
@@ -205,6 +242,30 @@ def search_authors():
     return jsonify({'results': results})
 
 
+@blueprint.route('/authors/suggest', methods=['GET'])
+def suggest_authors():
+    """
+    Suggest authors whose last or first name starts with the ``q`` parameter,
+    for autocompletion. Returns at most ``size`` authors, plus the delay in
+    milliseconds that clients should wait after a keystroke before asking
+    for suggestions (``debounce_ms``), if configured.
+    """
+    prefix = request.args.get('q', '')
+    try:
+        size = int(request.args.get('size', AUTHOR_SUGGEST_DEFAULT_SIZE))
+    except ValueError:
+        size = AUTHOR_SUGGEST_DEFAULT_SIZE
+    size = min(max(size, 1), AUTHOR_SUGGEST_MAX_SIZE)
+
+    response = {'results': os_suggest_authors(prefix, size=size)}
+
+    debounce_ms = current_app.config.get('AUTHOR_SUGGEST_DEBOUNCE_MS')
+    if debounce_ms is not None:
+        response['debounce_ms'] = debounce_ms
+
+    return jsonify(response)
+
+
 def get_facet(facets, facet_name):
     for facet in facets:
         if facet['printable_name'] is facet_name:
@@ -236,18 +297,36 @@ def search():
     Parse the request, perform search and show the results.
     """
     query_params = parse_query_parameters(request.args)
+    json_format = ('format' in request.args and request.args['format'] == 'json') \
+        or 'json' in request.headers.get('accept', '')
+
+    # JSON clients can page with a cursor (repeating the same query
+    # parameters with each next_cursor) instead of a page number
+    cursor = None
+    if json_format and 'cursor' in request.args:
+        try:
+            cursor = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    # JSON clients which do not need the facets (e.g. when paging through
+    # results) can skip computing them with facets=false
+    facets = not json_format or 'facets' not in request.args or bool(_get_bool_parameter(request, 'facets'))
 
     query_result = os_search(query_params['q'],
                              filters=query_params['filters'],
                              size=query_params['size'],
                              sort_field=query_params['sorting_field'],
                              sort_order=query_params['sorting_order'],
-                             offset=query_params['offset'])
+                             offset=query_params['offset'],
+                             cursor=cursor,
+                             facets=facets)
 
-    if ('format' in request.args and request.args['format'] == 'json') \
-            or 'json' in request.headers.get('accept', ''):
+    if json_format:
         if 'error' not in query_result:
             query_result['hits'] = {'total': query_result['total']}
+            if cursor is not None:
+                query_result['next_cursor'] = encode_cursor(query_result.pop('cursor'))
         return jsonify(query_result)
 
     if 'error' in query_result:
@@ -296,12 +375,17 @@ def all_ids():
     """
     Get IDs for all records (since a given date) as a JSON list of integers.
 
+    The IDs are streamed as they are read, so the response starts straight
+    away however many records there are.
+
     Accepts query parameters:
 
     - ``inspire_ids``: if set to a truthy value, return inspire IDs rather than HEPData record IDs
     - ``last_updated``: return IDs updated since given date (in format YYYY-mm-dd)
     - ``sort_by``: if set to ``latest``, sort the results latest first
     - ``use_es``: if set to a truthy values, use OpenSearch rather than the database to return the ids
+    - ``format``: if set to ``ndjson``, return one ID per line rather than a JSON list
+      (also used if the ``Accept`` header asks for ``application/x-ndjson``)
     """
     id_field = 'recid'
     if _get_bool_parameter(request, 'inspire_ids'):
@@ -324,15 +408,32 @@ def all_ids():
 
     try:
         if _get_bool_parameter(request, 'use_es'):
-            ids = os_get_all_ids(id_field=id_field, last_updated=last_updated, latest_first=sort_latest_first)
+            ids = os_iter_all_ids(id_field=id_field, last_updated=last_updated, latest_first=sort_latest_first)
         else:
-            ids = db_get_all_ids(id_field=id_field, last_updated=last_updated, latest_first=sort_latest_first)
+            ids = db_iter_all_ids(id_field=id_field, last_updated=last_updated, latest_first=sort_latest_first)
     except ValueError as e:
         return jsonify({
             "error": "Error getting ids: %s" % e
         }), 400
 
-    return jsonify([x for x in ids])
+    if request.args.get('format') == 'ndjson' or 'x-ndjson' in request.headers.get('accept', ''):
+        return Response(stream_with_context(_generate_ndjson(ids)), mimetype='application/x-ndjson')
+
+    return Response(stream_with_context(_generate_json_list(ids)), mimetype='application/json')
+
+
+def _generate_json_list(ids):
+    yield '['
+    separator = ''
+    for record_id in ids:
+        yield separator + str(record_id)
+        separator = ','
+    yield ']\n'
+
+
+def _generate_ndjson(ids):
+    for record_id in ids:
+        yield str(record_id) + '\n'
 
 
 def _get_bool_parameter(request, name):
@@ -31,3 +31,15 @@ class DailyAccessStatistic(db.Model):
     day = db.Column(db.Date, nullable=False)
 
     count = db.Column(db.Integer)
+
+
+class AccessStatisticTotal(db.Model):
+    """
+    Running total of the accesses to a record, kept in step with
+    DailyAccessStatistic so the count can be read from a single row.
+    """
+    __tablename__ = "access_statistic_total"
+
+    publication_recid = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    count = db.Column(db.BigInteger, nullable=False, default=0)
@@ -16,18 +16,52 @@
 # along with HEPData; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 #
-"""HEPData Stats Views."""
+"""HEPData Stats Views.
+
+Record accesses are buffered in Redis (using ``ACCESS_STATS_REDIS_URL``) so
+that page views do not write to the database. Each access increments a
+counter per (recid, day) and a running total per recid, in two hashes which
+are periodically moved aside and written to ``DailyAccessStatistic`` in bulk
+by :func:`flush_access_statistics`, which also updates the running total of
+each record in ``AccessStatisticTotal``. :func:`get_count` adds the counts
+still in Redis to the running total.
+
+Daily rows older than ``ACCESS_STATS_ROLLUP_MONTHS`` months can be compacted
+into one row per record and month by :func:`rollup_access_statistics`.
+
+If ``ACCESS_STATS_REDIS_URL`` is not set, accesses are written directly to
+the database.
+"""
 
 import logging
 from datetime import datetime
+
+import redis
+from celery import shared_task
+from flask import current_app
 from invenio_db import db
-from sqlalchemy import func
+from sqlalchemy import and_, bindparam, extract, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from hepdata.modules.stats.models import DailyAccessStatistic
+from hepdata.modules.stats.models import AccessStatisticTotal, DailyAccessStatistic
+from hepdata.utils.redis_client import get_redis_client
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+PENDING_KEY = 'pending'
+FLUSHING_KEY = 'flushing'
+
+
+def _redis_key(name, totals=False):
+    return '{0}access_stats::{1}{2}'.format(current_app.config.get('CACHE_KEY_PREFIX', ''), name,
+                                           '::totals' if totals else '')
+
+
+def get_stats_redis_client():
+    """Returns the Redis client used to buffer accesses, or None if buffering is disabled."""
+    return get_redis_client('ACCESS_STATS_REDIS_URL')
+
 
 def get_date():
     """
@@ -47,20 +81,173 @@ def increment(recid):
     :return:
     """
     if recid:
-        dt = get_date()
-        try:
-            available_access_stats = DailyAccessStatistic.query.filter_by(
-                publication_recid=recid, day=dt.strftime('%Y-%m-%d')).first()
+        client = get_stats_redis_client()
+        if client is not None:
+            day = get_date().strftime('%Y-%m-%d')
+            try:
+                pipe = client.pipeline()
+                pipe.hincrby(_redis_key(PENDING_KEY), '{0}:{1}'.format(recid, day), 1)
+                pipe.hincrby(_redis_key(PENDING_KEY, totals=True), recid, 1)
+                pipe.execute()
+                return
+            except redis.RedisError as e:
+                log.warning('Unable to buffer access to record {0}: {1}'.format(recid, e))
 
-            if available_access_stats:
-                available_access_stats.count += 1
-            else:
-                stats = DailyAccessStatistic(
-                    publication_recid=recid, day=dt, count=1)
-                db.session.add(stats)
-            db.session.commit()
-        except:
-            db.session.rollback()
+        write_access_counts({(int(recid), get_date().date()): 1})
+
+
+def write_access_counts(counts, before_commit=None):
+    """
+    Adds access counts to the DailyAccessStatistic table and the running
+    totals of the records, updating existing rows and creating the missing
+    ones, with a single commit.
+
+    :param counts: dict of counts keyed by (recid, day), where day is a date
+    :param before_commit: function called once the counts are ready to be
+        committed; if it raises, nothing is written
+    :return: True if the counts were written
+    """
+    if not counts:
+        return True
+
+    recids = set(recid for recid, day in counts)
+    days = set(day for recid, day in counts)
+    record_counts = {}
+    for (recid, day), count in counts.items():
+        record_counts[recid] = record_counts.get(recid, 0) + count
+
+    try:
+        update_access_totals(record_counts)
+
+        existing = DailyAccessStatistic.query.filter(
+            DailyAccessStatistic.publication_recid.in_(recids),
+            DailyAccessStatistic.day.in_(days)).all()
+
+        remaining = dict(counts)
+        for stats in existing:
+            count = remaining.pop((stats.publication_recid, stats.day), None)
+            if count:
+                stats.count += count
+
+        for (recid, day), count in remaining.items():
+            db.session.add(DailyAccessStatistic(publication_recid=recid, day=day, count=count))
+
+        if before_commit is not None:
+            # Constraint errors are raised here, before before_commit is called
+            db.session.flush()
+            before_commit()
+        db.session.commit()
+        return True
+    except Exception as e:
+        log.error('Unable to write access statistics: {0}'.format(e))
+        db.session.rollback()
+        return False
+
+
+def update_access_totals(record_counts):
+    """
+    Adds to the running totals of records (without committing). Missing
+    totals are first created from the existing DailyAccessStatistic rows of
+    the record, so must be updated before those rows are changed. Totals
+    created at the same time by another transaction (e.g. by
+    :func:`rebuild_access_totals`) are kept rather than conflicting.
+
+    :param record_counts: dict of counts to add keyed by recid
+    """
+    table = AccessStatisticTotal.__table__
+    existing = set(recid for recid, in db.session.query(AccessStatisticTotal.publication_recid).filter(
+        AccessStatisticTotal.publication_recid.in_(record_counts.keys())))
+
+    missing = set(record_counts.keys()) - existing
+    if missing:
+        persisted = dict(db.session.query(
+            DailyAccessStatistic.publication_recid, func.sum(DailyAccessStatistic.count)
+        ).filter(DailyAccessStatistic.publication_recid.in_(missing))
+            .group_by(DailyAccessStatistic.publication_recid).all())
+
+        db.session.execute(
+            pg_insert(table).on_conflict_do_nothing(index_elements=['publication_recid']),
+            [{'publication_recid': recid, 'count': int(persisted.get(recid) or 0)} for recid in missing])
+
+    db.session.execute(
+        update(table).where(table.c.publication_recid == bindparam('recid'))
+        .values(count=table.c.count + bindparam('increment')),
+        [{'recid': recid, 'increment': count} for recid, count in record_counts.items()])
+
+
+@shared_task
+def flush_access_statistics():
+    """
+    Writes the accesses buffered in Redis to the DailyAccessStatistic table.
+
+    The buffered counters are first renamed, so accesses during the flush
+    are buffered afresh. If writing to the database fails, the renamed
+    counters are kept and written by the next flush. They are deleted just
+    before the counts are committed, so if the commit itself fails the counts
+    are lost rather than written twice.
+    """
+    client = get_stats_redis_client()
+    if client is None:
+        return
+
+    pending, pending_totals = _redis_key(PENDING_KEY), _redis_key(PENDING_KEY, totals=True)
+    flushing, flushing_totals = _redis_key(FLUSHING_KEY), _redis_key(FLUSHING_KEY, totals=True)
+
+    lock = client.lock(_redis_key('flush_lock'), timeout=current_app.config.get('ACCESS_STATS_FLUSH_TIMEOUT'))
+    if not lock.acquire(blocking=False):
+        log.info('Access statistics are already being flushed')
+        return
+
+    try:
+        # Counters left by a failed flush are written before any new ones
+        if not client.exists(flushing):
+            if not client.exists(pending):
+                return
+            # The two hashes are always incremented together, so both exist
+            pipe = client.pipeline(transaction=True)
+            pipe.rename(pending, flushing)
+            pipe.rename(pending_totals, flushing_totals)
+            pipe.execute()
+
+        counts = {}
+        for field, count in client.hgetall(flushing).items():
+            recid, day = field.decode().split(':')
+            counts[(int(recid), datetime.strptime(day, '%Y-%m-%d').date())] = int(count)
+
+        if write_access_counts(counts, before_commit=lambda: client.delete(flushing, flushing_totals)):
+            log.info('Flushed {0} access statistics'.format(len(counts)))
+    finally:
+        lock.release()
+
+
+def clear_access_statistics_buffer():
+    """Discards all accesses buffered in Redis, e.g. when the database is recreated."""
+    client = get_stats_redis_client()
+    if client is not None:
+        client.delete(*[_redis_key(name, totals=totals) for name in (PENDING_KEY, FLUSHING_KEY)
+                        for totals in (False, True)])
+
+
+def get_buffered_count(recid):
+    """
+    Returns the number of accesses to a record which are buffered in Redis
+    and not yet written to the database.
+
+    :param recid: record id to get the count for
+    :return: int
+    """
+    client = get_stats_redis_client()
+    if client is None:
+        return 0
+
+    try:
+        pipe = client.pipeline()
+        pipe.hget(_redis_key(PENDING_KEY, totals=True), recid)
+        pipe.hget(_redis_key(FLUSHING_KEY, totals=True), recid)
+        return sum(int(count) for count in pipe.execute() if count is not None)
+    except redis.RedisError as e:
+        log.warning('Unable to read buffered accesses to record {0}: {1}'.format(recid, e))
+        return 0
 
 
 def get_count(recid):
@@ -68,17 +255,109 @@ def get_count(recid):
     Returns the number of times the record has been accessed.
 
     :param recid: record id to get the count for
-    :return: dict with sum as a key {"sum": 2}
+    :return: dict with sum as a key {"sum": 2}, including accesses not yet
+        written to the database
     """
     if recid is not None:
+        buffered = get_buffered_count(recid)
         try:
-            result = DailyAccessStatistic.query.with_entities(
-                func.sum(DailyAccessStatistic.count).label('sum')).filter(
-                DailyAccessStatistic.publication_recid == recid).one()
-            return {"sum": int(result[0])}
+            total = db.session.get(AccessStatisticTotal, recid)
+            if total is not None:
+                persisted = total.count
+            else:
+                # Records which have not been accessed since the totals were introduced
+                result = DailyAccessStatistic.query.with_entities(
+                    func.sum(DailyAccessStatistic.count).label('sum')).filter(
+                    DailyAccessStatistic.publication_recid == recid).one()
+                persisted = int(result[0] or 0)
+            return {"sum": (persisted + buffered) or 1}
 
         except Exception as e:
             log.info('No stats record found for {0}. Returning one.'.format(recid))
             log.info(e)
 
     return {"sum": 1}
+
+
+def rebuild_access_totals():
+    """
+    Creates the running totals of records which do not have one from their
+    DailyAccessStatistic rows. Existing totals are kept, as they are already
+    up to date. This is not normally needed, as the table is filled in by
+    its migration and missing totals are created when records are accessed.
+
+    :return: number of totals created
+    """
+    sums = select(DailyAccessStatistic.publication_recid, func.sum(DailyAccessStatistic.count)) \
+        .where(DailyAccessStatistic.publication_recid.isnot(None)) \
+        .group_by(DailyAccessStatistic.publication_recid)
+    statement = pg_insert(AccessStatisticTotal).from_select(['publication_recid', 'count'], sums) \
+        .on_conflict_do_nothing(index_elements=['publication_recid'])
+
+    try:
+        created = db.session.execute(statement).rowcount
+        db.session.commit()
+    except Exception as e:
+        log.error('Unable to rebuild access totals: {0}'.format(e))
+        db.session.rollback()
+        raise
+
+    return created
+
+
+@shared_task
+def rollup_access_statistics(months=None):
+    """
+    Compacts the DailyAccessStatistic rows older than a number of whole
+    months into one row per record and month, dated the first of the month.
+    The running totals are unchanged.
+
+    Rows dated the first of a month are kept as they are, so the monthly
+    rows of earlier roll ups are not rewritten: only the daily rows since
+    the previous cutoff are replaced, and added to the row of their month.
+
+    :param months: number of months of daily rows to keep, by default
+        ``ACCESS_STATS_ROLLUP_MONTHS`` (None to disable)
+    :return: number of daily rows replaced
+    """
+    if months is None:
+        months = current_app.config.get('ACCESS_STATS_ROLLUP_MONTHS')
+    if months is None:
+        return 0
+
+    today = get_date().date()
+    month_index = today.year * 12 + today.month - 1 - months
+    cutoff = today.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+    month = func.date_trunc('month', DailyAccessStatistic.day)
+    daily = and_(DailyAccessStatistic.day < cutoff, extract('day', DailyAccessStatistic.day) != 1)
+    try:
+        rolled_up = db.session.query(
+            DailyAccessStatistic.publication_recid, month, func.sum(DailyAccessStatistic.count)
+        ).filter(daily).group_by(DailyAccessStatistic.publication_recid, month).all()
+        if not rolled_up:
+            return 0
+
+        deleted = DailyAccessStatistic.query.filter(daily).delete(synchronize_session=False)
+
+        remaining = {(recid, first_day.date()): count for recid, first_day, count in rolled_up}
+        existing = DailyAccessStatistic.query.filter(
+            DailyAccessStatistic.publication_recid.in_(set(recid for recid, day in remaining)),
+            DailyAccessStatistic.day.in_(set(day for recid, day in remaining))).all()
+        for stats in existing:
+            count = remaining.pop((stats.publication_recid, stats.day), None)
+            if count:
+                stats.count += count
+
+        db.session.add_all([
+            DailyAccessStatistic(publication_recid=recid, day=day, count=count)
+            for (recid, day), count in remaining.items()
+        ])
+        db.session.commit()
+    except Exception as e:
+        log.error('Unable to roll up access statistics: {0}'.format(e))
+        db.session.rollback()
+        raise
+
+    log.info('Rolled up {0} access statistics before {1} into {2}'.format(deleted, cutoff, len(rolled_up)))
+    return deleted
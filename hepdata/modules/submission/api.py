@@ -17,17 +17,26 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 #
 import logging
+from itertools import chain
 
+from flask import g, has_request_context
 from invenio_db import db
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
 from hepdata.modules.submission.models import DataResource, SubmissionObserver
 from hepdata.modules.permissions.models import SubmissionParticipant
-from hepdata.modules.submission.models import HEPSubmission
+from hepdata.modules.submission.models import HEPSubmission, PublicationVersionSummary
 
 """Common utilities used across the code base."""
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+LATEST_HEPSUBMISSION_CACHE = '_latest_hepsubmission_cache'
+
 
 def is_resource_added_to_submission(recid, version, resource_url):
     """
@@ -43,26 +52,281 @@ def is_resource_added_to_submission(recid, version, resource_url):
                                           DataResource.file_location == resource_url)).count() > 0
 
 
+def _get_latest_hepsubmission_cache():
+    # Only cache for the length of a request: CLI commands and Celery tasks
+    # can run for long enough that the cache would grow without bound and
+    # miss changes made by other processes
+    if not has_request_context():
+        return None
+    return g.setdefault(LATEST_HEPSUBMISSION_CACHE, {})
+
+
+def _get_cache_key(kwargs):
+    key = tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def clear_latest_hepsubmission_cache():
+    """
+    Clears the cache of get_latest_hepsubmission results for the current
+    request.
+    """
+    if has_request_context():
+        g.pop(LATEST_HEPSUBMISSION_CACHE, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _clear_cache_after_flush(session, flush_context):
+    if any(isinstance(obj, HEPSubmission) for obj in chain(session.new, session.dirty, session.deleted)):
+        clear_latest_hepsubmission_cache()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _clear_cache_after_rollback(session, previous_transaction):
+    clear_latest_hepsubmission_cache()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _clear_cache_after_bulk_change(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        clear_latest_hepsubmission_cache()
+
+
+def _get_changed_publication_recids(session):
+    recids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, HEPSubmission):
+            # Include the previous recid if it has been changed
+            history = inspect(obj).attrs.publication_recid.history
+            recids.update(history.added or (obj.publication_recid,))
+            recids.update(history.deleted or ())
+    recids.discard(None)
+    return recids
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_version_summaries_after_flush(session, flush_context):
+    recids = _get_changed_publication_recids(session)
+    if recids:
+        refresh_version_summaries(recids, connection=session.connection())
+
+
+def _calculate_version_summaries(publication_recids, connection):
+    """
+    Calculates the PublicationVersionSummary rows of the given publications
+    from their HEPSubmissions.
+
+    :return: dict of row values keyed by publication recid (publications
+        with no versions are omitted)
+    """
+    rows = connection.execute(
+        select(HEPSubmission.publication_recid,
+               func.count(),
+               func.count().filter(HEPSubmission.overall_status == 'finished'),
+               func.count().filter(HEPSubmission.overall_status.in_(['sandbox', 'sandbox_processing'])))
+        .where(HEPSubmission.publication_recid.in_(publication_recids))
+        .group_by(HEPSubmission.publication_recid)
+    ).all()
+
+    return {
+        recid: {
+            'publication_recid': recid,
+            'version_count': version_count,
+            'finished_version_count': finished_version_count,
+            'sandbox_version_count': sandbox_version_count
+        }
+        for recid, version_count, finished_version_count, sandbox_version_count in rows
+    }
+
+
+def refresh_version_summaries(publication_recids, connection=None):
+    """
+    Recalculates the PublicationVersionSummary rows of the given publications
+    from their HEPSubmissions. This is called automatically whenever
+    HEPSubmissions are flushed, so runs in the same transaction as the change.
+
+    Rows are upserted, so a row stored at the same time by another
+    transaction (e.g. by :func:`get_version_counts`) is overwritten rather
+    than causing a unique violation.
+
+    :param publication_recids: iterable of publication recids
+    :param connection: connection to use, by default that of the current session
+    """
+    publication_recids = set(publication_recids)
+    if not publication_recids:
+        return
+
+    if connection is None:
+        connection = db.session.connection()
+
+    summaries = _calculate_version_summaries(publication_recids, connection)
+
+    table = PublicationVersionSummary.__table__
+    removed = publication_recids - set(summaries)
+    if removed:
+        connection.execute(delete(table).where(table.c.publication_recid.in_(removed)))
+
+    if summaries:
+        statement = pg_insert(table)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=['publication_recid'],
+                set_={column: statement.excluded[column] for column in
+                      ('version_count', 'finished_version_count', 'sandbox_version_count')}),
+            list(summaries.values()))
+
+
+def rebuild_version_summaries(batch_size=1000):
+    """
+    Recalculates the PublicationVersionSummary rows of all publications.
+    This is not normally needed, as the rows are kept up to date whenever
+    HEPSubmissions change, and the table is filled in by its migration.
+
+    :param batch_size: number of publications to recalculate per transaction
+    :return: number of publications
+    """
+    db.session.query(PublicationVersionSummary).filter(
+        PublicationVersionSummary.publication_recid.notin_(
+            select(HEPSubmission.publication_recid).where(HEPSubmission.publication_recid.isnot(None)))
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    recids = [recid for recid, in db.session.query(HEPSubmission.publication_recid).distinct()
+              if recid is not None]
+    for i in range(0, len(recids), batch_size):
+        try:
+            refresh_version_summaries(recids[i:i + batch_size])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            log.warning('Unable to rebuild version summaries of batch {0}: {1}'.format(i // batch_size, e))
+            db.session.rollback()
+
+    return len(recids)
+
+
+def get_version_summary(publication_recid):
+    """
+    Gets the PublicationVersionSummary of a publication.
+
+    :param publication_recid: publication recid
+    :return: PublicationVersionSummary object, or None if there are no versions
+    """
+    # The row may have been replaced since it was loaded into the session
+    return PublicationVersionSummary.query.filter_by(publication_recid=publication_recid) \
+        .populate_existing().first()
+
+
+def get_version_counts(publication_recid):
+    """
+    Gets the number of versions of a publication from its version summary.
+
+    If the summary is missing, the counts are calculated from the
+    HEPSubmissions instead, and the summary is stored for next time.
+
+    :param publication_recid: publication recid
+    :return: tuple of the number of all versions, finished versions and sandbox versions
+    """
+    summary = get_version_summary(publication_recid)
+    if summary is not None:
+        return summary.version_count, summary.finished_version_count, summary.sandbox_version_count
+
+    values = _calculate_version_summaries([publication_recid], db.session.connection()).get(publication_recid)
+    if values is None:
+        return 0, 0, 0
+
+    _store_version_summary(values)
+
+    return values['version_count'], values['finished_version_count'], values['sandbox_version_count']
+
+
+def _store_version_summary(values):
+    # Use a separate transaction so the row is kept even if the
+    # current one is rolled back. Any row written in the meantime
+    # (by a change to the publication) is left alone.
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(pg_insert(PublicationVersionSummary.__table__).values(**values)
+                               .on_conflict_do_nothing(index_elements=['publication_recid']))
+    except SQLAlchemyError as e:
+        log.warning('Unable to store version summary of {0}: {1}'.format(values['publication_recid'], e))
+
+
+def _has_pending_hepsubmissions():
+    # Unflushed changes would be autoflushed by a query, so must not be hidden by the cache
+    return any(isinstance(obj, HEPSubmission) for obj in chain(db.session.new, db.session.dirty))
+
+
 def get_latest_hepsubmission(*args, **kwargs):
     """
     Gets the latest HEPSubmission record matching the given kwargs
 
+    Within a request, results are cached for the rest of the request, until
+    a HEPSubmission is changed.
+
     :return: the HEPSubmission object or None
     """
+    cache = _get_latest_hepsubmission_cache()
+    key = _get_cache_key(kwargs) if cache is not None else None
+    if key is not None and key in cache and not _has_pending_hepsubmissions():
+        return cache[key]
 
-    hepsubmissions = HEPSubmission.query.filter_by(**kwargs).all()
+    last = HEPSubmission.query.filter_by(**kwargs) \
+        .order_by(HEPSubmission.version.desc(), HEPSubmission.id.asc()).first()
 
-    last = None
-    for hepsubmission in hepsubmissions:
-        if last is None:
-            last = hepsubmission
-        else:
-            if hepsubmission.version > last.version:
-                last = hepsubmission
+    if key is not None:
+        cache[key] = last
 
     return last
 
 
+def get_latest_hepsubmissions(publication_recids=None, inspire_ids=None, **kwargs):
+    """
+    Gets the latest HEPSubmission records for several publication recids or
+    INSPIRE ids, matching the given kwargs, with a single query.
+
+    :param publication_recids: list of publication recids
+    :param inspire_ids: list of INSPIRE ids (as strings), if publication_recids is not given
+    :return: dict of HEPSubmission objects keyed by publication recid or INSPIRE id
+        (ids with no matching HEPSubmission are omitted)
+    """
+    if (publication_recids is None) == (inspire_ids is None):
+        raise ValueError("Exactly one of publication_recids and inspire_ids must be given.")
+
+    if publication_recids is not None:
+        column, values = HEPSubmission.publication_recid, publication_recids
+    else:
+        column, values = HEPSubmission.inspire_id, inspire_ids
+
+    values = set(values)
+    if not values:
+        return {}
+
+    row_number = func.row_number().over(
+        partition_by=column,
+        order_by=(HEPSubmission.version.desc(), HEPSubmission.id.asc())
+    ).label('row_number')
+    latest = HEPSubmission.query.filter_by(**kwargs).filter(column.in_(values)) \
+        .with_entities(HEPSubmission.id, row_number).subquery()
+
+    submissions = HEPSubmission.query.join(latest, HEPSubmission.id == latest.c.id) \
+        .filter(latest.c.row_number == 1).all()
+    result = {getattr(submission, column.key): submission for submission in submissions}
+
+    # Also answer later calls to get_latest_hepsubmission for these ids
+    cache = _get_latest_hepsubmission_cache()
+    if cache is not None:
+        for value in values:
+            key = _get_cache_key({**kwargs, column.key: value})
+            if key is not None:
+                cache[key] = result.get(value)
+
+    return result
+
+
 def get_submission_participants_for_record(publication_recid, roles=None, **kwargs):
     """Gets the participants for a given publication record id
 
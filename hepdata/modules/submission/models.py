@@ -124,6 +124,22 @@ class HEPSubmission(db.Model):
                                cascade="all,delete")
 
 
+class PublicationVersionSummary(db.Model):
+    """
+    Summary of the versions of a publication, so that version counts can be
+    found without aggregating over ``hepsubmission``. Rows are maintained in
+    the same transaction as any change to a HEPSubmission (see
+    :func:`hepdata.modules.submission.api.refresh_version_summaries`).
+    """
+    __tablename__ = "publication_version_summary"
+
+    publication_recid = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    version_count = db.Column(db.Integer, nullable=False, default=0)
+    finished_version_count = db.Column(db.Integer, nullable=False, default=0)
+    sandbox_version_count = db.Column(db.Integer, nullable=False, default=0)
+
+
 class SubmissionObserver(db.Model):
     """
     Contains observer key entry for access per publication
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Redis clients shared by the caches and buffers which use Redis."""
+
+import redis
+from flask import current_app
+
+_redis_clients = {}
+
+
+def get_redis_client(config_key):
+    """
+    Returns a Redis client for the URL in a config variable, or None if the
+    variable is not set. Clients are shared between callers using the same URL.
+
+    :param config_key: name of the config variable holding the Redis URL
+    :return: Redis client, or None
+    """
+    url = current_app.config.get(config_key)
+    if not url:
+        return None
+    if url not in _redis_clients:
+        _redis_clients[url] = redis.StrictRedis.from_url(url)
+    return _redis_clients[url]
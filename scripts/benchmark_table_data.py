@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import copy
+import glob
+import os
+import time
+
+import click
+import yaml
+from yaml import CBaseLoader as Loader
+
+from hepdata.factory import create_app
+from hepdata.modules.records.utils.data_processing_utils import generate_table_data
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                 '..', 'tests', 'test_data', 'TestLargeSubmission')
+
+
+@click.command()
+@click.option('--directory', '-d', default=DEFAULT_DIRECTORY,
+              help='Directory containing the data table YAML files to use')
+@click.option('--repeat', '-r', default=5,
+              help='Number of times to render each table (the best time is reported)')
+def benchmark(directory, repeat):
+    """This script times generate_table_data on each data table in a
+    submission directory (by default tests/test_data/TestLargeSubmission),
+    reading the files in the same way as the records views."""
+    app = create_app()
+    with app.app_context():
+        for file_path in sorted(glob.glob(os.path.join(directory, '*.yaml'))):
+            with open(file_path, 'r') as stream:
+                table_contents = yaml.load(stream, Loader=Loader)
+
+            if not isinstance(table_contents, dict) or 'independent_variables' not in table_contents:
+                continue
+
+            best = None
+            for _ in range(repeat):
+                contents = copy.deepcopy(table_contents)
+                start = time.perf_counter()
+                table_data = generate_table_data(contents)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            click.echo("%s: %d rows, %d headers, best of %d: %.2f ms"
+                       % (os.path.basename(file_path), len(table_data['values']),
+                          len(table_data['headers']), repeat, best * 1000))
+
+
+if __name__ == '__main__':
+    benchmark()
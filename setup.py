@@ -86,6 +86,9 @@ setup(
         'invenio_base.apps': [
             'hepdata_records = hepdata.modules.records.ext:HEPDataRecords'
         ],
+        'invenio_db.alembic': [
+            'hepdata = hepdata:alembic'
+        ],
         'invenio_db.models': [
             'hepdata_submissions = hepdata.modules.submission.models',
             'hepdata_stats = hepdata.modules.stats.models',
@@ -112,7 +115,9 @@ setup(
             'hepdata_conversion = hepdata.modules.converter.tasks',
             'hepdata_opensearch = hepdata.ext.opensearch.api',
             'hepdata_inspireupdate = hepdata.modules.records.utils.records_update_utils',
-            'hepdata_delete = hepdata.modules.records.utils.submission'
+            'hepdata_delete = hepdata.modules.records.utils.submission',
+            'hepdata_rendered_tables = hepdata.modules.records.utils.rendered_tables',
+            'hepdata_stats = hepdata.modules.stats.views'
         ],
         'invenio_i18n.translations': [
             'messages = hepdata',
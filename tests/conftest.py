@@ -45,6 +45,8 @@ from hepdata.modules.records.importer.api import import_records, _download_file
 from hepdata.modules.records.utils.data_files import get_data_path_for_record
 from hepdata.modules.records.utils.submission import get_or_create_hepsubmission, process_submission_directory
 from hepdata.modules.records.utils.workflow import create_record
+from hepdata.modules.stats.views import clear_access_statistics_buffer
+from hepdata.modules.submission.models import DataResource, DataSubmission
 from hepdata.modules.submission.views import process_submission_payload
 
 TEST_EMAIL = 'test@hepdata.net'
@@ -87,6 +89,7 @@ def setup_app(app):
 
         db.drop_all()
         db.create_all()
+        clear_access_statistics_buffer()
         reindex_all(recreate=True, synchronous=True)
 
         ctx = app.test_request_context()
@@ -233,6 +236,44 @@ def create_test_record(file_location, overall_status='finished'):
                                  test_submission.publication_recid)
     return test_submission
 
+def create_large_test_record(table_count, overall_status='finished'):
+    """
+    Helper function to create a synthetic submission with many data tables,
+    each with a data file and one additional resource. The files are not
+    created on disk.
+
+    :param table_count: Number of data tables to create.
+    :param overall_status: Overall status of the submission. Defaults to 'finished'.
+    :returns submission: The newly created submission object
+    """
+    record_information = create_record({'journal_info': 'Journal', 'title': 'Large Test Paper'})
+    recid = record_information['recid']
+    submission = get_or_create_hepsubmission(recid, status=overall_status)
+    data_dir = get_data_path_for_record(recid, 'synthetic')
+
+    data_files = [DataResource(file_location=os.path.join(data_dir, f'Table{i + 1}.yaml'), file_type='data')
+                  for i in range(table_count)]
+    db.session.add_all(data_files)
+    db.session.flush()
+
+    for i, data_file in enumerate(data_files):
+        resource = DataResource(file_location=f'https://www.example.com/table{i + 1}', file_type='html',
+                                file_description=f'Link for table {i + 1}')
+        db.session.add(DataSubmission(publication_recid=recid, name=f'Table {i + 1}',
+                                      location_in_publication=f'Figure {i + 1}',
+                                      description=f'Synthetic table {i + 1}',
+                                      data_file=data_file.id, resources=[resource], version=1))
+
+    db.session.commit()
+    return submission
+
+
+@pytest.fixture()
+def large_submission(app):
+    """Synthetic finished submission with 1000 data tables."""
+    return create_large_test_record(1000)
+
+
 def create_record_with_participant():
     """
     A specific function used in email_test.py to create a blank test record
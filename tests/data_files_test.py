@@ -28,7 +28,7 @@ import os
 
 from hepdata.modules.records.utils.data_files import _get_subdir_name, \
     get_data_path_for_record, get_old_data_path_for_record, \
-    get_converted_directory_path, find_submission_data_file_path
+    get_converted_directory_path, get_rendered_directory_path, find_submission_data_file_path
 from hepdata.modules.submission.models import HEPSubmission
 
 
@@ -57,6 +57,12 @@ def test_get_converted_directory_path(app):
            == data_dir + '/converted/96')
 
 
+def test_get_rendered_directory_path(app):
+    data_dir = app.config['CFG_DATADIR']
+    assert(get_rendered_directory_path('ins12345')
+           == data_dir + '/rendered/96/ins12345')
+
+
 def test_find_submission_data_file_path(app):
     data_dir = app.config['CFG_DATADIR']
     expected_file_name = 'HEPData-987654321-v2-yaml.zip'
@@ -22,6 +22,9 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 """HEPData records test cases."""
+import copy
+import glob
+import gzip
 import json
 import random
 from io import open, StringIO
@@ -38,6 +41,7 @@ from flask import current_app
 from flask_login import login_user
 from invenio_accounts.models import User
 from invenio_db import db
+from sqlalchemy import event
 from sqlalchemy.exc import MultipleResultsFound
 from types import SimpleNamespace
 import pytest
@@ -53,15 +57,26 @@ from hepdata.modules.records.api import process_payload, process_zip_archive, \
     has_coordinator_permissions, create_new_version, \
     get_resource_mimetype, create_breadcrumb_text, format_submission, \
     format_resource, get_commit_message, get_related_to_this_hepsubmissions, \
-    get_related_hepsubmissions, get_related_datasubmissions, get_related_to_this_datasubmissions, render_record
+    get_related_hepsubmissions, get_related_datasubmissions, get_related_to_this_datasubmissions, render_record, \
+    process_data_tables, assign_or_create_review_status, add_user_context
 from hepdata.modules.records.importer.api import import_records
 from hepdata.modules.records.utils.analyses import update_analyses, update_analyses_single_tool
 from hepdata.modules.records.utils.submission import get_or_create_hepsubmission, process_submission_directory, \
     do_finalise, unload_submission
-from hepdata.modules.records.utils.common import get_record_by_id, get_record_contents, generate_license_data_by_id
-from hepdata.modules.records.utils.data_processing_utils import generate_table_headers, generate_table_data
+from hepdata.modules.records.utils.common import get_record_by_id, get_record_contents, generate_license_data_by_id, \
+    load_table_data
+from hepdata.modules.records.utils.data_processing_utils import generate_table_headers, generate_table_data, \
+    get_error_label_plan
 from hepdata.modules.records.utils.data_files import get_data_path_for_record
+from hepdata.modules.records.utils.decimation import decimate_table_data, lttb_indices
 from hepdata.modules.records.utils.json_ld import get_json_ld
+from hepdata.modules.records.utils.page_cache import invalidate_record_contexts, get_cached_record_context, \
+    get_submission_stamp
+from hepdata.modules.records.utils.rendered_tables import find_rendered_table, generate_rendered_tables, \
+    delete_rendered_table, rendered_table_response
+from hepdata.modules.records.utils.table_cache import LocalTableCache, invalidate_tables
+from hepdata.modules.records.utils.table_stats import compute_table_stats, get_table_stats_path
+from hepdata.ext.opensearch.document_enhancers import add_data_stats
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_record, create_record
 from hepdata.modules.records.views import set_data_review_status, get_observer_data, get_data_review_status, \
@@ -71,6 +86,7 @@ from hepdata.modules.submission.models import HEPSubmission, DataReview, \
     Message
 from hepdata.modules.submission.views import process_submission_payload
 from hepdata.modules.submission.api import get_latest_hepsubmission, get_or_create_submission_observer
+from hepdata.utils.redis_client import get_redis_client
 from tests.conftest import TEST_EMAIL, create_test_record, create_blank_test_record
 from hepdata.modules.records.utils.records_update_utils import get_inspire_records_updated_since, \
     get_inspire_records_updated_on, update_record_info, RECORDS_PER_PAGE
@@ -180,6 +196,638 @@ def test_data_processing(app):
     assert(len(table_structure["qualifiers"]) == 2)
 
 
+def test_data_processing_large_table(app):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+
+    with open(os.path.join(base_dir, 'test_data/TestLargeSubmission/data1.yaml'), 'r') as stream:
+        data = yaml.load(stream, Loader=yaml.CBaseLoader)
+
+    # Add special values and a dependent variable with more values than the independent variables
+    data['independent_variables'][0]['values'][0] = {'value': 'inf', 'low': 'nan', 'high': '25.0'}
+    data['dependent_variables'][0]['values'][1]['value'] = '-inf'
+    data['dependent_variables'].append({
+        'header': {'name': 'extra'},
+        'values': [{'value': str(i)} for i in range(300)]
+    })
+
+    table_structure = generate_table_data(data)
+
+    assert table_structure["x_count"] == 5
+    assert len(table_structure["values"]) == 270
+    assert [len(row["x"]) for row in table_structure["values"]] == [5] * 270
+    assert [len(row["y"]) for row in table_structure["values"]] == [2] * 270
+    assert table_structure["values"][0]["x"][0] == {'value': 'inf', 'low': 'inf', 'high': '25.0'}
+    assert table_structure["values"][1]["y"][0]["value"] == '-inf'
+    assert table_structure["values"][-1]["y"][1] == {
+        'value': '269', 'group': 1, 'errors': [{'symerror': 0, 'hide': True}]
+    }
+
+
+def test_error_label_plan(app):
+    assert get_error_label_plan(('stat', 'sys')) == []
+    assert get_error_label_plan(('stat', 'sys', 'sys', None)) == [(1, 'sys_1'), (2, 'sys_2')]
+    assert get_error_label_plan((None, None)) == [(0, 'error_1'), (1, 'error_2')]
+    assert get_error_label_plan(('a', 'a', 'a')) == [(0, 'a_1'), (1, 'a_2'), (2, 'a_3')]
+
+    # Values with the same labels are renamed in the same way
+    data = {
+        'independent_variables': [{'header': {'name': 'x'}, 'values': [{'value': '1'}, {'value': '2'}]}],
+        'dependent_variables': [{'header': {'name': 'y'}, 'values': [
+            {'value': '1', 'errors': [{'symerror': '0.1', 'label': 'sys'}, {'symerror': '0.2', 'label': 'sys'}]},
+            {'value': '2', 'errors': [{'symerror': '0.1', 'label': 'sys'}, {'symerror': '0.2'}]}
+        ]}]
+    }
+    table_structure = generate_table_data(data)
+    assert [error.get('label') for error in table_structure['values'][0]['y'][0]['errors']] == ['sys_1', 'sys_2']
+    assert [error.get('label') for error in table_structure['values'][1]['y'][0]['errors']] == ['sys', None]
+
+
+def _merge_qualifiers_per_axis(table_contents):
+    """Previous implementation of the qualifier column merge, repeated after every y-axis."""
+    record = {"qualifier_order": [], "qualifiers": {}}
+    for group_count, y_axis in enumerate(table_contents["dependent_variables"]):
+        qualifiers = {}
+        if "qualifiers" in y_axis:
+            for qualifier in y_axis["qualifiers"]:
+                qualifier_name = qualifier["name"]
+
+                if qualifier_name not in qualifiers:
+                    qualifiers[qualifier_name] = 0
+                else:
+                    qualifiers[qualifier_name] += 1
+                    count = qualifiers[qualifier_name]
+                    qualifier_name = "{0}-{1}".format(qualifier_name, count)
+
+                if qualifier_name not in record["qualifiers"].keys():
+                    record["qualifier_order"].append(qualifier_name)
+                    record["qualifiers"][qualifier_name] = []
+
+                record["qualifiers"][qualifier_name].append(
+                    {"type": qualifier["name"],
+                     "value": str(qualifier["value"]) + (
+                         ' ' + qualifier['units'] if 'units' in qualifier else ''),
+                     "colspan": 1, "group": group_count})
+
+            for qualifier in record["qualifiers"]:
+                values = record["qualifiers"][qualifier]
+                merged_values = []
+                last_value = None
+                for counter, value in enumerate(values):
+                    if not last_value:
+                        last_value = value
+                    else:
+                        if last_value["type"] == value["type"] and last_value["value"] == value["value"]:
+                            last_value["colspan"] += 1
+                        else:
+                            merged_values.append(last_value)
+                            last_value = value
+
+                    if counter == len(values) - 1:
+                        merged_values.append(last_value)
+
+                record["qualifiers"][qualifier] = merged_values
+
+    return record
+
+
+def test_qualifier_column_merge(app):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    table_count = 0
+
+    for file_path in sorted(glob.glob(os.path.join(base_dir, 'test_data', '**', '*.yaml'), recursive=True)):
+        try:
+            with open(file_path, 'r') as stream:
+                documents = list(yaml.load_all(stream, Loader=yaml.CBaseLoader))
+        except yaml.YAMLError:
+            continue
+
+        for table_contents in documents:
+            if not isinstance(table_contents, dict) or 'dependent_variables' not in table_contents \
+                    or 'independent_variables' not in table_contents:
+                continue
+
+            expected = _merge_qualifiers_per_axis(table_contents)
+            table_structure = generate_table_data(table_contents)
+
+            assert table_structure["qualifier_order"] == expected["qualifier_order"], file_path
+            assert table_structure["qualifiers"] == expected["qualifiers"], file_path
+            table_count += 1
+
+    assert table_count > 0
+
+
+def test_local_table_cache():
+    cache = LocalTableCache(max_bytes=10)
+
+    cache.set(1, 'fp1', 'table', b'12345')
+    assert cache.get(1, 'fp1', 'table') == b'12345'
+    # A different fingerprint is a miss
+    assert cache.get(1, 'fp2', 'table') is None
+
+    cache.set(2, 'fp1', 'table', b'12345')
+    assert cache.current_bytes == 10
+
+    # Touch entry 1 so that entry 2 is evicted first
+    cache.get(1, 'fp1', 'table')
+    cache.set(3, 'fp1', 'table', b'123')
+    assert cache.get(2, 'fp1', 'table') is None
+    assert cache.get(1, 'fp1', 'table') == b'12345'
+    assert cache.current_bytes == 8
+
+    # Values larger than the budget are not stored
+    cache.set(4, 'fp1', 'table', b'12345678901')
+    assert cache.get(4, 'fp1', 'table') is None
+
+    # Storing a new fingerprint replaces all fields for that resource
+    cache.set(1, 'fp1', 'other', b'1')
+    cache.set(1, 'fp2', 'table', b'12')
+    assert cache.get(1, 'fp2', 'other') is None
+    assert cache.get(1, 'fp2', 'table') == b'12'
+
+    cache.delete(1)
+    assert cache.get(1, 'fp2', 'table') is None
+    assert cache.current_bytes == 3
+
+
+def test_load_table_data_cache(app):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submission = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid).order_by(DataSubmission.id.asc()).first()
+
+    invalidate_tables([data_submission.data_file])
+    table_contents = load_table_data(data_submission.id, data_submission.version)
+    assert 'dependent_variables' in table_contents
+
+    # Second load should come from the cache, and be a separate copy
+    with patch('hepdata.modules.records.utils.common.read_table_file') as mock_read:
+        cached_contents = load_table_data(data_submission.id, data_submission.version)
+        mock_read.assert_not_called()
+    assert cached_contents == table_contents
+    assert cached_contents is not table_contents
+
+    # Invalidating the table means the file is read again
+    invalidate_tables([data_submission.data_file])
+    with patch('hepdata.modules.records.utils.common.read_table_file',
+               return_value=table_contents) as mock_read:
+        load_table_data(data_submission.id, data_submission.version)
+        mock_read.assert_called_once()
+
+    # Tables which cannot be serialised for the cache are returned uncached
+    invalidate_tables([data_submission.data_file])
+    dated_contents = dict(table_contents, date=datetime.date(2020, 1, 1))
+    for _ in range(2):
+        with patch('hepdata.modules.records.utils.common.read_table_file',
+                   return_value=dated_contents) as mock_read:
+            assert load_table_data(data_submission.id, data_submission.version) == dated_contents
+            mock_read.assert_called_once()
+
+
+def test_rendered_tables(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submissions = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid).order_by(DataSubmission.id.asc()).all()
+
+    for data_submission in data_submissions:
+        assert find_rendered_table(test_submission.publication_recid, data_submission.data_file) is None
+
+    generate_rendered_tables(test_submission.publication_recid, 1)
+
+    for data_submission in data_submissions:
+        rendered_path = find_rendered_table(test_submission.publication_recid, data_submission.data_file)
+        assert rendered_path is not None
+        expected = generate_table_data(load_table_data(data_submission.id, data_submission.version))
+        with open(rendered_path) as rendered_file:
+            assert json.load(rendered_file) == expected
+
+        # Both table endpoints should serve the precomputed data
+        response = client.get(f'/record/data/tabledata/{data_submission.id}/1')
+        assert response.status_code == 200
+        assert response.json == expected
+
+        response = client.get(f'/record/data/{test_submission.publication_recid}/{data_submission.id}/1/1')
+        assert response.status_code == 200
+        assert response.json['values'] == expected['values']
+        assert response.json['name'] == data_submission.name
+
+        # Clients accepting gzip are sent the precompressed copy, with its own ETag
+        uncompressed = client.get(f'/record/data/tabledata/{data_submission.id}/1')
+        response = client.get(f'/record/data/tabledata/{data_submission.id}/1',
+                              headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data)) == expected
+        assert response.headers['ETag'] != uncompressed.headers['ETag']
+        assert 'Content-Encoding' not in uncompressed.headers
+
+        # The table details are compressed as they are streamed
+        url = f'/record/data/{test_submission.publication_recid}/{data_submission.id}/1/1'
+        uncompressed = client.get(url)
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data)) == uncompressed.json
+        assert response.headers['ETag'] != uncompressed.headers['ETag']
+
+        # Extra keys are merged in without duplicating those in the file
+        response = rendered_table_response(rendered_path, extra={'name': 'Other', 'review': {}})
+        body = response.get_data(as_text=True)
+        assert body.count('"name"') == 1
+        assert json.loads(body) == {**expected, 'review': {}}
+        response = rendered_table_response(rendered_path, extra={'name': 'Other'})
+        assert json.loads(response.get_data(as_text=True)) == expected
+
+        delete_rendered_table(test_submission.publication_recid, data_submission.data_file)
+        assert find_rendered_table(test_submission.publication_recid, data_submission.data_file) is None
+        assert not os.path.exists(rendered_path + '.gz')
+
+
+def test_get_table_data_rows(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submission = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid, name='Table 3').first()
+    url = f'/record/data/tabledata/{data_submission.id}/1'
+
+    expected = generate_table_data(load_table_data(data_submission.id, data_submission.version))
+    total_rows = len(expected['values'])
+    assert total_rows > 3
+
+    # Check the rows are the same whether generated live or read from the render-ready JSON
+    for rendered in [False, True]:
+        if rendered:
+            generate_rendered_tables(test_submission.publication_recid, 1)
+
+        response = client.get(url + '?offset=1&limit=2')
+        assert response.status_code == 200
+        assert response.json['values'] == expected['values'][1:3]
+        assert response.json['headers'] == expected['headers']
+        assert response.json['qualifiers'] == expected['qualifiers']
+        assert response.json['total_rows'] == total_rows
+        assert response.json['offset'] == 1
+        assert response.json['limit'] == 2
+
+        response = client.get(url + '?offset=2')
+        assert response.json['values'] == expected['values'][2:]
+        assert response.json['limit'] is None
+
+        response = client.get(url + f'?offset={total_rows}&limit=10')
+        assert response.json['values'] == []
+        assert response.json['total_rows'] == total_rows
+
+        response = client.get(url + '?offset=-1')
+        assert response.status_code == 400
+
+    delete_rendered_table(test_submission.publication_recid, data_submission.data_file)
+
+
+def test_get_table_details_statement_count(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submission = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid, name='Table 1').first()
+    url = f'/record/data/{test_submission.publication_recid}/{data_submission.id}/1/1'
+
+    # The first request creates the review
+    response = client.get(url)
+    assert response.status_code == 200
+    assert DataReview.query.filter_by(data_recid=data_submission.id, version=1).count() == 1
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert response.status_code == 200
+    assert response.json['name'] == 'Table 1'
+    assert response.json['review']['review_flag'] == 'todo'
+    assert response.json['review']['messages'] is False
+    assert 'values' in response.json
+    # 3 version counts, 3 to load the table details (data submission with its data file,
+    # license, keywords and review, then resources and related tables), and at most one
+    # query each for the related and related-to-this tables
+    assert len(statements) <= 8, statements
+
+
+def test_process_data_tables_statement_count(app, large_submission):
+    recid = large_submission.publication_recid
+    ctx = {'show_upload_widget': False}
+    data_record_query = DataSubmission.query.filter_by(publication_recid=recid, version=1) \
+        .order_by(DataSubmission.id.asc())
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def process_tables():
+        data_table_metadata, first_data_id = process_data_tables(ctx, data_record_query, -1, 'Table 10')
+        assign_or_create_review_status(data_table_metadata, recid, 1)
+        return data_table_metadata, first_data_id
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        data_table_metadata, first_data_id = process_tables()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert len(data_table_metadata) == 1000
+    assert ctx['show_upload_area'] is False
+    table = data_table_metadata[first_data_id]
+    assert table['name'] == 'Table 10'
+    assert table['resources'][0]['url'] == 'https://www.example.com/table10'
+    assert table['review_flag'] == 'todo'
+    # The tables and their resources, the existing reviews, then inserting the missing reviews
+    # (which may be batched into several statements) and committing
+    assert len(statements) <= 10, statements[:20]
+    assert DataReview.query.filter_by(publication_recid=recid, version=1).count() == 1000
+
+    # Once the reviews exist, no statements depend on the number of tables
+    statements.clear()
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        data_table_metadata, first_data_id = process_tables()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert data_table_metadata[first_data_id]['messages'] is False
+    assert len(statements) <= 3, statements
+
+
+def test_lttb_indices():
+    xs = list(range(100))
+    ys = [(x % 10) * (-1) ** x for x in xs]
+
+    assert lttb_indices(xs, ys, 200) == xs
+    indices = lttb_indices(xs, ys, 10)
+    assert len(indices) == 10
+    assert indices[0] == 0 and indices[-1] == 99
+    assert indices == sorted(set(indices))
+
+
+def test_decimate_table_data(app):
+    rows = 1000
+    y_values = [str(i % 7) for i in range(rows)]
+    y_values[500] = '100'
+    y_values[600] = '-100'
+    data = {
+        'independent_variables': [{'header': {'name': 'x'},
+                                   'values': [{'low': str(i), 'high': str(i + 1)} for i in range(rows)]}],
+        'dependent_variables': [{'header': {'name': 'y'}, 'values': [{'value': y} for y in y_values]}]
+    }
+    full_data = generate_table_data(copy.deepcopy(data))
+
+    table_data = decimate_table_data(generate_table_data(data), 50)
+    assert table_data['decimated']
+    assert table_data['total_rows'] == rows
+    assert table_data['max_points'] == 50
+    assert len(table_data['values']) <= 50
+    assert len(table_data['row_indices']) == len(table_data['values'])
+    # first, last, minimum and maximum points are kept
+    for index in [0, 500, 600, rows - 1]:
+        assert index in table_data['row_indices']
+    for index, row in zip(table_data['row_indices'], table_data['values']):
+        assert row == full_data['values'][index]
+
+    # Small tables are returned in full
+    table_data = decimate_table_data(generate_table_data(copy.deepcopy(data)), rows)
+    assert not table_data['decimated']
+    assert table_data['values'] == full_data['values']
+
+    # Several dependent variables share max_points, and rows are bucketed in x order
+    data['independent_variables'][0]['values'].reverse()
+    data['dependent_variables'] = [
+        {'header': {'name': 'y{0}'.format(i)}, 'values': [{'value': str((j * (i + 2)) % 11)} for j in range(rows)]}
+        for i in range(4)
+    ]
+    data['dependent_variables'][0]['values'][300] = {'value': '100'}
+    table_data = decimate_table_data(generate_table_data(copy.deepcopy(data)), 50)
+    assert table_data['decimated']
+    assert len(table_data['values']) <= 50
+    for index in [0, 300, rows - 1]:
+        assert index in table_data['row_indices']
+
+    # Too many dependent variables to keep the extremes of each: a combined series is decimated
+    data['dependent_variables'] = [
+        {'header': {'name': 'y{0}'.format(i)}, 'values': [{'value': str((j * (i + 2)) % 11)} for j in range(rows)]}
+        for i in range(20)
+    ]
+    table_data = decimate_table_data(generate_table_data(copy.deepcopy(data)), 50)
+    assert table_data['decimated']
+    assert 0 < len(table_data['values']) <= 50
+    for index in [0, rows - 1]:
+        assert index in table_data['row_indices']
+
+
+def test_get_table_data_max_points(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submission = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid, name='Table 3').first()
+    url = f'/record/data/tabledata/{data_submission.id}/1'
+
+    response = client.get(url + '?max_points=5')
+    assert response.status_code == 200
+    assert not response.json['decimated']
+    assert response.json['total_rows'] == len(response.json['values'])
+
+    # Tables returned in full are not cached again
+    with patch('hepdata.modules.records.utils.decimation.generate_table_data',
+               wraps=generate_table_data) as mock_generate:
+        assert client.get(url + '?max_points=5').json == response.json
+        mock_generate.assert_called_once()
+
+    # Decimated tables are cached for max_points rounded down to a fixed value
+    def decimate_all(table_data, max_points):
+        table_data = decimate_table_data(table_data, max_points)
+        table_data['decimated'] = True
+        return table_data
+
+    with patch('hepdata.modules.records.utils.decimation.decimate_table_data', side_effect=decimate_all):
+        response = client.get(url + '?max_points=30')
+    assert response.json['max_points'] == 25
+    with patch('hepdata.modules.records.utils.decimation.generate_table_data') as mock_generate:
+        cached_response = client.get(url + '?max_points=49')
+        mock_generate.assert_not_called()
+    assert cached_response.json == response.json
+
+    # Large values are limited to TABLE_DECIMATION_MAX_POINTS
+    assert client.get(url + '?max_points=1000000').json['max_points'] == app.config['TABLE_DECIMATION_MAX_POINTS']
+
+    assert client.get(url + '?max_points=2').status_code == 400
+    assert client.get(url + '?max_points=5&offset=1').status_code == 400
+
+
+def test_compute_table_stats(app):
+    table_contents = {
+        'independent_variables': [
+            {'header': {'name': 'PT', 'units': 'GEV'},
+             'values': [{'low': '10', 'high': '20'}, {'low': '20', 'high': '30'}, {'low': '30', 'high': '50'}]},
+            {'header': {'name': 'YRAP'},
+             'values': [{'value': '0.5'}, {'value': 'inf'}, {'value': '-1.5'}]}
+        ],
+        'dependent_variables': [
+            {'header': {'name': 'SIG', 'units': 'PB'},
+             'values': [{'value': '1.5'}, {'value': 'nan'}, {'value': '-'}, {'value': '7'}]}
+        ]
+    }
+
+    stats = compute_table_stats(table_contents)
+    assert stats['row_count'] == 3
+    assert stats['independent_variables'] == [
+        {'name': 'PT', 'units': 'GEV', 'min': 10.0, 'max': 50.0, 'nan_count': 0, 'inf_count': 0,
+         'contiguous': True, 'binned': True},
+        {'name': 'YRAP', 'units': None, 'min': -1.5, 'max': 0.5, 'nan_count': 0, 'inf_count': 1,
+         'contiguous': None, 'binned': False}
+    ]
+    assert stats['dependent_variables'] == [
+        {'name': 'SIG', 'units': 'PB', 'min': 1.5, 'max': 7.0, 'nan_count': 1, 'inf_count': 0}
+    ]
+
+    # A gap between bins
+    table_contents['independent_variables'][0]['values'][2]['low'] = '35'
+    assert not compute_table_stats(table_contents)['independent_variables'][0]['contiguous']
+
+
+def test_get_table_stats(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    data_submission = DataSubmission.query.filter_by(
+        publication_recid=test_submission.publication_recid, name='Table 3').first()
+    url = f'/record/data/{data_submission.id}/1/stats'
+
+    expected = compute_table_stats(load_table_data(data_submission.id, data_submission.version))
+    assert expected['row_count'] == 4
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json == expected
+
+    # The statistics are written at finalisation and served from disk
+    stats_path = get_table_stats_path(test_submission.publication_recid, data_submission.data_file)
+    assert not os.path.exists(stats_path)
+    # Indexing only uses the written statistics
+    doc = {'recid': data_submission.associated_recid}
+    add_data_stats(doc)
+    assert 'table_stats' not in doc
+
+    generate_rendered_tables(test_submission.publication_recid, 1)
+    assert os.path.isfile(stats_path)
+    add_data_stats(doc)
+    assert doc['table_stats'] == expected
+    with patch('hepdata.modules.records.utils.table_stats.compute_table_stats') as mock_compute:
+        assert client.get(url).json == expected
+        mock_compute.assert_not_called()
+
+    assert client.get(f'/record/data/{data_submission.id}/2/stats').json == {}
+
+
+def test_conditional_get(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    recid = test_submission.publication_recid
+    data_submission = DataSubmission.query.filter_by(publication_recid=recid, name='Table 3').first()
+    max_age = app.config['HTTP_CACHE_FINISHED_MAX_AGE']
+
+    for url in [f'/record/data/tabledata/{data_submission.id}/1',
+                f'/record/data/{recid}/{data_submission.id}/1/1',
+                f'/record/{recid}?format=json&version=1']:
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert response.cache_control.public
+        assert response.cache_control.max_age == max_age
+
+        # A matching ETag gets an empty 304 response with the same headers
+        not_modified = client.get(url, headers={'If-None-Match': etag})
+        assert not_modified.status_code == 304
+        assert not_modified.data == b''
+        assert not_modified.headers['ETag'] == etag
+        assert not_modified.cache_control.max_age == max_age
+
+        assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+    # The review of a table is created even if the client's copy is still valid
+    url = f'/record/data/{recid}/{data_submission.id}/1/1'
+    etag = client.get(url).headers['ETag']
+    DataReview.query.filter_by(data_recid=data_submission.id, version=1).delete()
+    db.session.commit()
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert DataReview.query.filter_by(data_recid=data_submission.id, version=1).count() == 1
+
+    # Without an explicit version, the response must be revalidated
+    response = client.get(f'/record/{recid}?format=json')
+    assert response.cache_control.no_cache
+    assert response.cache_control.max_age is None
+
+    # Tables of unfinished versions have an ETag but are not cached
+    test_submission.overall_status = 'todo'
+    db.session.add(test_submission)
+    db.session.commit()
+    response = client.get(f'/record/data/tabledata/{data_submission.id}/1')
+    assert response.headers['ETag']
+    assert response.cache_control.no_cache
+
+
+def test_record_page_cache(app, client):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    test_submission = create_test_record(os.path.join(base_dir, 'test_data', 'test_submission'))
+    recid = test_submission.publication_recid
+    url = f'/record/{recid}?format=json&version=1'
+    invalidate_record_contexts([recid])
+
+    response = client.get(url)
+    assert response.status_code == 200
+    expected = response.json
+
+    # The second request uses the cached context, with the user's parts overlaid
+    with patch('hepdata.modules.records.api.format_submission') as mock_format:
+        response = client.get(url)
+        mock_format.assert_not_called()
+    assert response.status_code == 200
+    cached = response.json
+    assert cached['access_count']['sum'] == expected['access_count']['sum'] + 1
+    expected.pop('access_count')
+    cached.pop('access_count')
+    assert cached == expected
+
+    # The HTML page can be rendered from the cached context, which keeps its dates
+    stamp = get_submission_stamp(get_latest_hepsubmission(publication_recid=recid, version=1))
+    assert isinstance(get_cached_record_context(recid, 1, stamp)['record']['last_updated'], datetime.datetime)
+    with patch('hepdata.modules.records.api.format_submission') as mock_format:
+        response = client.get(f'/record/{recid}?version=1')
+        mock_format.assert_not_called()
+    assert response.status_code == 200
+
+    # Selecting a table by name only affects that request
+    with app.test_request_context(f'/record/{recid}?table=Table 3'):
+        ctx = get_cached_record_context(recid, 1, stamp)
+        add_user_context(ctx, recid, 1)
+        assert ctx['table_name_to_show'] == 'Table 3'
+    with app.test_request_context(f'/record/{recid}'):
+        ctx = get_cached_record_context(recid, 1, stamp)
+        add_user_context(ctx, recid, 1)
+        assert ctx['table_name_to_show'] == expected['table_name_to_show']
+
+    # Entries which cannot be decoded are a miss
+    redis_client = get_redis_client('RECORD_PAGE_CACHE_REDIS_URL')
+    redis_client.hset(f"{app.config.get('CACHE_KEY_PREFIX', '')}record_page::{recid}", '1', b'\x80not json')
+    assert get_cached_record_context(recid, 1, stamp) is None
+
+    invalidate_record_contexts([recid])
+    with patch('hepdata.modules.records.api.format_submission', wraps=format_submission) as mock_format:
+        client.get(url)
+        mock_format.assert_called_once()
+
+
 def test_upload_valid_file(app):
     # Test uploading and processing a file for a record
     with app.app_context():
@@ -33,7 +33,7 @@ from hepdata.ext.opensearch.document_enhancers import add_data_keywords, process
 from hepdata.modules.records.utils.submission import process_submission_directory
 from hepdata.utils.miscellaneous import get_resource_data
 from hepdata.ext.opensearch.process_results import merge_results, match_tables_to_papers, \
-    get_basic_record_information, is_datatable
+    get_basic_record_information, is_datatable, fetch_remaining_papers
 from hepdata.ext.opensearch.query_builder import QueryBuilder, HEPDataQueryParser
 from hepdata.ext.opensearch.utils import flip_sort_order, parse_and_format_date, prepare_author_for_indexing, \
     calculate_sort_order, push_keywords
@@ -43,7 +43,8 @@ from invenio_search import current_search_client as os
 
 from hepdata.modules.search.config import LIMIT_MAX_RESULTS_PER_PAGE, \
     HEPDATA_CFG_DEFAULT_RESULTS_PER_PAGE
-from hepdata.modules.search.views import check_max_results, search as search_view
+from hepdata.modules.search.views import check_max_results, decode_cursor, encode_cursor, \
+    search as search_view
 from hepdata.ext.opensearch.config.os_config import TERMS_SIZE
 
 def test_query_builder_add_aggregations():
@@ -405,6 +406,135 @@ def test_search(app, load_default_data, identifiers):
     assert results == {'error': 'An unexpected error occurred: index_not_found_exception'}
 
 
+def test_search_cache(app, load_default_data, identifiers, mocker):
+    index = app.config.get('OPENSEARCH_INDEX')
+    results = os_api.search('', index=index)
+    assert results['total'] == len(identifiers)
+
+    # Repeated searches, including with extra whitespace, are answered from the cache
+    search_class = mocker.patch('hepdata.ext.opensearch.api.RecordsSearch', wraps=os_api.RecordsSearch)
+    assert os_api.search('', index=index) == results
+    os_api.search('higgs  boson', index=index)
+    search_class.reset_mock()
+    os_api.search(' higgs boson ', index=index)
+    search_class.assert_not_called()
+
+    # Changes to the index invalidate the cache
+    os_api.push_data_keywords(pub_ids=[1], index=index)
+    assert os_api.search('', index=index)['total'] == len(identifiers)
+    search_class.assert_called()
+
+    # Errors are not cached
+    search_class.reset_mock()
+    assert 'error' in os_api.search('', index=index, sort_field='notafield')
+    assert 'error' in os_api.search('', index=index, sort_field='notafield')
+    assert search_class.call_count == 2
+
+
+def test_search_global_facets(app, load_default_data, identifiers, mocker):
+    index = app.config.get('OPENSEARCH_INDEX')
+    app.config['SEARCH_CACHE_ENABLED'] = False
+    expected = os_api.search('', index=index)
+    assert expected['facets']
+
+    # The facets of the unfiltered search are stored and reused
+    add_aggregations = mocker.patch('hepdata.ext.opensearch.api.add_default_aggregations',
+                                    wraps=os_api.add_default_aggregations)
+    assert os_api.search('', index=index) == expected
+    assert os_api.search('', index=index, sort_field='title')['facets'] == expected['facets']
+    add_aggregations.assert_not_called()
+
+    os_api.search('', index=index, filters=[('collaboration', 'ATLAS')])
+    os_api.search('leptons', index=index)
+    assert add_aggregations.call_count == 2
+
+    # Facets can be skipped altogether
+    add_aggregations.reset_mock()
+    results = os_api.search('leptons', index=index, offset=1, facets=False)
+    assert results['facets'] == []
+    assert results['total'] > 0
+    add_aggregations.assert_not_called()
+
+    # Changes to the index make the stored facets out of date, until they are recomputed
+    os_api.push_data_keywords(pub_ids=[1], index=index)
+    os_api.update_global_facets(index=index)
+    assert add_aggregations.call_count == 1
+    assert os_api.search('', index=index)['facets'] == expected['facets']
+    assert add_aggregations.call_count == 1
+
+    os_api.push_data_keywords(pub_ids=[1], index=index)
+    assert os_api.search('', index=index)['facets'] == expected['facets']
+    assert add_aggregations.call_count == 2
+
+
+def test_search_tables_inner_hits(app, load_default_data, identifiers, mocker):
+    index = app.config.get('OPENSEARCH_INDEX')
+
+    def summarise(results):
+        return results['total'], [(r['recid'], sorted(t['recid'] for t in r['data']))
+                                  for r in results['results']]
+
+    for query in ['', 'leptons', 'observables:ASYM', 'recid:[0 TO 100]']:
+        app.config['SEARCH_TABLES_INNER_HITS'] = False
+        expected = os_api.search(query, index=index)
+
+        app.config['SEARCH_TABLES_INNER_HITS'] = True
+        search_class = mocker.patch('hepdata.ext.opensearch.api.RecordsSearch', wraps=os_api.RecordsSearch)
+        results = os_api.search(query, index=index)
+        # Only the publication search is made
+        assert search_class.call_count == 1
+        mocker.stopall()
+
+        assert summarise(results) == summarise(expected), query
+        assert results['facets'] == expected['facets']
+
+
+def test_search_cursor(app, load_default_data, identifiers):
+    index = app.config.get('OPENSEARCH_INDEX')
+
+    for sort_field in ['', 'recid', 'title']:
+        expected = os_api.search('', index=index, sort_field=sort_field)
+        assert 'cursor' not in expected
+
+        # Page through one publication at a time
+        recids = []
+        cursor = {}
+        while cursor is not None:
+            results = os_api.search('', index=index, size=1, sort_field=sort_field, cursor=cursor)
+            assert results['total'] == len(identifiers)
+            recids.extend(r['recid'] for r in results['results'])
+            cursor = results['cursor']
+            if cursor is not None:
+                assert cursor['pit'] and cursor['after']
+
+        assert recids == [r['recid'] for r in expected['results']]
+
+
+def test_suggest_authors(app, load_default_data):
+    results = os_api.suggest_authors('Bal')
+    names = [r['full_name'] for r in results]
+    assert 'Bala, A.' in names
+    assert 'Balz, Johannes' in names
+    assert all(name.lower().startswith('bal') or name.split(', ')[-1].lower().startswith('bal')
+               for name in names)
+    assert all(set(r.keys()) <= {'full_name', 'affiliation'} for r in results)
+
+    # First names are suggested too
+    assert 'Balz, Johannes' in [r['full_name'] for r in os_api.suggest_authors('johan')]
+
+    assert len(os_api.suggest_authors('a', size=2)) == 2
+    assert os_api.suggest_authors(' ') == []
+
+    with app.test_client() as client:
+        response = client.get('/search/authors/suggest?q=bal&size=100')
+        data = response.get_json()
+        assert [r['full_name'] for r in data['results']] == names
+        assert data['debounce_ms'] == app.config['AUTHOR_SUGGEST_DEBOUNCE_MS']
+
+        response = client.get('/search/authors/suggest?q=a&size=1')
+        assert len(response.get_json()['results']) == 1
+
+
 def test_search_range_ids(app, load_default_data, identifiers):
     """
     Tests range-based searching where ID-like entries are used
@@ -889,6 +1019,19 @@ def test_prepare_authors_for_indexing(app):
 
         assert (len(bulk_doc) == 4)
 
+        test_document = {
+            "authors": [
+                {"full_name": "Balz, Johannes", "affiliation": "Mainz U."}
+            ]
+        }
+
+        bulk_doc = prepare_author_for_indexing(test_document)
+
+        assert bulk_doc[1] == {"full_name": "Balz, Johannes", "affiliation": "Mainz U.",
+                               "name_suggest": {"input": ["Balz, Johannes", "Johannes Balz"]}}
+        # The publication document is unchanged
+        assert test_document["authors"][0] == {"full_name": "Balz, Johannes", "affiliation": "Mainz U."}
+
 
 def test_match_tables_to_papers():
     papers = [
@@ -921,6 +1064,38 @@ def test_match_tables_to_papers():
     assert (len(aggregated) == 2)
 
 
+def test_fetch_remaining_papers(mocker):
+    papers = [{"_id": "1", "_source": {"recid": 1}}]
+    tables = [
+        {"_source": {"related_publication": 1}},
+        {"_source": {"related_publication": 16}},
+        {"_source": {"related_publication": 5}},
+        {"_source": {"related_publication": 16}},
+        {"_source": {"related_publication": 99}}
+    ]
+    mock_get = mocker.patch('hepdata.ext.opensearch.api.get_publication_records',
+                            return_value={16: {"recid": 16}, 5: {"recid": 5}})
+
+    fetch_remaining_papers(tables, papers)
+
+    # All missing papers are fetched together, and ones not found are skipped
+    mock_get.assert_called_once_with([16, 5, 99])
+    assert papers == [
+        {"_id": "1", "_source": {"recid": 1}},
+        {"_id": "16", "_source": {"recid": 16}},
+        {"_id": "5", "_source": {"recid": 5}}
+    ]
+
+    aggregated = match_tables_to_papers(tables, papers)
+    assert [(paper["_id"], len(paper_tables)) for paper, paper_tables in aggregated] == \
+        [("1", 1), ("16", 2), ("5", 1)]
+
+    # No request is made if all papers are present
+    mock_get.reset_mock()
+    fetch_remaining_papers(tables[:1], papers)
+    mock_get.assert_not_called()
+
+
 def test_get_basic_record_information():
     test_record = {
         "_source": {
@@ -1066,6 +1241,16 @@ def test_reindex_batch(app, load_default_data, mocker):
     mock_push_data_keywords.assert_called_once_with(pub_ids=[16])
 
 
+def test_index_record_ids_loads_submissions_in_bulk(app, load_default_data, mocker):
+    index = app.config.get('OPENSEARCH_INDEX')
+    mock_get_latest = mocker.patch('hepdata.ext.opensearch.document_enhancers.get_latest_hepsubmission')
+
+    # The publication enhancers use the submissions loaded for the whole batch
+    result = os_api.index_record_ids([1, 16], index=index)
+    assert sorted(result['publication']) == [1, 16]
+    mock_get_latest.assert_not_called()
+
+
 def test_reindex_batch_large_submission(app, mocker):
     """Test that reindex_batch properly batches large numbers of records"""
     index = app.config.get('OPENSEARCH_INDEX')
@@ -1145,6 +1330,31 @@ def test_update_record_mapping(app, mocker):
     assert msg.endswith("You may need to recreate the index to update the mapping.")
 
 
+def test_update_author_mapping(app):
+    index_name = 'mock_author_index'
+    index = Index(using=os, name=index_name)
+    index.delete(ignore=404)
+    index.create()
+
+    os_api.update_author_mapping(author_index=index_name)
+
+    mapping = index.get_mapping(using=os)
+    properties = mapping[index_name]['mappings']['properties']
+    assert properties['name_suggest']['type'] == 'completion'
+    assert properties['full_name']['fields']['raw']['type'] == 'keyword'
+
+    # An existing field of a different type cannot be changed
+    index.delete(ignore=404)
+    index.create()
+    index.put_mapping(using=os, body={"properties": {"name_suggest": {"type": "keyword"}}})
+
+    with pytest.raises(ValueError) as excinfo:
+        os_api.update_author_mapping(author_index=index_name)
+
+    assert str(excinfo.value).startswith("Unable to update author mapping: ")
+    index.delete(ignore=404)
+
+
 def test_get_record(app, load_default_data, identifiers):
     record = os_api.get_record(1)
     for key in ["inspire_id", "title"]:
@@ -1153,6 +1363,15 @@ def test_get_record(app, load_default_data, identifiers):
     assert(os_api.get_record(9999999) is None)
 
 
+def test_get_publication_records(app, load_default_data, identifiers):
+    records = os_api.get_publication_records([1, 16, 9999999])
+    assert set(records.keys()) == {1, 16}
+    assert records[1]['title'] == identifiers[0]['title']
+    assert records[1] == os_api.get_record(1)
+
+    assert os_api.get_publication_records([]) == {}
+
+
 def test_get_all_ids(app, load_default_data, identifiers):
     expected_record_ids = [1, 16, 57]
     # Pre-sorted based on the last_updated (today, 2016-07-13 and 2013-12-17)
@@ -1183,6 +1402,32 @@ def test_get_all_ids(app, load_default_data, identifiers):
     assert(os_api.get_all_ids(latest_first=True) == sorted_expected_record_ids)
 
 
+def test_all_ids_view(app, load_default_data, identifiers):
+    expected_record_ids = [1, 16, 57]
+
+    with app.test_client() as client:
+        for use_es in ['false', 'true']:
+            response = client.get('/search/ids?use_es=' + use_es)
+            assert response.status_code == 200
+            assert response.is_streamed
+            assert response.mimetype == 'application/json'
+            assert response.get_json() == expected_record_ids
+
+            response = client.get('/search/ids?format=ndjson&sort_by=latest&use_es=' + use_es)
+            assert response.mimetype == 'application/x-ndjson'
+            assert response.get_data(as_text=True) == '57\n1\n16\n'
+
+            response = client.get('/search/ids?last_updated=2120-01-01&use_es=' + use_es)
+            assert response.get_json() == []
+
+            response = client.get('/search/ids?inspire_ids=true&use_es=' + use_es,
+                                  headers={'Accept': 'application/x-ndjson'})
+            assert response.get_data(as_text=True).split() == [x["inspire_id"] for x in identifiers]
+
+        response = client.get('/search/ids?last_updated=notadate')
+        assert response.status_code == 400
+
+
 @pytest.mark.parametrize("input_size, output_size",
     [
         (None, HEPDATA_CFG_DEFAULT_RESULTS_PER_PAGE),
@@ -1243,6 +1488,50 @@ def test_search_json_error_response_without_total(app, mocker):
     assert response.get_json() == {'error': 'failed query'}
 
 
+def test_search_json_cursor(app, mocker):
+    os_search = mocker.patch('hepdata.modules.search.views.os_search', return_value={
+        'total': 42,
+        'results': [],
+        'facets': [],
+        'cursor': {'pit': 'abc', 'after': ['2024-01-01', 1]},
+    })
+
+    with app.test_request_context('/search/?format=json&cursor='):
+        response = search_view()
+
+    data = response.get_json()
+    assert os_search.call_args.kwargs['cursor'] == {}
+    assert os_search.call_args.kwargs['facets']
+    assert 'cursor' not in data
+    assert decode_cursor(data['next_cursor']) == {'pit': 'abc', 'after': ['2024-01-01', 1]}
+
+    with app.test_request_context('/search/?format=json&cursor=' + data['next_cursor']):
+        search_view()
+
+    assert os_search.call_args.kwargs['cursor'] == {'pit': 'abc', 'after': ['2024-01-01', 1]}
+    assert os_search.call_args.kwargs['facets']
+
+    # Clients can skip computing the facets
+    with app.test_request_context('/search/?format=json&facets=false&cursor=' + data['next_cursor']):
+        search_view()
+
+    assert not os_search.call_args.kwargs['facets']
+
+    # Without a cursor, offset pagination is used
+    with app.test_request_context('/search/?format=json'):
+        data = search_view().get_json()
+
+    assert os_search.call_args.kwargs['cursor'] is None
+    assert 'next_cursor' not in data
+
+    for token in ['notacursor', encode_cursor({'pit': 'abc'})]:
+        with app.test_request_context('/search/?format=json&cursor=' + token):
+            response, status = search_view()
+
+        assert status == 400
+        assert response.get_json() == {'error': 'Invalid cursor'}
+
+
 def test_get_resource_data(app):
     """
         Tests the get_resource_data document_enhancers function.
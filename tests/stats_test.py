@@ -1,4 +1,12 @@
-from hepdata.modules.stats.views import increment, get_count
+from datetime import date, datetime
+from unittest.mock import patch
+
+from invenio_db import db
+from sqlalchemy.exc import SQLAlchemyError
+
+from hepdata.modules.stats.models import AccessStatisticTotal, DailyAccessStatistic
+from hepdata.modules.stats.views import increment, get_count, flush_access_statistics, rollup_access_statistics, \
+    rebuild_access_totals
 
 
 def test_stats(app):
@@ -10,3 +18,131 @@ def test_stats(app):
 
     # in case of failure, this always returns 1
     assert (get_count(1999)['sum'] == 1)
+
+
+def test_flush_access_statistics(app):
+    increment(2)
+    increment(2)
+    increment(3)
+    # Accesses are buffered rather than written to the database
+    assert DailyAccessStatistic.query.count() == 0
+    assert get_count(2)['sum'] == 2
+
+    flush_access_statistics()
+    assert get_count(2)['sum'] == 2
+    assert get_count(3)['sum'] == 1
+    stats = DailyAccessStatistic.query.filter_by(publication_recid=2).one()
+    assert stats.count == 2
+
+    # Later accesses on the same day update the same row
+    increment(2)
+    assert get_count(2)['sum'] == 3
+    flush_access_statistics()
+    assert DailyAccessStatistic.query.filter_by(publication_recid=2).one().count == 3
+
+    # If the database write fails, the counts are kept for the next flush
+    increment(3)
+    with patch('hepdata.modules.stats.views.write_access_counts', return_value=False):
+        flush_access_statistics()
+    increment(3)
+    assert get_count(3)['sum'] == 3
+    flush_access_statistics()
+    assert DailyAccessStatistic.query.filter_by(publication_recid=3).one().count == 2
+    flush_access_statistics()
+    assert DailyAccessStatistic.query.filter_by(publication_recid=3).one().count == 3
+    assert get_count(3)['sum'] == 3
+
+    # If the commit fails once the buffer is cleared, the counts are lost rather than written twice
+    increment(3)
+    with patch.object(db.session, 'commit', side_effect=SQLAlchemyError('commit failed')):
+        flush_access_statistics()
+    flush_access_statistics()
+    assert DailyAccessStatistic.query.filter_by(publication_recid=3).one().count == 3
+    assert get_count(3)['sum'] == 3
+
+
+def test_increment_without_buffer(app):
+    app.config['ACCESS_STATS_REDIS_URL'] = None
+    increment(4)
+    increment(4)
+    assert DailyAccessStatistic.query.filter_by(publication_recid=4).one().count == 2
+    assert get_count(4)['sum'] == 2
+
+
+def test_access_totals(app):
+    # Records accessed before the totals were introduced
+    db.session.add_all([DailyAccessStatistic(publication_recid=5, day=date(2020, 1, 1), count=10),
+                        DailyAccessStatistic(publication_recid=5, day=date(2020, 1, 2), count=5)])
+    db.session.commit()
+    assert get_count(5)['sum'] == 15
+
+    increment(5)
+    flush_access_statistics()
+    assert db.session.get(AccessStatisticTotal, 5).count == 16
+
+    # The count is read from the total rather than summing the daily rows
+    DailyAccessStatistic.query.filter_by(publication_recid=5, day=date(2020, 1, 1)).delete()
+    db.session.commit()
+    assert get_count(5)['sum'] == 16
+
+    increment(5)
+    flush_access_statistics()
+    assert db.session.get(AccessStatisticTotal, 5).count == 17
+
+
+def test_rollup_access_statistics(app):
+    db.session.add_all([DailyAccessStatistic(publication_recid=6, day=date(2020, 1, 5), count=2),
+                        DailyAccessStatistic(publication_recid=6, day=date(2020, 1, 20), count=3),
+                        DailyAccessStatistic(publication_recid=6, day=date(2020, 2, 10), count=4),
+                        DailyAccessStatistic(publication_recid=7, day=date(2020, 1, 7), count=1),
+                        DailyAccessStatistic(publication_recid=6, day=date(2020, 3, 2), count=6)])
+    db.session.commit()
+
+    # Disabled by default
+    assert rollup_access_statistics() == 0
+
+    with patch('hepdata.modules.stats.views.get_date', return_value=datetime(2020, 4, 15)):
+        assert rollup_access_statistics(months=1) == 4
+
+    rows = DailyAccessStatistic.query.order_by(DailyAccessStatistic.publication_recid,
+                                               DailyAccessStatistic.day).all()
+    assert [(row.publication_recid, row.day, row.count) for row in rows] == [
+        (6, date(2020, 1, 1), 5),
+        (6, date(2020, 2, 1), 4),
+        (6, date(2020, 3, 2), 6),
+        (7, date(2020, 1, 1), 1)
+    ]
+    assert get_count(6)['sum'] == 15
+
+    # Monthly rows are not rolled up again, while later daily rows are added to them
+    db.session.add_all([DailyAccessStatistic(publication_recid=6, day=date(2020, 3, 1), count=1),
+                        DailyAccessStatistic(publication_recid=7, day=date(2020, 3, 9), count=2)])
+    db.session.commit()
+    with patch('hepdata.modules.stats.views.get_date', return_value=datetime(2020, 4, 30)):
+        assert rollup_access_statistics(months=1) == 0
+    with patch('hepdata.modules.stats.views.get_date', return_value=datetime(2020, 5, 2)):
+        assert rollup_access_statistics(months=1) == 2
+
+    rows = DailyAccessStatistic.query.order_by(DailyAccessStatistic.publication_recid,
+                                               DailyAccessStatistic.day).all()
+    assert [(row.publication_recid, row.day, row.count) for row in rows] == [
+        (6, date(2020, 1, 1), 5),
+        (6, date(2020, 2, 1), 4),
+        (6, date(2020, 3, 1), 7),
+        (7, date(2020, 1, 1), 1),
+        (7, date(2020, 3, 1), 2)
+    ]
+
+
+def test_rebuild_access_totals(app):
+    db.session.add_all([DailyAccessStatistic(publication_recid=8, day=date(2020, 1, 1), count=3),
+                        DailyAccessStatistic(publication_recid=8, day=date(2020, 1, 2), count=1),
+                        DailyAccessStatistic(publication_recid=9, day=date(2020, 1, 1), count=2),
+                        AccessStatisticTotal(publication_recid=9, count=5)])
+    db.session.commit()
+
+    # Only missing totals are created
+    assert rebuild_access_totals() == 1
+    assert db.session.get(AccessStatisticTotal, 8).count == 4
+    assert db.session.get(AccessStatisticTotal, 9).count == 5
+    assert rebuild_access_totals() == 0
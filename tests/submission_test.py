@@ -55,10 +55,11 @@ from hepdata.modules.records.utils.common import infer_file_type, contains_accep
 from hepdata.modules.records.utils.data_files import get_data_path_for_record
 from hepdata.modules.records.utils.submission import process_submission_directory, do_finalise, unload_submission, \
     cleanup_data_related_recid, get_or_create_hepsubmission
-from hepdata.modules.submission.api import get_latest_hepsubmission, get_submission_participants_for_record, \
-    get_or_create_submission_observer, delete_submission_observer
+from hepdata.modules.submission.api import get_latest_hepsubmission, get_latest_hepsubmissions, \
+    get_submission_participants_for_record, get_or_create_submission_observer, delete_submission_observer, \
+    get_version_counts, get_version_summary, rebuild_version_summaries
 from hepdata.modules.submission.models import DataSubmission, HEPSubmission, RelatedRecid, RecordVersionCommitMessage, \
-    SubmissionObserver
+    SubmissionObserver, PublicationVersionSummary
 from hepdata.modules.submission.views import process_submission_payload
 from hepdata.config import HEPDATA_DOI_PREFIX
 from tests.conftest import create_test_record, create_blank_test_record
@@ -415,6 +416,10 @@ def test_related_records(app, admin_idx):
                 assert related_record_data == expected_record_data
                 assert related_to_this_record_data == expected_record_data
 
+                # Related records which cannot be found are left out
+                with patch('hepdata.modules.records.api.get_publication_records_contents', return_value={}):
+                    assert get_record_data_list(submission, "related") == []
+
             for related_table in submission.related_recids:
                 # Get all other RelatedTable entries related to this one
                 # and check against the expected value in `data`
@@ -918,10 +923,11 @@ def test_do_finalise_general_exception(app, admin_idx):
 
 def test_do_finalise_async_indexing(app, admin_idx, mocker):
     """
-    Tests that do_finalise uses asynchronous indexing via reindex_batch.delay
+    Tests that do_finalise uses asynchronous indexing via reindex_batch.delay,
+    queued once the tables have been rendered
     """
     # Mock the reindex_batch.delay function
-    mock_reindex_batch_delay = mocker.patch('hepdata.modules.records.utils.submission.reindex_batch.delay')
+    mock_reindex_batch_delay = mocker.patch('hepdata.ext.opensearch.api.reindex_batch.delay')
 
     with app.app_context():
         admin_idx.recreate_index()
@@ -952,6 +958,113 @@ def test_do_finalise_async_indexing(app, admin_idx, mocker):
         )
 
 
+def test_get_latest_hepsubmission(app):
+    recid = random.randint(50001, 90000)
+    for version, status in [(1, 'finished'), (3, 'todo'), (2, 'finished')]:
+        db.session.add(HEPSubmission(publication_recid=recid, inspire_id=str(recid), version=version,
+                                     overall_status=status))
+    db.session.commit()
+
+    # Nothing is cached outside a request
+    assert get_latest_hepsubmission(publication_recid=recid).version == 3
+    with patch.object(HEPSubmission, 'query') as mock_query:
+        get_latest_hepsubmission(publication_recid=recid)
+        mock_query.filter_by.assert_called()
+
+    with app.test_request_context():
+        assert get_latest_hepsubmission(publication_recid=recid).version == 3
+        assert get_latest_hepsubmission(publication_recid=recid, overall_status='finished').version == 2
+        assert get_latest_hepsubmission(publication_recid=recid, version=1).version == 1
+        assert get_latest_hepsubmission(publication_recid=recid + 1) is None
+
+        # Repeated calls are answered from the cache...
+        with patch.object(HEPSubmission, 'query') as mock_query:
+            assert get_latest_hepsubmission(publication_recid=recid).version == 3
+            mock_query.filter_by.assert_not_called()
+
+        # ...until a submission changes
+        submission = get_latest_hepsubmission(publication_recid=recid)
+        submission.overall_status = 'finished'
+        assert get_latest_hepsubmission(publication_recid=recid, overall_status='finished').version == 3
+        db.session.add(HEPSubmission(publication_recid=recid, version=4, overall_status='todo'))
+        db.session.commit()
+        assert get_latest_hepsubmission(publication_recid=recid).version == 4
+
+        latest = get_latest_hepsubmissions(publication_recids=[recid, recid + 1], overall_status='finished')
+        assert list(latest.keys()) == [recid]
+        assert latest[recid].version == 3
+        latest = get_latest_hepsubmissions(inspire_ids=[str(recid)])
+        assert latest[str(recid)].version == 3
+        assert get_latest_hepsubmissions(publication_recids=[]) == {}
+        with pytest.raises(ValueError):
+            get_latest_hepsubmissions()
+
+        # The bulk lookup also fills the cache
+        with patch.object(HEPSubmission, 'query') as mock_query:
+            assert get_latest_hepsubmission(publication_recid=recid + 1, overall_status='finished') is None
+            mock_query.filter_by.assert_not_called()
+
+
+def test_version_summary(app):
+    recid = random.randint(50001, 90000)
+    assert get_version_summary(recid) is None
+    assert get_version_counts(recid) == (0, 0, 0)
+
+    for version, status in [(1, 'finished'), (2, 'finished'), (3, 'todo')]:
+        db.session.add(HEPSubmission(publication_recid=recid, inspire_id=str(recid), version=version,
+                                     overall_status=status))
+    db.session.commit()
+
+    summary = get_version_summary(recid)
+    assert (summary.version_count, summary.finished_version_count, summary.sandbox_version_count) == (3, 2, 0)
+    assert get_version_counts(recid) == (3, 2, 0)
+
+    # Finalising the latest version updates the summary in the same transaction
+    submission = get_latest_hepsubmission(publication_recid=recid)
+    submission.overall_status = 'finished'
+    db.session.flush()
+    assert get_version_counts(recid) == (3, 3, 0)
+    db.session.rollback()
+    assert get_version_counts(recid) == (3, 2, 0)
+
+    db.session.delete(get_latest_hepsubmission(publication_recid=recid))
+    db.session.commit()
+    assert get_version_counts(recid) == (2, 2, 0)
+
+    sandbox_recid = recid + 1
+    db.session.add(HEPSubmission(publication_recid=sandbox_recid, version=1, overall_status='sandbox'))
+    db.session.commit()
+    assert get_version_counts(sandbox_recid) == (1, 0, 1)
+
+    for submission in HEPSubmission.query.filter_by(publication_recid=recid).all():
+        db.session.delete(submission)
+    db.session.commit()
+    assert get_version_summary(recid) is None
+
+    # Rebuilding gives the same summaries
+    db.session.delete(get_version_summary(sandbox_recid))
+    db.session.commit()
+    assert rebuild_version_summaries() >= 1
+    summary = get_version_summary(sandbox_recid)
+    assert (summary.version_count, summary.finished_version_count, summary.sandbox_version_count) == (1, 0, 1)
+
+    # A missing summary is calculated from the HEPSubmissions, and stored
+    db.session.delete(summary)
+    db.session.commit()
+    assert get_version_counts(sandbox_recid) == (1, 0, 1)
+    assert get_version_summary(sandbox_recid).sandbox_version_count == 1
+
+    # A summary stored by another transaction is overwritten rather than conflicting
+    db.session.delete(get_version_summary(sandbox_recid))
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(PublicationVersionSummary.__table__.insert().values(
+            publication_recid=sandbox_recid, version_count=1, finished_version_count=0, sandbox_version_count=1))
+    db.session.add(HEPSubmission(publication_recid=sandbox_recid, version=2, overall_status='sandbox'))
+    db.session.commit()
+    assert get_version_counts(sandbox_recid) == (2, 0, 2)
+
+
 def test_get_or_create_submission_observer(app):
     """
         Tests the get_or_create_submission_observer function against both
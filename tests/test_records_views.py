@@ -338,54 +338,44 @@ def test_get_table_details_version_zero_fallback(app, client):
     mock_datasub_record.location_in_publication = None
     mock_datasub_record.resources = []
 
-    mock_datasub_query = MagicMock()
-    mock_datasub_query.count.return_value = 1
-    mock_datasub_query.one.return_value = mock_datasub_record
-
     mock_data_record = MagicMock()
     mock_data_record.file_location = '/fake/path.json'
     mock_data_record.file_license = None
 
-    mock_data_query = MagicMock()
-    mock_data_query.count.return_value = 1
-    mock_data_query.one.return_value = mock_data_record
+    mock_review_record = MagicMock()
+    mock_review_record.status = 'todo'
 
     with patch('hepdata.modules.records.views.verify_observer_key', return_value=False), \
          patch('hepdata.modules.records.views.get_version_count', return_value=(2, 2)), \
-         patch('hepdata.modules.records.views.DataSubmission.query') as mock_ds_query, \
-         patch('hepdata.modules.records.views.db') as mock_db, \
+         patch('hepdata.modules.records.views.load_table_details',
+               return_value=(mock_datasub_record, mock_data_record, None, mock_review_record, False)) \
+            as mock_load_table_details, \
          patch('hepdata.modules.records.views.file_size_check', return_value={'status': True, 'size': 0}), \
-         patch('hepdata.modules.records.views.generate_license_data_by_id', return_value={}), \
          patch('hepdata.modules.records.views.get_table_data_list', return_value=[]), \
          patch('hepdata.modules.records.views.get_resource_data', return_value=[]), \
-         patch('hepdata.modules.records.views.create_data_review', return_value=None), \
          patch('hepdata.modules.records.views.generate_table_headers', return_value={}), \
          patch('hepdata.modules.records.views.generate_table_data', return_value={}), \
-         patch('hepdata.modules.records.views.load_table_data', return_value=None):
-
-        mock_ds_query.options.return_value.filter_by.return_value = mock_datasub_query
-        mock_db.session.query.return_value.filter.return_value = mock_data_query
+         patch('hepdata.modules.records.views.get_parsed_table', return_value=None):
 
         # version=0 triggers "if not version:" fallback → sets version to version_count (2)
         response = client.get(f'/record/data/{recid}/{data_recid}/0/')
         assert response.status_code == 200
+        mock_load_table_details.assert_called_once_with(recid, data_recid, 2)
 
 
 def test_get_table_details_missing_table_returns_empty_json(app, client):
     """Ensure missing table requests return an empty JSON response instead of failing."""
+    from hepdata.modules.submission.models import DataReview
+
+    review_count = DataReview.query.count()
     with patch('hepdata.modules.records.views.verify_observer_key', return_value=False), \
          patch('hepdata.modules.records.views.get_version_count', return_value=(1, 1)), \
-         patch('hepdata.modules.records.views.DataSubmission.query') as mock_ds_query, \
-         patch('hepdata.modules.records.views.create_data_review') as mock_create_data_review:
-
-        mock_datasub_query = MagicMock()
-        mock_datasub_query.count.return_value = 0
-        mock_ds_query.options.return_value.filter_by.return_value = mock_datasub_query
+         patch('hepdata.modules.records.views.load_table_details', return_value=None):
 
         response = client.get('/record/data/1/999999/1/')
         assert response.status_code == 200
         assert response.get_json() == {}
-        mock_create_data_review.assert_not_called()
+    assert DataReview.query.count() == review_count
 
 
 def test_get_resource_tar_file_binary_content(app, client):